@@ -2,7 +2,7 @@
 
 # --- ensure Python can see the sibling `engine/` package ---
 from pathlib import Path
-import sys, os, tempfile, json, time, math, random
+import sys, os, json, time, math, random, uuid
 ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
@@ -10,19 +10,35 @@ if str(ROOT) not in sys.path:
 import streamlit as st
 from streamlit_mic_recorder import mic_recorder
 
-from engine.model import ask_llm, ask_llm_json
+from engine.model import (ask_llm, ask_llm_json, ask_llm_stream, chat_stream, chat_json, conversation,
+                          end_conversation, INTERACTIVE, BACKGROUND)
 from engine.storage import DB
 from engine.adapt import pick_next_skill, update_progress
-from engine.curriculum import load_pack, merge_pack_into_db
-from engine.safety import check_user_input
-from engine.audio import tts_save_wav, stt_transcribe_wav
+from engine.curriculum import import_pack, seed_bundled
+from engine.prefetch import QuestionPrefetcher
+from engine.skillmap import skill_graph_dot
+from engine.safety import check_user_input, screen_stream
+from engine.schemas import DiagQuestion, AnswerEval
+from engine.tutor import (LEVELS, DIAG_QUESTIONS, DIAG_CACHE, DIAG_HINT, EVAL_HINT, FALLBACK_DIAG, FALLBACK_GAME, GAME_XP,
+                          diag_goal, diag_task, eval_goal, eval_task, chat_eval_task, lesson_system, lesson_task,
+                          level_for_score, game_question_prompt, game_question_options, screened, finish_eval)
+from engine.audio import tts_wav_bytes, tts_presynthesize, TranscriptionService, warm_up_tts, voice_status
+from engine import trace
 
 # ---------------- UI SETUP ----------------
 st.set_page_config(page_title="Buddy", page_icon="🎒", layout="centered")
 st.title("🎒 Buddy — Accessible Education")
+trace.begin_turn("rerun")  # spans below are grouped per rerun for the Teacher tab
 
-db = DB()
-db.ensure_badges_seed()
+@st.cache_resource
+def get_db():
+    # one handle per process: schema setup, seeding and the writer thread survive reruns
+    db = DB(write_behind=True)
+    db.ensure_badges_seed()
+    seed_bundled(db)
+    return db
+
+db = get_db()
 
 # ---------------- SIDEBAR ----------------
 with st.sidebar:
@@ -38,37 +54,65 @@ with st.sidebar:
     up = st.file_uploader("Import curriculum pack (.json)", type=["json"])
     if up is not None:
         try:
-            pack = load_pack(up)
-            merge_pack_into_db(db, pack)
-            st.success(f"Imported **{pack['subject']}** pack with {len(pack['skills'])} skills.")
+            rep = import_pack(db, up)
+            st.success(f"Imported **{rep['subject']}** pack: {rep['inserted']} new, "
+                       f"{rep['skipped']} already present, {rep['invalid']} invalid.")
         except Exception as e:
             st.error(f"Import failed: {e}")
 
 # ---------------- HELPERS ----------------
-def gen_diag_question(subject, level, lang):
-    j = ask_llm_json(
-        system_goal="Create ONE short diagnostic question.",
-        user_task=f"Subject: {subject}. Level: {level}. Language: {lang}. Keep it concise and objective.",
-        schema_hint='{"question": "string"}'
-    )
-    return j.get("question", "What is 2 + 3?")
+def session_key():
+    ss = st.session_state
+    return ss.learner, ss.subject, ss.level, ss.lang
+
+def banked(kind, skill=None, key=None):
+    """A pre-generated question this learner hasn't seen, or None once the bank is used up.
 
-def eval_answer(question, student_answer, level, lang):
+    `key` is (learner, subject, level, lang); worker threads must pass it
+    since they can't read st.session_state.
+    """
+    learner, subject, level, lang = key or session_key()
+    hit = db.bank_take(learner, kind, subject, level, lang, skill["id"] if skill else 0)
+    return hit["question"] if hit else None
+
+def gen_diag_question(subject, level, lang):
+    q = banked("diag")
+    if q:
+        return q
     j = ask_llm_json(
-        system_goal="Judge the student's answer; give step-by-step feedback; return a follow-up question.",
-        user_task=(
-            f"Question: {question}\n"
-            f"Student answer: {student_answer}\n"
-            f"Level: {level}\nLanguage: {lang}\n"
-            "Be strict but kind. Keep feedback short."
-        ),
-        schema_hint='{"correct": true/false, "feedback": "string", "next_question": "string"}'
+        system_goal=diag_goal(),
+        user_task=diag_task(subject, level, lang),
+        schema_hint=DIAG_HINT,
+        schema=DiagQuestion,
+        cache=DIAG_CACHE,
+        priority=INTERACTIVE, learner=st.session_state.get("learner")
     )
-    if "correct" not in j:
-        j["correct"] = "correct" in str(j).lower()
-    j.setdefault("feedback", "Thanks! Here is a short explanation and a hint.")
-    j.setdefault("next_question", "Try 4 + 3 = ?")
-    return j
+    return screened(j.get("question"), FALLBACK_DIAG)
+
+def lesson_system_for_session():
+    return lesson_system(st.session_state.subject, st.session_state.level, st.session_state.lang)
+
+def eval_answer(question, student_answer, level, lang, convo=None):
+    reference = db.bank_answer(question)  # known for questions served from the bank
+    if convo:
+        # the lesson chat already holds the question unless it came from somewhere else
+        said = conversation(convo, lesson_system_for_session()).said(question)
+        j = chat_json(
+            convo, lesson_system_for_session(),
+            user_task=chat_eval_task(student_answer, None if said else question, reference),
+            schema_hint=EVAL_HINT, schema=AnswerEval,
+            priority=INTERACTIVE, learner=st.session_state.get("learner")
+        )
+    else:
+        j = ask_llm_json(
+            system_goal=eval_goal(),
+            user_task=eval_task(question, student_answer, level, lang, reference),
+            schema_hint=EVAL_HINT,
+            schema=AnswerEval,
+            cache=False,  # judgments depend on the learner's answer; always ask fresh
+            priority=INTERACTIVE, learner=st.session_state.get("learner")
+        )
+    return finish_eval(j)
 
 def start_session(name, subject, level):
     st.session_state.learner = db.ensure_learner(name, st.session_state.lang)
@@ -77,81 +121,59 @@ def start_session(name, subject, level):
     st.session_state.mode = "diagnostic"
     st.session_state.diag_q = 0
     st.session_state.diag_score = 0
+    st.session_state.pop("lesson_skill", None)
+    end_conversation(st.session_state.get("convo"))
+    st.session_state.convo = uuid.uuid4().hex
     st.session_state.diag_q_text = gen_diag_question(subject, level, st.session_state.lang)
 
-# ---- Skill Memory Map helpers (DOT graph) ----
-def get_status_for_skill(learner_id, skill_id):
-    cur = db.conn.execute(
-        "SELECT status FROM progress WHERE learner_id=? AND skill_id=?",
-        (learner_id, skill_id)
-    ).fetchone()
-    return cur[0] if cur else "Unseen"
-
-def skill_color(status):
-    return {
-        "Practicing": "#F6C453",  # amber
-        "Learning":   "#60A5FA",  # blue
-        "Unseen":     "#9CA3AF",  # gray
-    }.get(status, "#22C55E")      # default green for mastered-ish
-
-def build_skill_graph_dot(learner_id, subject):
-    skills = db.list_skills(subject)  # [{id,topic,subtopic}]
-    # group by topic
-    by_topic = {}
-    for s in skills:
-        by_topic.setdefault(s["topic"], []).append(s)
-    # deterministic order
-    for t in by_topic:
-        by_topic[t] = sorted(by_topic[t], key=lambda x: x["subtopic"].lower())
-
-    lines = [
-        'digraph G {',
-        'rankdir=LR;',
-        'node [shape=box, style="rounded,filled", fontname="Verdana", fontsize=10];',
-        'edge [color="#94a3b8"];'
-    ]
-    # clusters per topic
-    cluster_idx = 0
-    last_node = None
-    first_nodes = []
-
-    for topic, items in sorted(by_topic.items()):
-        lines.append(f'subgraph cluster_{cluster_idx} {{ label="{topic}"; color="#e5e7eb"; fontsize=12;')
-        prev = None
-        for s in items:
-            status = get_status_for_skill(learner_id, s["id"])
-            color = skill_color(status)
-            node_id = f'n{s["id"]}'
-            label = s["subtopic"].replace('"', '\\"')
-            lines.append(f'{node_id} [label="{label}", fillcolor="{color}"];')
-            if prev:
-                lines.append(f'{prev} -> {node_id};')
-            prev = node_id
-        if items:
-            first_nodes.append(f'n{items[0]["id"]}')
-        lines.append('}')
-        cluster_idx += 1
-
-    # light cross-links between topics to show a path
-    for i in range(len(first_nodes) - 1):
-        lines.append(f'{first_nodes[i]} -> {first_nodes[i+1]} [style=dashed, color="#cbd5e1"];')
-
-    lines.append('}')
-    return "\n".join(lines)
+@st.cache_resource
+def get_stt_service(model_dir):
+    # worker processes load the Vosk model once and are shared by every session
+    svc = TranscriptionService(model_dir)
+    svc.warm_up(wait=False)
+    return svc
+
+NO_SKILLS = "There are no skills for {subject} yet. Add some in the Teacher tab or import a curriculum pack."
+
+VOICE_STATES = {"cold": "⚪ not loaded", "loading": "⏳ loading…", "ready": "🟢 ready"}
+
+def voice_warm_up():
+    """Start loading the voice stack in the background and show how far it got."""
+    svc = get_stt_service(st.session_state.vosk_path)
+    warm_up_tts()
+    status = voice_status(svc)
+    st.caption("  ·  ".join(f"{k.upper()}: {VOICE_STATES.get(v, '🔴 ' + v)}" for k, v in status.items()))
+
+@trace.traced("stt.live")
+def transcribe_live(audio_bytes):
+    """Transcribe the recorder's buffer in memory, showing partial results as they come."""
+    box = st.empty()
+    done = []
+    for text, final in get_stt_service(st.session_state.vosk_path).stream(audio_bytes):
+        if final:
+            done.append(text)
+            box.info(f"Transcribing… {' '.join(done)}")
+        else:
+            box.info(f"Transcribing… {' '.join(done + [text])}")
+    transcript = " ".join(done).strip()
+    box.info(f"Transcribed: **{transcript}**")
+    return transcript
 
 # ---------------- TABS ----------------
 tab_learn, tab_progress, tab_teacher, tab_game = st.tabs(["📘 Learn", "🎖️ Progress", "🧑‍🏫 Teacher", "🕹️ Game"])
 
 # ======== LEARN TAB ========
-with tab_learn:
+with tab_learn, trace.span("ui.learn"):
     voice_mode = st.toggle("🎤 Voice mode (offline)", value=False, help="Use TTS and mic recording with offline STT")
+    if voice_mode:
+        voice_warm_up()
 
     # Setup form
     if "learner" not in st.session_state:
         with st.form("setup"):
             name = st.text_input("Your name")
             subject = st.selectbox("Subject", ["Math", "Science", "Literacy"])
-            level = st.selectbox("Level", ["Beginner", "Intermediate", "Advanced"])
+            level = st.selectbox("Level", LEVELS)
             start = st.form_submit_button("Start")
         if start and name.strip():
             start_session(name.strip(), subject, level)
@@ -160,27 +182,19 @@ with tab_learn:
 
     # Diagnostic flow
     if st.session_state.mode == "diagnostic":
-        st.info("Quick check: 3 short questions to set your starting level.")
+        st.info(f"Quick check: {DIAG_QUESTIONS} short questions to set your starting level.")
         st.write(f"**Q{st.session_state.diag_q + 1}:** {st.session_state.diag_q_text}")
 
         if voice_mode:
+            tts_presynthesize(st.session_state.diag_q_text)  # ready before the button is pressed
             cols = st.columns(2)
             with cols[0]:
                 if st.button("🔊 Speak the question"):
-                    with tempfile.TemporaryDirectory() as td:
-                        out_wav = os.path.join(td, "buddy_says.wav")
-                        tts_save_wav(st.session_state.diag_q_text, out_wav)
-                        st.audio(open(out_wav, "rb").read(), format="audio/wav")
+                    st.audio(tts_wav_bytes(st.session_state.diag_q_text), format="audio/wav")
             with cols[1]:
-                audio = mic_recorder(start_prompt="🎙️ Record answer", stop_prompt="⏹️ Stop", just_once=True, key="diag_mic")
+                audio = mic_recorder(start_prompt="🎙️ Record answer", stop_prompt="⏹️ Stop", format="wav", just_once=True, key="diag_mic")
                 if audio and audio.get("bytes"):
-                    with tempfile.TemporaryDirectory() as td:
-                        rec_path = os.path.join(td, "user.wav")
-                        with open(rec_path, "wb") as f:
-                            f.write(audio["bytes"])
-                        transcript = stt_transcribe_wav(rec_path, st.session_state.vosk_path)
-                        st.session_state["prefill_answer"] = transcript
-                        st.info(f"Transcribed: **{transcript}**")
+                    st.session_state["prefill_answer"] = transcribe_live(audio["bytes"])
 
         default_ans = st.session_state.pop("prefill_answer", "") if "prefill_answer" in st.session_state else ""
         with st.form("diag"):
@@ -197,56 +211,56 @@ with tab_learn:
             st.session_state.diag_score += int(bool(res["correct"]))
             st.session_state.diag_q += 1
 
-            if st.session_state.diag_q >= 3:
-                score = st.session_state.diag_score
-                if score <= 1:
-                    st.session_state.level = "Beginner"
-                elif score == 2:
-                    st.session_state.level = "Intermediate"
-                else:
-                    st.session_state.level = "Advanced"
+            if st.session_state.diag_q >= DIAG_QUESTIONS:
+                st.session_state.level = level_for_score(st.session_state.diag_score)
                 st.success(f"Diagnostic done! Starting level: **{st.session_state.level}**")
                 st.session_state.mode = "lesson"
                 for k in ("diag_q_text",):
                     st.session_state.pop(k, None)
             else:
-                st.session_state.diag_q_text = res["next_question"]
+                st.session_state.diag_q_text = banked("diag") or res["next_question"]
             st.rerun()
 
     # Lesson loop
-    if st.session_state.mode == "lesson":
-        skill = pick_next_skill(db, st.session_state.learner, st.session_state.subject)
+    if st.session_state.mode == "lesson" and "lesson_skill" not in st.session_state:
+        # held across reruns so the skill answered is the one that was taught
+        st.session_state.lesson_skill = pick_next_skill(db, st.session_state.learner, st.session_state.subject)
+    if st.session_state.mode == "lesson" and st.session_state.lesson_skill is None:
+        st.info(NO_SKILLS.format(subject=st.session_state.subject))
+        st.session_state.pop("lesson_skill")  # look again on the next rerun
+    elif st.session_state.mode == "lesson":
+        skill = st.session_state.lesson_skill
         st.subheader(f"{st.session_state.subject}: {skill['topic']} → {skill['subtopic']}")
 
-        if "turn" not in st.session_state:
-            prompt = (
-                f"You are Buddy, a patient offline tutor for {st.session_state.subject}. "
-                f"Student level: {st.session_state.level}. Language: {st.session_state.lang}. "
-                f"Goal: Teach {skill['subtopic']} with one short example, then ask ONE question."
-            )
-            st.session_state.turn = ask_llm(prompt)
 
         # Voice controls
         if voice_mode:
             colA, colB = st.columns(2)
             with colA:
                 if st.button("🔊 Speak the question"):
-                    with tempfile.TemporaryDirectory() as td:
-                        out_wav = os.path.join(td, "buddy_says.wav")
-                        tts_save_wav(st.session_state.turn, out_wav)
-                        st.audio(open(out_wav, "rb").read(), format="audio/wav")
+                    st.audio(tts_wav_bytes(st.session_state.turn), format="audio/wav")
             with colB:
-                audio = mic_recorder(start_prompt="🎙️ Record answer", stop_prompt="⏹️ Stop", just_once=True, key="lesson_mic")
+                audio = mic_recorder(start_prompt="🎙️ Record answer", stop_prompt="⏹️ Stop", format="wav", just_once=True, key="lesson_mic")
                 if audio and audio.get("bytes"):
-                    with tempfile.TemporaryDirectory() as td:
-                        rec_path = os.path.join(td, "user.wav")
-                        with open(rec_path, "wb") as f:
-                            f.write(audio["bytes"])
-                        transcript = stt_transcribe_wav(rec_path, st.session_state.vosk_path)
-                        st.session_state["prefill_answer"] = transcript
-                        st.info(f"Transcribed: **{transcript}**")
-
-        st.markdown(st.session_state.turn)
+                    st.session_state["prefill_answer"] = transcribe_live(audio["bytes"])
+
+        opener = banked("lesson", skill) if "turn" not in st.session_state else None
+        if opener:
+            # from the question bank; recorded in the chat as if the model had just said it
+            conversation(st.session_state.convo, lesson_system_for_session()).add(lesson_task(skill), opener)
+            st.session_state.turn = opener
+            st.markdown(opener)
+        elif "turn" not in st.session_state:
+            # one chat per session: each turn only sends what is new since the last one
+            # render tokens as they arrive instead of waiting for the whole lesson
+            st.session_state.turn = st.write_stream(
+                screen_stream(chat_stream(st.session_state.convo, lesson_system_for_session(), lesson_task(skill),
+                                          priority=INTERACTIVE, learner=st.session_state.learner))
+            ).strip()
+        else:
+            st.markdown(st.session_state.turn)
+        if voice_mode:
+            tts_presynthesize(st.session_state.turn)
 
         default_ans = st.session_state.pop("prefill_answer", "") if "prefill_answer" in st.session_state else ""
         with st.form("answer"):
@@ -259,7 +273,8 @@ with tab_learn:
                 st.warning(msg)
                 st.stop()
 
-            res = eval_answer(st.session_state.turn, ans, st.session_state.level, st.session_state.lang)
+            res = eval_answer(st.session_state.turn, ans, st.session_state.level, st.session_state.lang,
+                              convo=st.session_state.convo)
             st.markdown(res["feedback"])
 
             # ---- Report content button ----
@@ -271,18 +286,17 @@ with tab_learn:
                     st.success("Thanks — your report was recorded.")
 
             correct = bool(res["correct"])
-            earned = update_progress(db, st.session_state.learner, skill, correct)
-            if earned:
-                try:
-                    st.toast("🎖️ Badge unlocked: " + ", ".join(earned), icon="🎉")
-                except Exception:
-                    st.success("🎖️ Badge unlocked: " + ", ".join(earned))
-
-            st.session_state.turn = res["next_question"]
+            update_progress(db, st.session_state.learner, skill, correct)
+
+            st.session_state.lesson_skill = pick_next_skill(db, st.session_state.learner, st.session_state.subject)
+            if st.session_state.lesson_skill and st.session_state.lesson_skill["id"] == skill["id"]:
+                st.session_state.turn = res["next_question"]
+            else:
+                st.session_state.pop("turn", None)  # new skill: teach it first
             st.rerun()
 
 # ======== PROGRESS TAB ========
-with tab_progress:
+with tab_progress, trace.span("ui.progress"):
     if "learner" not in st.session_state:
         st.info("Start a session in the Learn tab first.")
     else:
@@ -306,11 +320,11 @@ with tab_progress:
         st.markdown("---")
         st.subheader("🧠 Skill Memory Map")
         st.caption("Shows topics (clusters) and subtopics (nodes). Color = status.")
-        dot = build_skill_graph_dot(st.session_state.learner, st.session_state.subject)
+        dot = skill_graph_dot(db, st.session_state.learner, st.session_state.subject)
         st.graphviz_chart(dot, use_container_width=True)
 
 # ======== TEACHER TAB ========
-with tab_teacher:
+with tab_teacher, trace.span("ui.teacher"):
     st.subheader("Manage skills & content packs")
 
     manage_subject = st.selectbox("Subject to manage", ["Math", "Science", "Literacy"])
@@ -337,7 +351,7 @@ with tab_teacher:
             cols[0].write(f"**{s['topic']}**")
             cols[1].write(s["subtopic"])
             if cols[2].button("Delete", key=f"del-{s['id']}"):
-                db.delete_skill(s["id"])
+                db.delete_skills(s["id"])
                 st.rerun()
 
     st.markdown("---")
@@ -351,8 +365,55 @@ with tab_teacher:
             mime="application/json"
         )
 
+    st.markdown("---")
+    st.markdown("### Class analytics")
+    days = st.select_slider("Window", options=[7, 14, 30, 90], value=30, format_func=lambda d: f"last {d} days")
+    activity = db.activity(days)
+    if not any(d["events"] for d in activity):
+        st.write("No activity in this window yet.")
+    else:
+        st.markdown("**Activity**")
+        st.line_chart(activity, x="day", y=["answered", "correct", "active_learners"])
+        acc = db.skill_accuracy(manage_subject, days)
+        if acc:
+            st.markdown(f"**Weakest {manage_subject} skills** (accuracy)")
+            st.bar_chart([{"skill": f"{a['topic']} → {a['subtopic']}", "accuracy": a["accuracy"]} for a in acc[:20]],
+                         x="skill", y="accuracy")
+        struggling = db.struggling_learners(days=days)
+        if struggling:
+            st.markdown("**Learners who may need help**")
+            st.dataframe([{"learner": l["name"], "answered": l["answered"], "accuracy": l["accuracy"],
+                           "last active": l["last_active"]} for l in struggling],
+                         hide_index=True, use_container_width=True)
+
+    st.markdown("---")
+    with st.expander("🗃️ Question bank", expanded=False):
+        bank = db.bank_stats()
+        if bank:
+            st.dataframe(bank, hide_index=True, use_container_width=True)
+        else:
+            st.write("The bank is empty; every question is generated live.")
+        st.caption("Fill it offline with `python -m engine.qbank --workers 4`.")
+
+    with st.expander("⏱️ Performance", expanded=False):
+        if not trace.ENABLED:
+            st.caption("Tracing is off. Set BUDDY_TRACE=1 to collect stage timings.")
+        else:
+            stages = trace.stage_stats()
+            if not stages:
+                st.write("No timings recorded yet.")
+            else:
+                st.markdown("**Per stage (recent spans)**")
+                st.dataframe(stages, hide_index=True, use_container_width=True)
+                st.markdown("**Slowest recent turns**")
+                for t in trace.slowest_turns(5):
+                    top = ", ".join(f"{k} {v:.0f} ms" for k, v in list(t["stages"].items())[:4])
+                    st.write(f"{time.strftime('%H:%M:%S', time.localtime(t['at']))} — "
+                             f"**{t['total_ms']:.0f} ms**: {top}")
+            st.caption(f"Spans are appended to `{trace.TRACE_PATH}`.")
+
 # ======== GAME TAB (Buddy Challenge) ========
-with tab_game:
+with tab_game, trace.span("ui.game"):
     st.subheader("🕹️ Buddy Challenge — Timed Quiz Mode")
     if "learner" not in st.session_state:
         st.info("Start a session in the Learn tab first (see Learn tab).")
@@ -369,15 +430,44 @@ with tab_game:
     st.session_state.setdefault("game_question", "")
     st.session_state.setdefault("game_skill", None)
 
+    PREFETCH_DEPTH = 3   # questions kept ready ahead of the student
+    PREFETCH_IDLE = 60   # seconds past the game's end before an abandoned prefetcher stops itself
+
+    def start_prefetch():
+        stop_prefetch()
+        # the worker thread must not touch st.session_state; capture plain values
+        key = learner, subject, level, lang = session_key()
+        def make_question(skill, n):
+            # the bank first; the model only once this learner has seen all of it
+            return banked("game", skill, key) or screened(
+                ask_llm(game_question_prompt(subject, level, skill), options=game_question_options(n),
+                        priority=BACKGROUND, learner=learner, cancel=pf.stopped).strip(), FALLBACK_GAME)
+        pf = QuestionPrefetcher(
+            pick_skill=lambda: pick_next_skill(db, learner, subject),
+            make_question=make_question,
+            depth=PREFETCH_DEPTH,
+            idle_timeout=st.session_state.game_duration + PREFETCH_IDLE,
+        )
+        st.session_state.game_prefetch = pf.start()
+
+    def stop_prefetch():
+        pf = st.session_state.pop("game_prefetch", None)
+        if pf is not None:
+            pf.stop()
+
     def new_game_question():
+        pf = st.session_state.get("game_prefetch")
+        ready = pf.get() if pf is not None else None
+        if ready:
+            # the round (and seed) the question was generated for
+            st.session_state.game_skill, st.session_state.game_question, st.session_state.game_round = ready
+            return
+        # rounds come from the prefetcher too, so the live seed never repeats a prefetched one
+        st.session_state.game_round = pf.next_round() if pf is not None else st.session_state.get("game_round", 0) + 1
         skill = pick_next_skill(db, st.session_state.learner, st.session_state.subject)
-        prompt = (
-            f"You are Buddy, the quizmaster for {st.session_state.subject}. "
-            f"Give ONE {st.session_state.level} level question for subtopic '{skill['subtopic']}'. "
-            f"Keep it short; do not include the answer."
-        )
-        q = ask_llm(prompt).strip()
-        st.session_state.game_question = q
+        # nothing prefetched yet: bank, else the text is streamed into the page on the next render
+        # (no skill at all: the page says so and ends the game)
+        st.session_state.game_question = (banked("game", skill) if skill else None) or ""
         st.session_state.game_skill = skill
 
     # Controls
@@ -393,30 +483,45 @@ with tab_game:
                 st.session_state.game_started_at = time.time()
                 st.session_state.game_score = 0
                 st.session_state.game_xp = 0
+                st.session_state.game_round = 0
+                start_prefetch()
                 new_game_question()
                 st.experimental_rerun()
         else:
             if st.button("⏹️ Stop"):
                 st.session_state.game_running = False
+                stop_prefetch()
 
     # Timer + Question
     if st.session_state.game_running:
         remaining = max(0, st.session_state.game_duration - int(time.time() - st.session_state.game_started_at))
         st.markdown(f"### ⏱️ Time left: **{remaining}s** | Score: **{st.session_state.game_score}** | XP: **{st.session_state.game_xp}**")
-        st.write(f"**Question:** {st.session_state.game_question}")
+        if st.session_state.game_question:
+            st.write(f"**Question:** {st.session_state.game_question}")
+        elif st.session_state.game_skill is None:
+            st.session_state.game_running = False
+            stop_prefetch()
+            st.info(NO_SKILLS.format(subject=st.session_state.subject))
+            st.stop()
+        else:
+            st.write("**Question:**")
+            prompt = game_question_prompt(st.session_state.subject, st.session_state.level,
+                                          st.session_state.game_skill)
+            st.session_state.game_question = st.write_stream(screen_stream(
+                ask_llm_stream(prompt, options=game_question_options(st.session_state.game_round),
+                               priority=INTERACTIVE, learner=st.session_state.learner)
+            )).strip()
 
         # optional voice answer
         use_voice = st.toggle("🎤 Voice answer", value=False, key="game_voice")
         if use_voice:
-            audio = mic_recorder(start_prompt="🎙️ Record answer", stop_prompt="⏹️ Stop", just_once=True, key="game_mic")
+            voice_warm_up()
+            tts_presynthesize(st.session_state.game_question)
+            if st.button("🔊 Speak the question", key="game_speak"):
+                st.audio(tts_wav_bytes(st.session_state.game_question), format="audio/wav")
+            audio = mic_recorder(start_prompt="🎙️ Record answer", stop_prompt="⏹️ Stop", format="wav", just_once=True, key="game_mic")
             if audio and audio.get("bytes"):
-                with tempfile.TemporaryDirectory() as td:
-                    rec_path = os.path.join(td, "user.wav")
-                    with open(rec_path, "wb") as f:
-                        f.write(audio["bytes"])
-                    transcript = stt_transcribe_wav(rec_path, st.session_state.vosk_path)
-                    st.session_state["game_prefill"] = transcript
-                    st.info(f"Transcribed: **{transcript}**")
+                st.session_state["game_prefill"] = transcribe_live(audio["bytes"])
 
         prefill = st.session_state.pop("game_prefill", "") if "game_prefill" in st.session_state else ""
         with st.form("game_answer"):
@@ -433,11 +538,8 @@ with tab_game:
             st.markdown(res["feedback"])
 
             # score logic
-            if correct:
-                st.session_state.game_score += 1
-                st.session_state.game_xp += 10
-            else:
-                st.session_state.game_xp = max(0, st.session_state.game_xp - 3)
+            st.session_state.game_score += int(correct)
+            st.session_state.game_xp = max(0, st.session_state.game_xp + GAME_XP[0 if correct else 1])
 
             # update course progress too
             if st.session_state.game_skill:
@@ -451,6 +553,7 @@ with tab_game:
         # auto-stop when time is up
         if remaining <= 0:
             st.session_state.game_running = False
+            stop_prefetch()
             st.success(f"Time! Final Score: {st.session_state.game_score} | XP: {st.session_state.game_xp}")
 
     else:
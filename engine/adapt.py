@@ -1,8 +1,98 @@
-import random
+import heapq, threading, time
+from collections import deque
+from engine.cache import LRU
+from engine.storage import leitner_next
+
+# ---- Spaced-repetition scheduler ----
+# Each (learner, subject) gets an in-memory review index, built with one query
+# from the box/due_at columns on progress. Selection order:
+#   1. the most overdue review (ties go to the lower box, i.e. the weaker skill)
+#   2. otherwise the next never-seen skill in curriculum order
+#   3. otherwise whichever review comes due first
+# Answers update the index in O(log n). Stale heap entries are skipped when
+# they reach the top instead of being searched for and removed.
+
+PICK_SNOOZE = 30  # seconds a picked skill steps aside so look-ahead picks differ
+
+_indexes = LRU(max_entries=256)
+
+
+class ReviewIndex:
+    def __init__(self, rows, version):
+        self.version = version
+        self.skills = {}
+        self.state = {}   # skill_id -> (due_at, box) for skills in the heap
+        self.heap = []
+        self.new = deque()
+        self._lock = threading.Lock()
+        for skill, box, due_at in rows:
+            self.skills[skill["id"]] = skill
+            if box:
+                self.state[skill["id"]] = (due_at, box)
+                self.heap.append((due_at, box, skill["id"]))
+            else:
+                self.new.append(skill["id"])
+        heapq.heapify(self.heap)
+
+    def _top(self):
+        while self.heap:
+            due_at, box, sid = self.heap[0]
+            if self.state.get(sid) == (due_at, box):
+                return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+    def _set(self, sid, due_at, box):
+        self.state[sid] = (due_at, box)
+        heapq.heappush(self.heap, (due_at, box, sid))
+
+    def pick(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            top = self._top()
+            sid = None
+            if top is not None and top[0] <= now:
+                sid, box = top[2], top[1]
+            else:
+                while self.new and self.new[0] in self.state:
+                    self.new.popleft()
+                if self.new:
+                    sid, box = self.new.popleft(), 0
+                elif top is not None:
+                    sid, box = top[2], top[1]
+            if sid is None:
+                return None
+            # not persisted: the real due time arrives with the answer
+            self._set(sid, int(now) + PICK_SNOOZE, box)
+            return self.skills[sid]
+
+    def update(self, skill_id, correct, now=None):
+        now = int(time.time() if now is None else now)
+        with self._lock:
+            if skill_id not in self.skills:
+                return
+            box = self.state.get(skill_id, (0, 0))[1]
+            box, due_at = leitner_next(box, correct, now)
+            self._set(skill_id, due_at, box)
+
+
+def _index(db, learner_id, subject):
+    key = (db.path, learner_id, subject)
+    version = db.map_version(learner_id)[0]  # rebuilt when skills are added or removed
+    idx = _indexes.get(key)
+    if idx is None or idx.version != version:
+        idx = ReviewIndex(db.review_state(subject, learner_id), version)
+        _indexes.put(key, idx)
+    return idx
+
 
 def pick_next_skill(db, learner_id, subject):
-    skills = db.skills_for(subject)
-    return random.choice(skills)
+    skill = _index(db, learner_id, subject).pick()
+    return dict(skill, subject=subject) if skill else None
+
 
 def update_progress(db, learner_id, skill, correct: bool):
-    db.bump_progress(learner_id, skill["id"], correct)
\ No newline at end of file
+    db.record_answer(learner_id, skill["id"], correct)
+    idx = _indexes.get((db.path, learner_id, skill.get("subject")))
+    if idx is not None:
+        idx.update(skill["id"], correct)
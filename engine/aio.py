@@ -0,0 +1,482 @@
+import asyncio, json, threading, time, weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import aclosing
+
+from engine import audio, model
+from engine.adapt import pick_next_skill, update_progress
+from engine.backends import DRAIN_BYTES, DRAIN_TIMEOUT, HTTPBackend, ollama_payload
+from engine.jsonstream import JSONObjectScanner
+from engine.scheduler import NORMAL
+from engine.storage import DB
+from engine.trace import mark
+
+# ---- Async facade ----
+# asyncio front for the engine so one event loop can serve many sessions.
+# LLM calls go to Ollama over non-blocking sockets (asyncio streams, no extra
+# dependency) and take slots from the same scheduler as the threaded app.
+# Other backends run on a thread and relay their tokens to the loop. STT and
+# TTS resolve on their existing worker pools; DB writes are applied in order
+# by one writer task, reads run on a small thread pool.
+
+LLM_RELAY_THREADS = 8   # blocking (non-HTTP) backends only
+AUDIO_THREADS = 2
+
+
+class AsyncOllama:
+    """Non-blocking client for `ollama serve` with a pool of keep-alive connections."""
+
+    def __init__(self, host, port, model_name, keep_alive="30m", connect_timeout=5.0,
+                 read_timeout=120.0, pool_size=16):
+        self.host = host
+        self.port = port
+        self.model = model_name
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self._idle = []   # (reader, writer)
+
+    @classmethod
+    def from_backend(cls, b: HTTPBackend):
+        return cls(b.host, b.port, b.model, b.keep_alive, b.connect_timeout, b.read_timeout)
+
+    def _release(self, conn):
+        if len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def _readline(self, reader):
+        line = await asyncio.wait_for(reader.readline(), self.read_timeout)
+        if not line:
+            raise ConnectionResetError("Ollama closed the connection")
+        return line
+
+    async def _request(self, path, payload):
+        """POST JSON; returns (conn, status, headers) with the headers read."""
+        body = json.dumps(payload).encode()
+        head = (f"POST {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: keep-alive\r\n\r\n").encode()
+        conn = self._idle.pop() if self._idle else None
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                              self.connect_timeout)
+            reader, writer = conn
+            try:
+                writer.write(head + body)
+                await writer.drain()
+                status = int((await self._readline(reader)).split()[1])
+                headers = {}
+                while True:
+                    line = await self._readline(reader)
+                    if line in (b"\r\n", b"\n"):
+                        break
+                    k, _, v = line.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+            except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
+                # the server dropped an idle pooled connection; retry once on a fresh one
+                writer.close()
+                if not reused:
+                    raise
+                conn, reused = None, False
+                continue
+            except BaseException:
+                writer.close()
+                raise
+            return conn, status, headers
+
+    async def _lines(self, reader, headers):
+        """Lines of a response body, chunked or sized."""
+        buf = b""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self._readline(reader)).split(b";")[0], 16)
+                if size == 0:
+                    while await self._readline(reader) not in (b"\r\n", b"\n"):
+                        pass  # trailers
+                    break
+                buf += (await asyncio.wait_for(reader.readexactly(size + 2), self.read_timeout))[:-2]
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    yield line
+        else:
+            buf = await asyncio.wait_for(reader.readexactly(int(headers.get("content-length", 0))),
+                                         self.read_timeout)
+        for line in buf.split(b"\n"):
+            yield line
+
+    async def _stream(self, path, payload):
+        """Yield decoded NDJSON messages as Ollama streams them."""
+        conn, status, headers = await self._request(path, payload)
+        lines = self._lines(conn[0], headers)
+        done = False
+        try:
+            if status != 200:
+                data = b"\n".join([line async for line in lines])
+                done = True
+                raise RuntimeError(f"Ollama returned {status}: {data[:200].decode(errors='replace')}")
+            async for line in lines:
+                if not line.strip():
+                    continue
+                msg = json.loads(line)
+                if msg.get("error"):
+                    raise RuntimeError(f"Ollama error: {msg['error']}")
+                yield msg
+            done = True
+        except GeneratorExit:
+            done = await self._drain(lines)  # the consumer stopped early
+            raise
+        finally:
+            # unread bytes would be taken for the next reply; don't pool that socket
+            if done and headers.get("connection", "").lower() != "close":
+                self._release(conn)
+            else:
+                conn[1].close()
+
+    async def _drain(self, lines):
+        """Read the rest of a stream if it ends within the drain budget (see engine.backends)."""
+        async def rest():
+            left = DRAIN_BYTES
+            async for line in lines:
+                left -= len(line)
+                if left < 0:
+                    return False
+            return True
+        try:
+            return await asyncio.wait_for(rest(), DRAIN_TIMEOUT)
+        except (asyncio.TimeoutError, OSError, ValueError, asyncio.IncompleteReadError):
+            return False
+
+    def _payload(self, prompt, options, stream, messages=None):
+        return ollama_payload(self.model, self.keep_alive, prompt, options, stream, messages)
+
+    async def generate(self, prompt, options=None):
+        return "".join([tok async for tok in self.stream(prompt, options)]).strip()
+
+    async def stream(self, prompt, options=None):
+        # aclosing: stopping early must close the connection now, not when collected
+        async with aclosing(self._stream("/api/generate", self._payload(prompt, options, True))) as msgs:
+            async for msg in msgs:
+                tok = msg.get("response", "")
+                if tok:
+                    yield tok
+
+    async def chat_stream(self, messages, options=None, stats=None):
+        async with aclosing(self._stream("/api/chat", self._payload(None, options, True, messages))) as msgs:
+            async for msg in msgs:
+                tok = msg.get("message", {}).get("content", "")
+                if tok:
+                    yield tok
+                if msg.get("done") and stats is not None:
+                    stats.update({k: msg[k] for k in ("prompt_eval_count", "prompt_eval_duration") if k in msg})
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+# ---- LLM calls ----
+# Pooled streams belong to the loop that opened them, so each running loop
+# gets its own client; it goes away with the loop.
+_clients = weakref.WeakKeyDictionary()   # loop -> (backend, AsyncOllama)
+_clients_lock = threading.Lock()
+_relay_pool = ThreadPoolExecutor(LLM_RELAY_THREADS, thread_name_prefix="buddy-aio-llm")
+RELAY_QUEUE = 256   # tokens a relay thread may run ahead of its consumer
+_END = object()
+
+def _client_for(backend):
+    """This loop's async client for the process-wide backend, or None if it isn't HTTP."""
+    if not isinstance(backend, HTTPBackend):
+        return None
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        src, client = _clients.get(loop, (None, None))
+        if src is not backend:
+            if client is not None:
+                client.close()
+            client = AsyncOllama.from_backend(backend)
+            _clients[loop] = (backend, client)
+    return client
+
+async def _relay(make_tokens):
+    """Run a blocking token generator on a thread and yield its tokens here.
+
+    The queue is bounded, so a slow consumer holds the thread back instead of
+    buffering the whole reply, and the thread gives up once the consumer stops.
+    """
+    loop = asyncio.get_running_loop()
+    q = asyncio.Queue(maxsize=RELAY_QUEUE)
+    stop = threading.Event()
+    def put(item):
+        fut = asyncio.run_coroutine_threadsafe(q.put(item), loop)
+        while not stop.is_set():
+            try:
+                return fut.result(timeout=0.1)
+            except FutureTimeout:   # not the builtin TimeoutError before 3.11
+                pass
+        fut.cancel()
+    def run():
+        tokens = None
+        try:
+            tokens = make_tokens()
+            for tok in tokens:
+                if stop.is_set():
+                    return
+                put(tok)
+        except Exception as e:
+            put(e)
+        else:
+            put(_END)
+        finally:
+            if tokens is not None:
+                tokens.close()
+    loop.run_in_executor(_relay_pool, run)
+    try:
+        while True:
+            tok = await q.get()
+            if tok is _END:
+                return
+            if isinstance(tok, Exception):
+                raise tok
+            yield tok
+    finally:
+        stop.set()
+
+async def _stream(prompt, options=None, priority=NORMAL, learner=None, timeout=None, messages=None):
+    t0 = time.perf_counter()
+    async with model.scheduler.slot_async(priority, learner, model.deadline(timeout)) as ticket:
+        mark("llm.queue", t0)
+        backend = model.get_backend()
+        client = _client_for(backend)
+        stats = {}
+        if client is not None:
+            tokens = (client.stream(prompt, options) if messages is None
+                      else client.chat_stream(messages, options, stats))
+        elif messages is None:
+            tokens = _relay(lambda: backend.stream(prompt, options))
+        else:
+            tokens = _relay(lambda: backend.chat_stream(messages, options, stats))
+        n = 0
+        try:
+            async for tok in tokens:
+                ticket.check()
+                if not n:
+                    mark("llm.first_token", t0)
+                n += 1
+                yield tok
+        finally:
+            await tokens.aclose()
+            mark("llm.stream", t0, tokens=n)
+            if stats.get("prompt_eval_duration"):
+                mark("llm.prompt_eval", time.perf_counter() - stats["prompt_eval_duration"] / 1e9,
+                     tokens=stats.get("prompt_eval_count"))
+
+async def ask_llm(prompt: str, options=None, cache=True, priority=NORMAL, learner=None, timeout=None) -> str:
+    key, hit = await asyncio.to_thread(model.cache_lookup, prompt, options, cache)
+    if hit is not None:
+        return hit
+    out = "".join([tok async for tok in _stream(prompt, options, priority, learner, timeout)]).strip()
+    if key and out:
+        await asyncio.to_thread(model.cache_store, key, out)
+    return out
+
+async def ask_llm_stream(prompt: str, options=None, cache=True, priority=NORMAL, learner=None, timeout=None):
+    key, hit = await asyncio.to_thread(model.cache_lookup, prompt, options, cache)
+    if hit is not None:
+        yield hit
+        return
+    parts = []
+    # aclosing: a consumer that stops early must give the scheduler slot back now
+    async with aclosing(_stream(prompt, options, priority, learner, timeout)) as tokens:
+        async for tok in tokens:
+            parts.append(tok)
+            yield tok
+    out = "".join(parts).strip()
+    if key and out:
+        await asyncio.to_thread(model.cache_store, key, out)
+
+async def _generate_json(prompt, priority, learner, timeout, messages=None):
+    scanner = JSONObjectScanner()
+    raw = []
+    async with aclosing(_stream(prompt, model.JSON_OPTIONS, priority, learner, timeout, messages)) as tokens:
+        async for tok in tokens:
+            raw.append(tok)
+            if scanner.feed(tok):
+                break
+    return model.parse_json_reply(scanner, raw)
+
+async def _checked(obj, raw, schema, refix):
+    """model.check_json, re-asking failed fields via an awaitable refix(failed, obj)."""
+    checker = model.check_json(obj, raw, schema)
+    try:
+        ask = next(checker)
+        while True:
+            ask = checker.send(await refix(*ask))
+    except StopIteration as done:
+        return done.value
+
+async def ask_llm_json(system_goal: str, user_task: str, schema_hint: str, cache=True, schema=None,
+                       priority=NORMAL, learner=None, timeout=None) -> dict:
+    prompt = model.json_prompt(system_goal, user_task, schema_hint)
+    key, hit = await asyncio.to_thread(model.cache_lookup, prompt, model.json_cache_options(schema), cache)
+    obj = model.json_from_cache(hit, schema) if hit is not None else None
+    if obj is not None:
+        return obj
+    obj, raw = await _generate_json(prompt, priority, learner, timeout)
+    async def refix(failed, obj):
+        prompt = model.json_fix_prompt(system_goal, user_task, schema, failed, obj)
+        return (await _generate_json(prompt, priority, learner, timeout))[0]
+    obj = await _checked(obj, raw, schema, refix)
+    if key and "error" not in obj:
+        await asyncio.to_thread(model.cache_store, key, json.dumps(obj))
+    return obj
+
+async def chat_stream(session_id, system, user, options=None, priority=NORMAL, learner=None, timeout=None):
+    """model.chat_stream on the event loop; the conversations are shared with it."""
+    c = model.conversation(session_id, system)
+    parts = []
+    async with aclosing(_stream(None, options, priority, learner, timeout, c.messages(user))) as tokens:
+        async for tok in tokens:
+            parts.append(tok)
+            yield tok
+    c.add(user, "".join(parts).strip())
+
+async def chat_json(session_id, system, user_task: str, schema_hint: str, schema=None,
+                    priority=NORMAL, learner=None, timeout=None) -> dict:
+    c = model.conversation(session_id, system)
+    user = model.chat_json_message(user_task, schema_hint)
+    messages = c.messages(user)
+    obj, raw = await _generate_json(None, priority, learner, timeout, messages)
+    async def refix(failed, obj):
+        msgs = model.chat_fix_messages(messages, raw, schema, failed)
+        return (await _generate_json(None, priority, learner, timeout, msgs))[0]
+    obj = await _checked(obj, raw, schema, refix)
+    if "error" not in obj:
+        c.add(user, json.dumps(obj, ensure_ascii=False))
+    return obj
+
+
+# ---- Speech ----
+_audio_pool = ThreadPoolExecutor(AUDIO_THREADS, thread_name_prefix="buddy-aio-audio")
+
+async def transcribe(service: audio.TranscriptionService, audio_bytes, samplerate=None) -> str:
+    """Transcript from the STT worker processes."""
+    return await asyncio.wrap_future(service.submit(audio_bytes, samplerate))
+
+async def transcribe_wav(path_wav: str, model_dir: str) -> str:
+    """stt_transcribe_wav in-process, on the audio threads."""
+    return await asyncio.get_running_loop().run_in_executor(_audio_pool, audio.stt_transcribe_wav,
+                                                            path_wav, model_dir)
+
+async def tts_wav_bytes(text: str, voice=None, rate=audio.TTS_RATE) -> bytes:
+    data = await asyncio.to_thread(audio.tts_cached, text, voice, rate)
+    if data is None:
+        data = await asyncio.wrap_future(audio.tts_submit(text, voice, rate))
+    return data
+
+async def tts_save_wav(text: str, out_path: str):
+    data = await tts_wav_bytes(text)
+    def save():
+        with open(out_path, "wb") as f:
+            f.write(data)
+    await asyncio.get_running_loop().run_in_executor(_audio_pool, save)
+    return out_path
+
+
+# ---- Database ----
+class AsyncDB:
+    """DB calls off the event loop.
+
+    Writes, and progress updates (which also move the in-memory review
+    index), are applied in submission order by one writer task on a single
+    thread; whatever is queued when it wakes runs as one batch. Reads run
+    on a small thread pool and see every write that was awaited before them
+    (a DB read waits for everything already queued on its handle).
+    """
+
+    def __init__(self, path="buddy.db", db=None, readers=4):
+        self.db = db or DB(path)
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix="buddy-aio-read")
+        self._write_thread = ThreadPoolExecutor(1, thread_name_prefix="buddy-aio-write")
+        self._queue = None
+        self._task = None
+
+    def _ensure_writer(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @staticmethod
+    def _apply(batch):
+        out = []
+        for fn, args, kw, _ in batch:
+            try:
+                out.append((True, fn(*args, **kw)))
+            except Exception as e:
+                out.append((False, e))
+        return out
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stop = batch[-1] is None
+            batch = [b for b in batch if b is not None]
+            results = await loop.run_in_executor(self._write_thread, self._apply, batch)
+            for (_, _, _, fut), (ok, val) in zip(batch, results):
+                if fut.done():
+                    continue  # the caller was cancelled
+                if ok:
+                    fut.set_result(val)
+                else:
+                    fut.set_exception(val)
+            if stop:
+                return
+
+    async def write(self, fn, *args, **kw):
+        """Run fn(*args) on the writer; resolves once it has been applied."""
+        self._ensure_writer()
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((fn, args, kw, fut))
+        return await fut
+
+    async def read(self, fn, *args, **kw):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, lambda: fn(*args, **kw))
+
+    async def close(self):
+        """Apply queued writes, then stop the writer and the threads."""
+        if self._task is not None and not self._task.done():
+            self._queue.put_nowait(None)
+            await self._task
+        self._readers.shutdown(wait=False)
+        self._write_thread.shutdown(wait=True)
+
+    # -- the calls a tutoring session makes --
+    async def ensure_learner(self, name, lang):
+        return await self.write(self.db.ensure_learner, name, lang)
+
+    async def log_event(self, learner_id, skill_id, kind, data_json="{}"):
+        return await self.write(self.db.log_event, learner_id, skill_id, kind, data_json)
+
+    async def pick_next_skill(self, learner_id, subject):
+        return await self.write(pick_next_skill, self.db, learner_id, subject)
+
+    async def update_progress(self, learner_id, skill, correct):
+        return await self.write(update_progress, self.db, learner_id, skill, correct)
+
+    async def learner_stats(self, learner_id):
+        return await self.read(self.db.learner_stats, learner_id)
+
+    async def skill_statuses(self, subject, learner_id):
+        return await self.read(self.db.skill_statuses, subject, learner_id)
+
+    async def bank_take(self, learner_id, kind, subject, level, lang, skill_id=0):
+        return await self.write(self.db.bank_take, learner_id, kind, subject, level, lang, skill_id)
+
+    async def bank_answer(self, question):
+        return await self.read(self.db.bank_answer, question)
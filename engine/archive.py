@@ -0,0 +1,86 @@
+import datetime, gzip, io, json, os
+
+# ---- Event archive ----
+# Old events live in one gzip file per month (events-YYYY-MM.jsonl.gz), one
+# JSON array per line: [id, learner_id, skill_id, kind, data, created_at].
+# Files are append-only: every archive run adds a new gzip member. The DB's
+# event_segments table records how many bytes of each file are committed,
+# in the same transaction that deletes the archived rows. Bytes past that
+# mark come from a run that didn't commit; they are cut off before the next
+# append and never read.
+
+def month_of(ts) -> str:
+    return datetime.datetime.fromtimestamp(int(ts), datetime.timezone.utc).strftime("%Y-%m")
+
+
+class _Limited(io.RawIOBase):
+    """Read at most `n` bytes of a file: the committed part of a segment."""
+
+    def __init__(self, f, n):
+        self.f = f
+        self.left = n
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.left <= 0:
+            return 0
+        data = self.f.read(min(len(b), self.left))
+        self.left -= len(data)
+        b[:len(data)] = data
+        return len(data)
+
+
+class SegmentStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, month):
+        return os.path.join(self.root, f"events-{month}.jsonl.gz")
+
+    def append(self, month, rows, committed=0) -> int:
+        """Append rows as a new gzip member; returns the file's new size."""
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(month)
+        with open(path, "ab") as f:
+            if f.tell() > committed:
+                f.truncate(committed)  # leftovers of a run that never committed
+                f.seek(committed)
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6, mtime=0) as gz:
+                for row in rows:
+                    gz.write((json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n").encode())
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def read(self, month, committed):
+        """Yield the rows of a segment's committed bytes."""
+        path = self.path(month)
+        if not committed or not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            with gzip.GzipFile(fileobj=io.BufferedReader(_Limited(f, committed))) as gz:
+                for line in gz:
+                    yield json.loads(line)
+
+    def rewrite(self, month, committed) -> int:
+        """Merge a segment's members into one; returns the new size.
+
+        The merged file only replaces the old one if it is no bigger, so a
+        crash before the manifest is updated still leaves the recorded length
+        covering the whole file.
+        """
+        path, tmp = self.path(month), self.path(month) + ".tmp"
+        with open(tmp, "wb") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=9, mtime=0) as gz:
+                for row in self.read(month, committed):
+                    gz.write((json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n").encode())
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        if size > committed:
+            os.remove(tmp)
+            return committed
+        os.replace(tmp, path)
+        return size
@@ -1,7 +1,13 @@
-import os, wave, json
-import pyttsx3
-import soundfile as sf
-from vosk import Model, KaldiRecognizer
+import hashlib, io, itertools, os, wave, json, queue, tempfile, threading, time, multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from engine.cache import LRU
+from engine.trace import traced
+
+# numpy, soundfile, vosk and pyttsx3 are imported where they're used, so a
+# text-only session never loads them; see TranscriptionService.warm_up() and warm_up_tts() below.
 
 # ---- STT (Offline) ----
 _models_cache = {}
@@ -11,52 +17,456 @@ def _get_vosk_model(model_dir: str):
     if model_dir not in _models_cache:
         if not os.path.isdir(model_dir):
             raise RuntimeError(f"Vosk model not found at {model_dir}")
+        from vosk import Model
         _models_cache[model_dir] = Model(model_dir)
     return _models_cache[model_dir]
 
-def stt_transcribe_wav(path_wav: str, model_dir: str) -> str:
-    """Transcribe a mono 16k WAV file using Vosk offline."""
+STT_RATE = 16000
+FEED_FRAMES = 4000      # frames per AcceptWaveform call
+DECODE_FRAMES = 32768   # frames decoded/resampled per step
+
+def _to_pcm16(block, samplerate):
+    """float block (frames[, channels]) -> 16k mono little-endian int16 bytes."""
+    import numpy as np
+    if block.ndim > 1:
+        block = block.mean(axis=1)
+    if samplerate != STT_RATE:
+        import resampy
+        block = resampy.resample(block, samplerate, STT_RATE)
+    return (np.clip(block, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+def _pcm_blocks(audio, samplerate=None):
+    """Yield 16k mono PCM16 byte blocks from encoded bytes or a sample array.
+
+    Decoding and resampling happen a block at a time in memory, so nothing
+    touches disk and the recognizer can start before the whole clip is
+    converted. Resampling per block leaves tiny seams at block edges, which
+    recognition doesn't notice.
+    """
+    import numpy as np
+    import soundfile as sf
+    if isinstance(audio, np.ndarray):
+        if samplerate is None:
+            raise ValueError("samplerate is required for array input")
+        if audio.dtype.kind == "f":
+            data = audio.astype("float32", copy=False)
+        else:
+            data = audio / float(np.iinfo(audio.dtype).max)
+        for i in range(0, len(data), DECODE_FRAMES):
+            yield _to_pcm16(data[i:i + DECODE_FRAMES], samplerate)
+        return
+    info = sf.info(io.BytesIO(audio))
+    if (info.format, info.subtype, info.channels, info.samplerate) == ("WAV", "PCM_16", 1, STT_RATE):
+        # already what Vosk wants: hand over the raw frames untouched
+        wf = wave.open(io.BytesIO(audio), "rb")
+        while True:
+            buf = wf.readframes(DECODE_FRAMES)
+            if not buf:
+                return
+            yield buf
+    for block in sf.blocks(io.BytesIO(audio), blocksize=DECODE_FRAMES, dtype="float32"):
+        yield _to_pcm16(block, info.samplerate)
+
+def stt_stream(audio, model_dir: str, samplerate=None):
+    """Recognize audio incrementally, yielding (text, is_final) pairs.
+
+    `audio` is the recorder's encoded bytes (WAV, FLAC, OGG...) or a numpy
+    array of samples with its `samplerate`. Partial hypotheses arrive with
+    is_final=False, each finished utterance with is_final=True.
+    """
+    from vosk import KaldiRecognizer
     model = _get_vosk_model(model_dir)
-    rec = KaldiRecognizer(model, 16000)
+    rec = KaldiRecognizer(model, STT_RATE)
     rec.SetWords(False)
+    step = FEED_FRAMES * 2  # bytes per int16 frame
+    last_partial = ""
+    for pcm in _pcm_blocks(audio, samplerate):
+        for i in range(0, len(pcm), step):
+            if rec.AcceptWaveform(pcm[i:i + step]):
+                text = json.loads(rec.Result()).get("text", "")
+                last_partial = ""
+                if text:
+                    yield text, True
+            else:
+                partial = json.loads(rec.PartialResult()).get("partial", "")
+                if partial and partial != last_partial:
+                    last_partial = partial
+                    yield partial, False
+    final = json.loads(rec.FinalResult()).get("text", "")
+    if final:
+        yield final, True
+
+@traced("stt.transcribe")
+def stt_transcribe(audio, model_dir: str, samplerate=None) -> str:
+    """Transcribe in-memory audio bytes or samples using Vosk offline."""
+    return " ".join(text for text, final in stt_stream(audio, model_dir, samplerate) if final).strip()
+
+@traced("stt.transcribe_wav")
+def stt_transcribe_wav(path_wav: str, model_dir: str) -> str:
+    """Transcribe an audio file using Vosk offline."""
+    with open(path_wav, "rb") as f:
+        return stt_transcribe(f.read(), model_dir)
+
+# ---- STT worker pool ----
+# Recognition is CPU-bound, so it runs in worker processes that each load the
+# Vosk model once at startup. Requests go through the pool's queue and come
+# back as futures; per-request timings are kept for the Teacher tab.
+
+def _stt_worker_init(model_dir):
+    _get_vosk_model(model_dir)
 
-    # Ensure the WAV is 16k mono PCM; if not, convert via soundfile
-    data, samplerate = sf.read(path_wav)
-    if samplerate != 16000 or (len(data.shape) > 1 and data.shape[1] != 1):
-        # convert to mono 16k
+def _stt_worker_ping():
+    return os.getpid()
+
+def _stt_worker_run(audio, model_dir, samplerate, submitted, partials=None):
+    started = time.time()
+    done = []
+    for text, final in stt_stream(audio, model_dir, samplerate):
+        if final:
+            done.append(text)
+        if partials is not None:
+            partials.put((text, final))
+    return " ".join(done).strip(), {"pid": os.getpid(), "queue_ms": (started - submitted) * 1000,
+                                    "decode_ms": (time.time() - started) * 1000}
+
+def _pct(vals, q):
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))] if vals else 0.0
+
+class TranscriptionService:
+    def __init__(self, model_dir: str, workers=None, timeout=30.0):
+        self.model_dir = model_dir
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.timeout = timeout
+        self.timings = deque(maxlen=500)
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._manager = None
+        self._warm = None
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        # spawn: safe next to Streamlit's threads and the same on every OS
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_stt_worker_init, initargs=(self.model_dir,))
+
+    def _restart(self):
+        with self._lock:
+            old, self._pool = self._pool, self._new_pool()
+            self.restarts += 1
+        old.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, audio, samplerate=None, partials=None) -> Future:
+        """Queue audio bytes/samples; the future resolves to the transcript."""
+        out = Future()
+        submitted = time.time()
+        try:
+            inner = self._pool.submit(_stt_worker_run, audio, self.model_dir, samplerate, submitted, partials)
+        except BrokenProcessPool:
+            self._restart()
+            inner = self._pool.submit(_stt_worker_run, audio, self.model_dir, samplerate, submitted, partials)
+
+        def finished(f):
+            try:
+                text, timing = f.result()
+            except BrokenProcessPool as e:
+                self._restart()
+                out.set_exception(e)
+                return
+            except Exception as e:
+                out.set_exception(e)
+                return
+            timing["total_ms"] = (time.time() - submitted) * 1000
+            self.timings.append(timing)
+            out.set_result(text)
+        inner.add_done_callback(finished)
+        return out
+
+    def transcribe(self, audio, samplerate=None, timeout=None) -> str:
+        return self.submit(audio, samplerate).result(timeout or self.timeout)
+
+    def stream(self, audio, samplerate=None, timeout=None):
+        """Like stt_stream, but recognition runs in a worker process."""
+        if self._manager is None:
+            with self._lock:
+                if self._manager is None:
+                    self._manager = multiprocessing.get_context("spawn").Manager()
+        partials = self._manager.Queue()
+        fut = self.submit(audio, samplerate, partials)
+        deadline = time.monotonic() + (timeout or self.timeout)
+        while True:
+            try:
+                yield partials.get(timeout=0.1)
+                continue
+            except queue.Empty:
+                pass
+            if fut.done():
+                fut.result()  # surface worker errors
+                while not partials.empty():
+                    yield partials.get()
+                return
+            if time.monotonic() > deadline:
+                raise TimeoutError("Transcription timed out")
+
+    def warm_up(self, wait=True):
+        """Start every worker and load its model before the first real request."""
         import numpy as np
-        if len(data.shape) > 1:
-            data = data.mean(axis=1)
-        import resampy
-        data = resampy.resample(data, samplerate, 16000)
-        sf.write(path_wav, data, 16000, subtype='PCM_16')
-    
-    wf = wave.open(path_wav, "rb")
-    result = ""
-    while True:
-        buf = wf.readframes(4000)
-        if len(buf) == 0:
-            break
-        if rec.AcceptWaveform(buf):
-            part = json.loads(rec.Result()).get("text", "")
-            result += (" " + part)
-    final = json.loads(rec.FinalResult()).get("text", "")
-    result = (result + " " + final).strip()
-    return result
+        silence = np.zeros(STT_RATE // 10, dtype="int16")
+        futs = self._warm = [self.submit(silence, STT_RATE) for _ in range(self.workers)]
+        if wait:
+            for f in futs:
+                f.result(self.timeout * 4)  # first load reads the model from disk
+        return futs
+
+    def state(self) -> str:
+        """"cold", "loading", "ready" or "error: ..." for the last warm_up()."""
+        return _futures_state(self._warm)
+
+    def health(self, timeout=5.0) -> dict:
+        """Ping the workers; a broken pool is replaced."""
+        try:
+            pids = {f.result(timeout) for f in [self._pool.submit(_stt_worker_ping) for _ in range(self.workers)]}
+            return {"ok": True, "workers": self.workers, "pids": sorted(pids), "restarts": self.restarts}
+        except Exception as e:
+            self._restart()
+            return {"ok": False, "error": str(e), "workers": self.workers, "restarts": self.restarts}
+
+    def stats(self) -> dict:
+        out = {"requests": len(self.timings)}
+        for k in ("queue_ms", "decode_ms", "total_ms"):
+            vals = sorted(t[k] for t in self.timings)
+            out[k] = {"p50": round(_pct(vals, 0.5), 1), "p95": round(_pct(vals, 0.95), 1)}
+        return out
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
 
 # ---- TTS (Offline) ----
+TTS_RATE = 180
 _tts_engine = None
 
 def _tts():
     global _tts_engine
     if _tts_engine is None:
+        import pyttsx3
         _tts_engine = pyttsx3.init()
         # tweak rate/voice here if you like
-        _tts_engine.setProperty("rate", 180)
+        _tts_engine.setProperty("rate", TTS_RATE)
     return _tts_engine
 
-def tts_save_wav(text: str, out_path: str):
+@traced("tts.synthesize")
+def _synthesize(text: str, voice=None, rate=TTS_RATE) -> bytes:
     eng = _tts()
-    eng.save_to_file(text, out_path)
-    eng.runAndWait()
+    eng.setProperty("rate", rate)
+    if voice:
+        eng.setProperty("voice", voice)
+    # pyttsx3 can only render to a file, so this is the one disk round-trip left
+    with tempfile.TemporaryDirectory() as td:
+        out = os.path.join(td, "tts.wav")
+        eng.save_to_file(text, out)
+        eng.runAndWait()
+        with open(out, "rb") as f:
+            return f.read()
+
+# ---- TTS cache ----
+# Replays are common (kids press "speak" again and again), so finished WAVs
+# are kept in an in-memory LRU backed by a size-bounded directory on disk.
+TTS_CACHE_DIR = os.environ.get("BUDDY_TTS_CACHE", os.path.join(".buddy_cache", "tts"))
+TTS_DISK_MAX_BYTES = 200 * 1024 * 1024
+_tts_memory = LRU(max_entries=256, max_bytes=32 * 1024 * 1024)
+_tts_disk_lock = threading.Lock()
+_tts_disk_writes = 0
+
+def tts_key(text: str, voice=None, rate=TTS_RATE) -> str:
+    blob = json.dumps({"text": text, "voice": voice, "rate": rate}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+def _disk_path(key):
+    return os.path.join(TTS_CACHE_DIR, key[:2], key + ".wav")
+
+def _disk_get(key):
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path)  # mtime doubles as last-used time for eviction
+    except OSError:
+        pass
+    return data
+
+def _disk_put(key, data):
+    global _tts_disk_writes
+    path = _disk_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    with _tts_disk_lock:
+        _tts_disk_writes += 1
+        if _tts_disk_writes % 50 == 0:
+            _disk_prune()
+
+def _disk_prune():
+    files = []
+    for root, _, names in os.walk(TTS_CACHE_DIR):
+        for n in names:
+            if n.endswith(".wav"):
+                p = os.path.join(root, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+    total = sum(f[1] for f in files)
+    for _, size, p in sorted(files):
+        if total <= TTS_DISK_MAX_BYTES:
+            break
+        try:
+            os.remove(p)
+            total -= size
+        except OSError:
+            pass
+
+def tts_cached(text: str, voice=None, rate=TTS_RATE):
+    """Cached WAV bytes for this text/voice/rate, or None."""
+    key = tts_key(text, voice, rate)
+    data = _tts_memory.get(key)
+    if data is None:
+        data = _disk_get(key)
+        if data is not None:
+            _tts_memory.put(key, data)
+    return data
+
+def _tts_store(key, data):
+    _tts_memory.put(key, data)
+    _disk_put(key, data)
+
+# ---- TTS worker ----
+# pyttsx3 engines aren't safe to drive from several threads and runAndWait()
+# blocks, so one worker thread owns the engine and serves a priority queue.
+# Speak requests jump ahead of speculative pre-synthesis.
+TTS_SPEAK, TTS_PRESYNTH = 0, 1
+
+class _TTSWorker:
+    def __init__(self):
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._pending = {}  # key -> Future, so repeated requests share one synthesis
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="buddy-tts", daemon=True)
+        self._thread.start()
+
+    def submit(self, text, voice=None, rate=TTS_RATE, priority=TTS_SPEAK) -> Future:
+        key = tts_key(text, voice, rate)
+        with self._lock:
+            fut = self._pending.get(key)
+            if fut is None:
+                data = tts_cached(text, voice, rate)
+                fut = Future()
+                if data is not None:
+                    fut.set_result(data)
+                    return fut
+                self._pending[key] = fut
+            # queued again at a better priority if someone is now waiting on it;
+            # the worker skips the stale entry once the future is done
+            self._queue.put((priority, next(self._order), key, text, voice, rate, fut))
+        return fut
+
+    def warm(self) -> Future:
+        """Load the engine on the worker thread ahead of the first request."""
+        fut = Future()
+        self._queue.put((TTS_SPEAK, next(self._order), None, None, None, None, fut))
+        return fut
+
+    def _run(self):
+        try:
+            # SAPI5 on Windows is COM-based and needs initialising on the thread that uses it
+            import pythoncom
+            pythoncom.CoInitialize()
+        except ImportError:
+            pass
+        while True:
+            _, _, key, text, voice, rate, fut = self._queue.get()
+            if fut.done():
+                continue
+            if key is None:
+                try:
+                    _tts()
+                    fut.set_result(None)
+                except Exception as e:
+                    fut.set_exception(e)
+                continue
+            try:
+                data = _synthesize(text, voice, rate)
+                _tts_store(key, data)
+                fut.set_result(data)
+            except Exception as e:
+                fut.set_exception(e)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+_tts_worker = None
+_tts_worker_lock = threading.Lock()
+
+def _worker():
+    global _tts_worker
+    if _tts_worker is None:
+        with _tts_worker_lock:
+            if _tts_worker is None:
+                _tts_worker = _TTSWorker()
+    return _tts_worker
+
+def tts_submit(text: str, voice=None, rate=TTS_RATE) -> Future:
+    """Queue a synthesis; the future resolves to WAV bytes."""
+    return _worker().submit(text, voice, rate, TTS_SPEAK)
+
+def tts_presynthesize(text: str, voice=None, rate=TTS_RATE) -> Future:
+    """Synthesize in the background so a later speak request is a cache hit."""
+    return _worker().submit(text, voice, rate, TTS_PRESYNTH)
+
+@traced("tts.wav_bytes")
+def tts_wav_bytes(text: str, voice=None, rate=TTS_RATE, timeout=60.0) -> bytes:
+    """WAV bytes for `text`, synthesized on the TTS worker only on a cache miss."""
+    data = tts_cached(text, voice, rate)
+    if data is None:
+        data = tts_submit(text, voice, rate).result(timeout)
+    return data
+
+@traced("tts.save_wav")
+def tts_save_wav(text: str, out_path: str):
+    with open(out_path, "wb") as f:
+        f.write(tts_wav_bytes(text))
     return out_path
+
+# ---- Voice warm-up ----
+# Called when voice mode is switched on: the TTS engine loads on its worker
+# thread and the STT workers load Vosk in their processes, while the page
+# keeps rendering. voice_status() reports how far each has got.
+_tts_warm = None
+
+def _futures_state(futs) -> str:
+    if not futs:
+        return "cold"
+    if not all(f.done() for f in futs):
+        return "loading"
+    for f in futs:
+        if f.exception() is not None:
+            return f"error: {f.exception()}"
+    return "ready"
+
+def warm_up_tts() -> Future:
+    global _tts_warm
+    if _tts_warm is None or (_tts_warm.done() and _tts_warm.exception() is not None):
+        _tts_warm = _worker().warm()
+    return _tts_warm
+
+def voice_status(stt_service=None) -> dict:
+    """{"tts": state, "stt": state}; states are cold/loading/ready/error: ..."""
+    return {"tts": _futures_state([_tts_warm] if _tts_warm else None),
+            "stt": stt_service.state() if stt_service is not None else "cold"}
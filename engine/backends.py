@@ -0,0 +1,281 @@
+import codecs, json, queue, re, socket, subprocess, threading, time, http.client
+from urllib.parse import urlsplit
+
+# ---- LLM backends ----
+# Each backend exposes generate(prompt, options) -> str and token generators
+# stream(prompt, options) and chat_stream(messages, options, stats). model.py
+# picks one and keeps it alive for the whole process. `ident` says which
+# server or executable answers, so cached replies never cross backends.
+
+# A stream the caller stops early (a JSON object that already closed) is read
+# to its end if that takes at most DRAIN_BYTES and DRAIN_TIMEOUT seconds, so
+# its connection can go back to the pool. Longer tails close the connection,
+# which also stops the generation.
+DRAIN_BYTES = 16384
+DRAIN_TIMEOUT = 0.25
+
+def flatten_messages(messages):
+    """Chat messages as one plain prompt, for backends without a chat API."""
+    lines = [f"{m['role'].capitalize()}: {m['content']}" for m in messages]
+    return "\n\n".join(lines + ["Assistant:"])
+
+def split_options(options):
+    """Ollama request fields for `options`: "format" is a top-level field, the rest are model options."""
+    opts = dict(options)
+    out = {"format": opts.pop("format")} if "format" in opts else {}
+    if opts:
+        out["options"] = opts
+    return out
+
+def ollama_payload(model, keep_alive, prompt, options, stream, messages=None):
+    """Request body for /api/generate, or for /api/chat when `messages` is given."""
+    payload = {"model": model, "stream": stream, "keep_alive": keep_alive}
+    if messages is None:
+        payload["prompt"] = prompt
+    else:
+        payload["messages"] = messages
+    if options:
+        payload.update(split_options(options))
+    return payload
+
+class SubprocessBackend:
+    """One `ollama run` process per call (the original behaviour)."""
+    name = "subprocess"
+
+    def __init__(self, exe, model, timeout=None):
+        self.exe = exe
+        self.model = model
+        self.timeout = timeout
+        self.ident = f"subprocess:{exe}"
+
+    def generate(self, prompt, options=None):
+        proc = subprocess.run([self.exe, "run", self.model], input=prompt.encode(),
+                              capture_output=True, timeout=self.timeout)
+        return proc.stdout.decode().strip()
+
+    def stream(self, prompt, options=None):
+        proc = subprocess.Popen([self.exe, "run", self.model], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        dec = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            proc.stdin.write(prompt.encode())
+            proc.stdin.close()
+            while True:
+                buf = proc.stdout.read1(256)
+                if not buf:
+                    break
+                tok = dec.decode(buf)
+                if tok:
+                    yield tok
+            tail = dec.decode(b"", final=True)
+            if tail:
+                yield tail
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+    def chat_stream(self, messages, options=None, stats=None):
+        return self.stream(flatten_messages(messages), options)
+
+    def close(self):
+        pass
+
+
+class HTTPBackend:
+    """Talks to `ollama serve` over a pool of keep-alive HTTP connections."""
+    name = "http"
+
+    def __init__(self, url, model, keep_alive="30m", connect_timeout=5.0,
+                 read_timeout=120.0, pool_size=4, drain_bytes=DRAIN_BYTES, drain_timeout=DRAIN_TIMEOUT):
+        parts = urlsplit(url if "://" in url else "http://" + url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 11434
+        self.ident = f"http://{self.host}:{self.port}"
+        self.model = model
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.drain_bytes = drain_bytes
+        self.drain_timeout = drain_timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    # -- connection pool --
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _connect(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _request(self, path, payload):
+        """POST JSON on a pooled connection; returns (conn, response) with headers read."""
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        conn = self._acquire()
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError, http.client.CannotSendRequest):
+                # the server dropped an idle pooled connection; retry once on a fresh one
+                conn.close()
+                if not reused:
+                    raise
+                conn, reused = None, False
+                continue
+            except (socket.timeout, OSError):
+                conn.close()
+                raise
+            break
+        if resp.status != 200:
+            data = resp.read()
+            self._finish(conn, resp)
+            raise RuntimeError(f"Ollama returned {resp.status}: {data[:200].decode(errors='replace')}")
+        return conn, resp
+
+    def _finish(self, conn, resp):
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+    def _post(self, path, payload):
+        conn, resp = self._request(path, payload)
+        try:
+            data = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        self._finish(conn, resp)
+        return json.loads(data)
+
+    def _stream(self, path, payload):
+        """Yield decoded NDJSON messages as Ollama streams them."""
+        conn, resp = self._request(path, payload)
+        done = False
+        try:
+            for line in resp:
+                if not line.strip():
+                    continue
+                msg = json.loads(line)
+                if msg.get("error"):
+                    raise RuntimeError(f"Ollama error: {msg['error']}")
+                yield msg
+                if msg.get("done"):
+                    resp.read()  # drain the chunked trailer so the connection can be reused
+                    done = True
+                    break
+        except GeneratorExit:
+            done = self._drain(conn, resp)  # the consumer stopped early
+            raise
+        finally:
+            # unread bytes would be taken for the next reply; don't pool that socket
+            if done:
+                self._finish(conn, resp)
+            else:
+                conn.close()
+
+    def _drain(self, conn, resp):
+        """Read the rest of a stream if it ends within the drain budget."""
+        deadline = time.monotonic() + self.drain_timeout
+        left = self.drain_bytes
+        try:
+            conn.sock.settimeout(self.drain_timeout)
+            for line in resp:
+                left -= len(line)
+                if left < 0 or time.monotonic() > deadline:
+                    return False
+            conn.sock.settimeout(self.read_timeout)
+            return True
+        except (OSError, http.client.HTTPException):
+            return False
+
+    def _payload(self, prompt, options, stream, messages=None):
+        return ollama_payload(self.model, self.keep_alive, prompt, options, stream, messages)
+
+    def generate(self, prompt, options=None):
+        return self._post("/api/generate", self._payload(prompt, options, False)).get("response", "").strip()
+
+    def stream(self, prompt, options=None):
+        for msg in self._stream("/api/generate", self._payload(prompt, options, True)):
+            tok = msg.get("response", "")
+            if tok:
+                yield tok
+
+    def chat_stream(self, messages, options=None, stats=None):
+        """Stream a reply over /api/chat. Ollama reuses the KV state of the
+        longest prefix it has already processed, so a chat that only grows
+        at the end pays for the new messages alone. `stats` (a dict) gets
+        the prompt_eval_count/prompt_eval_duration of the final message."""
+        for msg in self._stream("/api/chat", self._payload(None, options, True, messages)):
+            tok = msg.get("message", {}).get("content", "")
+            if tok:
+                yield tok
+            if msg.get("done") and stats is not None:
+                stats.update({k: msg[k] for k in ("prompt_eval_count", "prompt_eval_duration") if k in msg})
+
+    def close(self):
+        while True:
+            conn = self._acquire()
+            if conn is None:
+                break
+            conn.close()
+
+
+class FakeBackend:
+    """In-process stand-in for tests and offline demos.
+
+    `responder` may be a callable prompt -> str, a list of canned replies
+    (cycled) or a fixed string.
+    """
+    name = "fake"
+    ident = "fake"
+
+    def __init__(self, responder=None):
+        self._lock = threading.Lock()
+        self._i = 0
+        self.responder = responder
+        self.calls = []
+
+    def generate(self, prompt, options=None):
+        return "".join(self.stream(prompt, options))
+
+    def stream(self, prompt, options=None):
+        for tok in re.findall(r"\s*\S+", self._reply(prompt)):
+            yield tok
+
+    def chat_stream(self, messages, options=None, stats=None):
+        return self.stream(flatten_messages(messages), options)
+
+    def _reply(self, prompt):
+        with self._lock:
+            self.calls.append(prompt)
+            r = self.responder
+            if callable(r):
+                return r(prompt)
+            if isinstance(r, (list, tuple)):
+                out = r[self._i % len(r)]
+                self._i += 1
+                return out
+            if r is None:
+                return '{"question": "What is 2 + 3?", "correct": true, "feedback": "Nice!", "next_question": "What is 4 + 3?"}'
+            return r
+
+    def close(self):
+        pass
@@ -0,0 +1,292 @@
+import argparse, io, json, os, platform, random, shutil, sqlite3, subprocess, sys, tempfile, time
+
+# ---- Micro-benchmarks ----
+# python -m engine.bench [--quick] [--only db.] [--out bench.json] [--baseline old.json]
+#
+# Every case runs offline: databases and packs are synthesized in a temp dir,
+# the LLM path uses FakeBackend, and STT is skipped when Vosk or its model is
+# missing. Results are written as JSON so two runs can be compared.
+
+VOSK_MODEL = "models/vosk-model-small-en-us-0.15"
+REGRESSION = 0.10  # slower than baseline by more than this counts as a regression
+
+_cases = []
+
+
+def bench(name, sizes, quick=None):
+    """Register fn(size, workdir) -> (callable, ops_per_call). Timed per op."""
+    def wrap(fn):
+        _cases.append((name, sizes, quick or sizes[:1], fn))
+        return fn
+    return wrap
+
+
+class Skip(Exception):
+    pass
+
+
+def _pct(vals, q):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))]
+
+
+def measure(run, ops=1, repeat=5, min_time=0.2):
+    """Time run() `repeat` times (each at least `min_time` s); stats are per op in µs."""
+    loops = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(loops):
+            run()
+        dt = time.perf_counter() - t
+        if dt >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if dt == 0 else max(2, min(10, int(min_time / dt) + 1))
+    samples = [dt / (loops * ops)]
+    for _ in range(repeat - 1):
+        t = time.perf_counter()
+        for _ in range(loops):
+            run()
+        samples.append((time.perf_counter() - t) / (loops * ops))
+    us = [s * 1e6 for s in samples]
+    return {"median_us": round(_pct(us, 0.5), 3), "p95_us": round(_pct(us, 0.95), 3),
+            "min_us": round(min(us), 3), "ops_per_s": round(1e6 / _pct(us, 0.5), 1),
+            "loops": loops, "repeat": repeat}
+
+
+# ---- Synthetic data ----
+SUBJECT = "Bench"
+
+def make_db(path, events, learners=50, skills=500, seed=0):
+    """A database with `events` answer events spread over learners and skills."""
+    from engine.storage import DB
+    rnd = random.Random(seed)
+    db = DB(path)
+    db.insert_skills((SUBJECT, f"T{i // 25:04d}", f"S{i:06d}") for i in range(skills))
+    with db._pool.connection() as conn:
+        conn.executemany("INSERT INTO learners(id, name, lang, created_at) VALUES(?,?,?,?)",
+                         ((i, f"L{i}", "English", 0) for i in range(1, learners + 1)))
+        now = int(time.time())
+        def rows():
+            for n in range(events):
+                ok = rnd.random() < 0.7
+                yield (rnd.randint(1, learners), rnd.randint(1, skills), "answer",
+                       '{"correct": true}' if ok else '{"correct": false}', now - events + n)
+        conn.executemany("INSERT INTO events(learner_id, skill_id, kind, data, created_at) VALUES(?,?,?,?,?)",
+                         rows())
+        conn.executemany("INSERT OR IGNORE INTO progress(learner_id, skill_id, status, streak_correct, last_seen) "
+                         "VALUES(?,?,?,?,?)",
+                         ((rnd.randint(1, learners), rnd.randint(1, skills), rnd.choice(["Learning", "Practicing"]),
+                           rnd.randint(0, 5), now) for _ in range(min(events, learners * skills))))
+        conn.commit()
+    db.rebuild_learner_stats()
+    db.rebuild_rollups()
+    return db
+
+
+_db_cache = {}
+
+def synthetic_db(workdir, events):
+    """Built once per size per run; the DB-building itself isn't timed."""
+    if events not in _db_cache:
+        _db_cache[events] = make_db(os.path.join(workdir, f"events_{events}.db"), events)
+    return _db_cache[events]
+
+
+# ---- Cases ----
+EVENT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+@bench("db.bump_progress", EVENT_SIZES, quick=[10_000])
+def _bump(events, workdir):
+    db, rnd = synthetic_db(workdir, events), random.Random(1)
+    return lambda: db.bump_progress(rnd.randint(1, 50), rnd.randint(1, 500), rnd.random() < 0.7), 1
+
+@bench("db.log_event", EVENT_SIZES, quick=[10_000])
+def _log(events, workdir):
+    db, rnd = synthetic_db(workdir, events), random.Random(2)
+    return lambda: db.log_event(rnd.randint(1, 50), rnd.randint(1, 500), "answer", '{"correct": true}'), 1
+
+@bench("db.learner_stats", EVENT_SIZES, quick=[10_000])
+def _stats(events, workdir):
+    db, rnd = synthetic_db(workdir, events), random.Random(3)
+    return lambda: db.learner_stats(rnd.randint(1, 50)), 1
+
+@bench("db.streak_correct", EVENT_SIZES, quick=[10_000])
+def _streak(events, workdir):
+    db, rnd = synthetic_db(workdir, events), random.Random(4)
+    return lambda: db.streak_correct(rnd.randint(1, 50)), 1
+
+@bench("db.skill_accuracy", EVENT_SIZES, quick=[10_000])
+def _skill_acc(events, workdir):
+    db = synthetic_db(workdir, events)
+    return lambda: db.skill_accuracy(SUBJECT, 30), 1
+
+@bench("db.struggling_learners", EVENT_SIZES, quick=[10_000])
+def _struggling(events, workdir):
+    db = synthetic_db(workdir, events)
+    return lambda: db.struggling_learners(14), 1
+
+@bench("db.activity", EVENT_SIZES, quick=[10_000])
+def _activity(events, workdir):
+    db = synthetic_db(workdir, events)
+    return lambda: db.activity(30), 1
+
+@bench("skillmap.build_skill_graph_dot", [1_000, 10_000], quick=[1_000])
+def _graph(skills, workdir):
+    from engine.storage import DB
+    from engine.skillmap import build_skill_graph_dot
+    db = DB(os.path.join(workdir, f"graph_{skills}.db"))
+    db.insert_skills((SUBJECT, f"T{i // 20:04d}", f"S{i:06d}") for i in range(skills))
+    return lambda: build_skill_graph_dot(db, 1, SUBJECT), 1
+
+@bench("curriculum.merge_pack_into_db", [5_000, 50_000], quick=[5_000])
+def _merge(skills, workdir):
+    from engine.storage import DB
+    from engine.curriculum import merge_pack_into_db
+    pack = {"subject": SUBJECT, "skills": [{"topic": f"T{i // 20}", "subtopic": f"S{i}"} for i in range(skills)]}
+    n = iter(range(1 << 30))
+    def run():
+        # a fresh file each call so every run inserts the whole pack
+        db = DB(os.path.join(workdir, f"merge_{skills}_{next(n)}.db"))
+        merge_pack_into_db(db, pack)
+        db._pool.close()
+    return run, skills
+
+@bench("curriculum.import_pack", [50_000], quick=[5_000])
+def _import(skills, workdir):
+    from engine.storage import DB
+    from engine.curriculum import import_pack
+    data = json.dumps({"subject": SUBJECT, "skills": [{"topic": f"T{i // 20}", "subtopic": f"S{i}"}
+                                                      for i in range(skills)]}).encode()
+    n = iter(range(1 << 30))
+    def run():
+        db = DB(os.path.join(workdir, f"import_{skills}_{next(n)}.db"))
+        import_pack(db, io.BytesIO(data))
+        db._pool.close()
+    return run, skills
+
+@bench("safety.check_user_input", [10, 5_000], quick=[10])
+def _safety(terms, workdir):
+    from engine import safety
+    rnd = random.Random(5)
+    extra = ["".join(rnd.choice("abcdefghijklmnop") for _ in range(rnd.randint(4, 10))) for _ in range(terms)]
+    safety.reload(safety.BLOCKLIST + extra, paths=[])
+    texts = ["I think the answer is 7 because 3 plus 4 makes seven",
+             "Plants need water and sunlight to grow tall and strong",
+             "My terrier lives in Essex and likes to read short vowel words"] * 10
+    return lambda: [safety.check_user_input(t) for t in texts], len(texts)
+
+@bench("audio.stt_transcribe_wav", [5], quick=[5])
+def _stt(seconds, workdir):
+    import wave
+    try:
+        from engine.audio import stt_transcribe_wav, _get_vosk_model
+        _get_vosk_model(VOSK_MODEL)
+    except Exception as e:  # vosk not installed or no model on disk
+        raise Skip(str(e) or type(e).__name__)
+    import numpy as np
+    rate = 16000
+    t = np.arange(seconds * rate) / rate
+    sig = (0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 2 * t) > 0)
+           + 0.02 * np.random.default_rng(0).standard_normal(t.size))
+    path = os.path.join(workdir, "tone.wav")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1); w.setsampwidth(2); w.setframerate(rate)
+        w.writeframes((sig * 32767).astype("<i2").tobytes())
+    return lambda: stt_transcribe_wav(path, VOSK_MODEL), 1
+
+@bench("model.ask_llm_json", [1, 3], quick=[1])
+def _llm_json(chatter, workdir):
+    from engine import model
+    from engine.backends import FakeBackend
+    from engine.schemas import AnswerEval
+    reply = ("Sure! Here is the result.\n```json\n"
+             '{"correct": true, "feedback": "Nice work, 3 + 4 is 7.", "next_question": "What is 5 + 2?"}'
+             "\n```\n" + "Let me know if you need more help. " * chatter * 20)
+    model.set_backend(FakeBackend(reply))
+    return lambda: model.ask_llm_json("Judge.", "Question: 3+4\nStudent answer: 7", "{}",
+                                      cache=False, schema=AnswerEval), 1
+
+
+# ---- Runner ----
+def _meta():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        rev = None
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version, "git": rev, "time": int(time.time())}
+
+
+def run(only=None, quick=False, repeat=5, min_time=0.2, sizes=None, log=print):
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="buddy-bench-")
+    try:
+        for name, all_sizes, quick_sizes, fn in _cases:
+            if only and not any(o in name for o in only):
+                continue
+            for size in (sizes or {}).get(name) or (quick_sizes if quick else all_sizes):
+                key = f"{name}[{size}]"
+                try:
+                    call, ops = fn(size, workdir)
+                    res = measure(call, ops, repeat, min_time)
+                except Skip as e:
+                    res = {"skipped": str(e)}
+                results[key] = res
+                log(f"{key:45s} " + (f"skipped: {res['skipped']}" if "skipped" in res else
+                                     f"{res['median_us']:>12.2f} µs/op  (p95 {res['p95_us']:.2f})"))
+    finally:
+        for db in _db_cache.values():
+            db.close()
+        _db_cache.clear()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"meta": _meta(), "results": results}
+
+
+def compare(current, baseline, threshold=REGRESSION):
+    """[(key, base_us, now_us, ratio, regressed)] for cases present in both runs."""
+    rows = []
+    for key, res in current["results"].items():
+        old = baseline.get("results", {}).get(key)
+        if not old or "median_us" not in res or "median_us" not in old:
+            continue
+        ratio = res["median_us"] / old["median_us"] if old["median_us"] else float("inf")
+        rows.append((key, old["median_us"], res["median_us"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engine.bench")
+    ap.add_argument("--only", action="append", help="run cases whose name contains this (repeatable)")
+    ap.add_argument("--quick", action="store_true", help="smallest size of each case only")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--min-time", type=float, default=0.2, help="seconds per timed sample")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="compare against a previous results JSON")
+    ap.add_argument("--threshold", type=float, default=REGRESSION)
+    ap.add_argument("--fail-on-regression", action="store_true")
+    ap.add_argument("--list", action="store_true", help="list cases and sizes")
+    args = ap.parse_args(argv)
+
+    if args.list:
+        for name, sizes, quick, _ in _cases:
+            print(f"{name:35s} sizes={sizes} quick={quick}")
+        return 0
+
+    out = run(args.only, args.quick, args.repeat, args.min_time)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(out, f, indent=2)
+        print(f"Wrote {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(out, json.load(f), args.threshold)
+        print(f"\n{'case':45s} {'baseline':>12s} {'now':>12s} {'ratio':>7s}")
+        for key, old, new, ratio, bad in rows:
+            print(f"{key:45s} {old:>12.2f} {new:>12.2f} {ratio:>6.2f}x{'  REGRESSION' if bad else ''}")
+        if args.fail_on_regression and any(r[4] for r in rows):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import hashlib, json, sqlite3, threading, time
+from collections import OrderedDict
+
+# ---- Response cache ----
+# Two tiers: an in-memory LRU in front of a SQLite table that survives
+# restarts. Entries expire after `ttl` seconds and the disk tier is trimmed
+# back to `disk_max_entries` by least-recent use.
+
+def cache_key(model: str, prompt: str, options=None, backend="") -> str:
+    blob = json.dumps({"backend": backend, "model": model, "prompt": prompt, "options": options or {}},
+                      sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class LRU:
+    """Thread-safe LRU bounded by entry count and, optionally, total size."""
+
+    def __init__(self, max_entries=512, max_bytes=None, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        return self.sizeof(value) if self.max_bytes else 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self.bytes -= self._size(self._data.pop(key))
+            self._data[key] = value
+            self.bytes += self._size(value)
+            while self._data and (len(self._data) > self.max_entries or
+                                  (self.max_bytes and self.bytes > self.max_bytes)):
+                _, old = self._data.popitem(last=False)
+                self.bytes -= self._size(old)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self.bytes -= self._size(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LLMCache:
+    def __init__(self, path="llm_cache.db", max_entries=1024, disk_max_entries=50000,
+                 ttl=7 * 24 * 3600, prune_every=200):
+        self.memory = LRU(max_entries)
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self.prune_every = prune_every
+        self.hits = self.misses = self.memory_hits = self.disk_hits = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_cache(
+                                key TEXT PRIMARY KEY,
+                                response TEXT,
+                                created_at INTEGER,
+                                last_used INTEGER);
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used);
+            """)
+            self.conn.commit()
+
+    def get(self, key):
+        now = int(time.time())
+        hit = self.memory.get(key)
+        if hit is not None:
+            value, created = hit
+            if now - created <= self.ttl:
+                self._count(memory=True)
+                return value
+            self.memory.pop(key)
+        row = None
+        if self.conn is not None:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT response, created_at, last_used FROM llm_cache WHERE key=?", (key,)
+                ).fetchone()
+                if row and now - row[1] > self.ttl:
+                    row = None
+                elif row and now - row[2] > 60:
+                    # only touch last_used once a minute so hot keys don't write on every read
+                    self.conn.execute("UPDATE llm_cache SET last_used=? WHERE key=?", (now, key))
+                    self.conn.commit()
+        if row is None:
+            self._count()
+            return None
+        self.memory.put(key, (row[0], row[1]))
+        self._count(disk=True)
+        return row[0]
+
+    def put(self, key, value: str, disk=True):
+        """Store a reply; `disk=False` keeps it in the memory tier only."""
+        now = int(time.time())
+        self.memory.put(key, (value, now))
+        if self.conn is None or not disk:
+            return
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, response, created_at, last_used) VALUES(?,?,?,?)",
+                (key, value, now, now)
+            )
+            self._puts += 1
+            if self._puts % self.prune_every == 0:
+                self._prune(now)
+            self.conn.commit()
+
+    def _prune(self, now):
+        self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        n = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if n > self.disk_max_entries:
+            self.conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)",
+                (n - self.disk_max_entries,)
+            )
+
+    def _count(self, memory=False, disk=False):
+        with self._lock:
+            if memory or disk:
+                self.hits += 1
+                self.memory_hits += memory
+                self.disk_hits += disk
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "memory_hits": self.memory_hits, "disk_hits": self.disk_hits,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "memory_entries": len(self.memory)}
+
+    def clear(self):
+        self.memory.clear()
+        if self.conn is not None:
+            with self._lock:
+                self.conn.execute("DELETE FROM llm_cache")
+                self.conn.commit()
@@ -1,17 +1,227 @@
-import json
+import argparse, codecs, json, os
+
+# ---- Curriculum packs ----
+# {"subject": ..., "version": ..., "skills": [{"topic": ..., "subtopic": ...}, ...]}
+# Packs are parsed incrementally so the raw JSON never sits in memory whole;
+# only the validated (subject, topic, subtopic) rows are kept. Once the whole
+# pack has parsed they are imported with one executemany in a single
+# transaction, so a pack lands completely or not at all.
+
+BUNDLED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "curriculum")
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+
+
+class _Stream:
+    """Buffered reader over a text or binary file for piecewise JSON decoding."""
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        raw = self.fp.read(self.chunk_size)
+        text = self._utf8.decode(raw, final=not raw) if isinstance(raw, bytes) else raw
+        if not raw:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or "" at end of input."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f"Invalid curriculum pack: expected {ch!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # a number (or literal) at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_pack(fp, chunk_size=CHUNK_SIZE, header=None):
+    """Yield (subject, skill) pairs from a pack without loading it whole.
+
+    `skill` is the raw list entry and is not validated here. Skills listed
+    before the "subject" key are held back until the subject is known.
+    Top-level fields other than "skills" are stored in `header` if given.
+    """
+    s = _Stream(fp, chunk_size)
+    subject, held = None, []
+    s.expect("{")
+    if s.peek() == "}":
+        s.pos += 1
+    else:
+        while True:
+            key = s.value()
+            s.expect(":")
+            if key == "skills":
+                s.expect("[")
+                if s.peek() == "]":
+                    s.pos += 1
+                else:
+                    while True:
+                        sk = s.value()
+                        if subject is None:
+                            held.append(sk)
+                        else:
+                            yield subject, sk
+                        if s.peek() == ",":
+                            s.pos += 1
+                            continue
+                        s.expect("]")
+                        break
+            else:
+                val = s.value()
+                if header is not None:
+                    header[key] = val
+                if key == "subject":
+                    if not isinstance(val, str) or not val.strip():
+                        raise ValueError("Invalid curriculum pack: bad subject")
+                    subject = val
+                    for sk in held:
+                        yield subject, sk
+                    held = []
+            if s.peek() == ",":
+                s.pos += 1
+                continue
+            s.expect("}")
+            break
+    if subject is None:
+        raise ValueError("Invalid curriculum pack: missing subject")
+
+
+def _skill_row(subject, sk):
+    """(subject, topic, subtopic) or None if the entry is malformed."""
+    if not isinstance(sk, dict):
+        return None
+    topic, sub = sk.get("topic"), sk.get("subtopic")
+    if not isinstance(topic, str) or not isinstance(sub, str) or not topic.strip() or not sub.strip():
+        return None
+    return subject.strip(), topic.strip(), sub.strip()
+
+
+def _import_rows(db, pairs, header):
+    report = {"subject": None, "inserted": 0, "skipped": 0, "invalid": 0}
+    rows = []
+    for subject, sk in pairs:
+        row = _skill_row(subject, sk)
+        if row is None:
+            report["invalid"] += 1
+        else:
+            rows.append(row)
+    report["subject"] = header["subject"].strip()  # declared even if the pack has no skills
+    report["inserted"] = db.insert_skills(rows)
+    report["skipped"] = len(rows) - report["inserted"]  # already in the DB or repeated in the pack
+    return report
+
 
 def load_pack(fp) -> dict:
     data = json.load(fp)
     #minimal validation
-    subj = data.get("subject")
-    skills = data.get("skills", [])
-    assert subj and isinstance(skills, list), "Invalid curriculum pack"
+    subj = data.get("subject") if isinstance(data, dict) else None
+    skills = data.get("skills", []) if isinstance(data, dict) else None
+    if not subj or not isinstance(skills, list):
+        raise ValueError("Invalid curriculum pack")
     return data
 
-def merge_pack_into_db(db, pack: dict):
-    subject = pack["subject"]
-    for sk in pack["skills"]:
-        topic = sk["topic"]; sub = sk["subtopic"]
-        # Insert if not exists
-        if not db.skill_exists(subject, topic, sub):
-            db.insert_skill(subject, topic, sub)
\ No newline at end of file
+
+def merge_pack_into_db(db, pack: dict) -> dict:
+    """Import an already-loaded pack; returns an import report."""
+    return _import_rows(db, ((pack["subject"], sk) for sk in pack["skills"]), pack)
+
+
+def import_pack(db, fp, chunk_size=CHUNK_SIZE) -> dict:
+    """Stream one pack from an open file into the DB in a single transaction.
+
+    Returns {"subject", "inserted", "skipped", "invalid"}; a pack that fails
+    to parse raises ValueError and leaves the DB untouched.
+    """
+    header = {}
+    return _import_rows(db, iter_pack(fp, chunk_size, header), header)
+
+
+def import_dir(db, path=BUNDLED_DIR) -> dict:
+    """Import every *.json pack in a directory, one transaction per pack.
+
+    A broken pack is reported under "errors" and does not stop the others.
+    """
+    total = {"packs": 0, "inserted": 0, "skipped": 0, "invalid": 0, "errors": {}, "files": {}}
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(path, name), "rb") as fp:
+                rep = import_pack(db, fp)
+        except (OSError, ValueError) as e:
+            total["errors"][name] = str(e)
+            continue
+        total["files"][name] = rep
+        total["packs"] += 1
+        for k in ("inserted", "skipped", "invalid"):
+            total[k] += rep[k]
+    return total
+
+
+def seed_bundled(db) -> dict:
+    """Load the packs shipped in app/curriculum; already-present skills are skipped."""
+    return import_dir(db, BUNDLED_DIR)
+
+
+# ---- Import CLI ----
+# python -m engine.curriculum [--db buddy.db] PACK_OR_DIR ...
+
+def main(argv=None):
+    from engine.storage import DB
+    ap = argparse.ArgumentParser(prog="python -m engine.curriculum")
+    ap.add_argument("--db", default="buddy.db")
+    ap.add_argument("paths", nargs="*", default=[BUNDLED_DIR], help="pack files or directories of packs")
+    args = ap.parse_args(argv)
+
+    db = DB(args.db)
+    for path in args.paths:
+        if os.path.isdir(path):
+            rep = import_dir(db, path)
+            for name, err in rep["errors"].items():
+                print(f"{name}: FAILED ({err})")
+            print(f"{path}: {rep['packs']} pack(s), {rep['inserted']} inserted, "
+                  f"{rep['skipped']} skipped, {rep['invalid']} invalid")
+        else:
+            try:
+                with open(path, "rb") as fp:
+                    rep = import_pack(db, fp)
+            except (OSError, ValueError) as e:
+                print(f"{path}: FAILED ({e})")
+                continue
+            print(f"{path}: {rep['inserted']} inserted, {rep['skipped']} skipped, {rep['invalid']} invalid")
+    db.close()
+
+if __name__ == "__main__":
+    main()
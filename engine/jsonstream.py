@@ -0,0 +1,54 @@
+# ---- Incremental JSON extraction ----
+# Watches a token stream for the first top-level JSON object so generation
+# can stop the moment it closes instead of paying for trailing chatter.
+
+class JSONObjectScanner:
+    """Feed text chunks; `done` flips once the first {...} is complete.
+
+    Anything before the opening brace (code fences, "Sure! Here you go")
+    is skipped. Braces inside strings and escaped quotes are handled.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self.started = False
+        self.done = False
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        start = 0
+        for i, ch in enumerate(chunk):
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self._depth = 1
+                    start = i
+                continue
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(chunk[start:i + 1])
+                    self.done = True
+                    return True
+        if self.started:
+            self._parts.append(chunk[start:])
+        return False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
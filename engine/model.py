@@ -1,19 +1,183 @@
-import json, subprocess, textwrap
+import functools, json, os, textwrap, threading, time
+from collections import OrderedDict
+
+from engine.backends import SubprocessBackend, HTTPBackend, FakeBackend
+from engine.cache import LLMCache, cache_key
+from engine.scheduler import Scheduler, INTERACTIVE, NORMAL, BACKGROUND
+from engine.jsonstream import JSONObjectScanner
+from engine.trace import mark, traced
+from pydantic import ValidationError
 
 MODEL = "llama3.1"
 # If you added Ollama to PATH, you can just use "ollama"
 OLLAMA = r"C:\Users\Alin Merchant\AppData\Local\Programs\Ollama\ollama.exe"
 
-def _run_ollama(prompt: str) -> str:
-    proc = subprocess.run([OLLAMA, "run", MODEL], input=prompt.encode(), capture_output=True)
-    return proc.stdout.decode().strip()
+# ---- Backend config ----
+# "http" talks to `ollama serve` over pooled keep-alive connections,
+# "subprocess" spawns `ollama run` per call, "fake" never leaves the process.
+BACKEND = os.environ.get("BUDDY_LLM_BACKEND", "http")
+OLLAMA_URL = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+KEEP_ALIVE = os.environ.get("BUDDY_KEEP_ALIVE", "30m")  # how long Ollama keeps the model resident
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 120.0
+
+# ---- Response cache ----
+# Set BUDDY_LLM_CACHE="" to keep the cache in memory only.
+CACHE_PATH = os.environ.get("BUDDY_LLM_CACHE", "llm_cache.db")
+CACHE_TTL = 7 * 24 * 3600
+
+# ---- Scheduling ----
+# At most MAX_CONCURRENCY generations reach the backend at once; the rest
+# queue by priority (INTERACTIVE > NORMAL > BACKGROUND) and learner.
+MAX_CONCURRENCY = int(os.environ.get("BUDDY_LLM_CONCURRENCY", "2"))
+scheduler = Scheduler(MAX_CONCURRENCY)
+
+# How many times ask_llm_json re-asks for fields that failed schema validation.
+JSON_RETRIES = 1
+# Options for JSON calls. Ollama constrains the reply to one JSON object, so it
+# usually ends right after the object closes and the early stop below can hand
+# the connection back to the pool instead of dropping it. Other backends ignore it.
+JSON_OPTIONS = {"format": "json"}
+
+# ---- Conversations ----
+# Lesson turns run as one chat per learner session: a fixed system message
+# followed by the turns so far. The backend keeps the KV state of the prompt
+# it last processed and reuses the longest matching prefix, so a turn only
+# pays for its new messages. When a chat outgrows CONVO_MAX_CHARS its oldest
+# turns are dropped in one go, down to CONVO_TRIM_TO of the cap, so the
+# prefix stays stable between trims. Idle chats expire after CONVO_TTL and
+# the least recently used go first once all chats together pass CONVO_TOTAL_CHARS.
+CONVO_MAX_CHARS = 16000          # about 4k tokens
+CONVO_TRIM_TO = 0.5
+CONVO_TOTAL_CHARS = 4_000_000
+CONVO_MAX_SESSIONS = 256
+CONVO_TTL = 3600.0
+
+_backend = None
+_backend_lock = threading.Lock()
+_cache = None
+
+def make_backend(name: str):
+    if name == "http":
+        return HTTPBackend(OLLAMA_URL, MODEL, keep_alive=KEEP_ALIVE,
+                           connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT)
+    if name == "subprocess":
+        return SubprocessBackend(OLLAMA, MODEL, timeout=READ_TIMEOUT)
+    if name == "fake":
+        return FakeBackend()
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = make_backend(BACKEND)
+    return _backend
+
+def set_backend(backend):
+    """Swap the process-wide backend; accepts a name or a backend instance."""
+    global _backend
+    if isinstance(backend, str):
+        backend = make_backend(backend)
+    with _backend_lock:
+        old, _backend = _backend, backend
+    if old is not None and old is not backend:
+        old.close()
+    return backend
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _backend_lock:
+            if _cache is None:
+                _cache = LLMCache(CACHE_PATH or None, ttl=CACHE_TTL)
+    return _cache
+
+def cache_stats() -> dict:
+    return get_cache().stats()
+
+@traced("llm.cache_get")
+def cache_lookup(prompt, options, cache):
+    if not cache:
+        return None, None
+    key = cache_key(MODEL, prompt, options, get_backend().ident)
+    return key, get_cache().get(key)
+
+def cache_store(key, value):
+    # replies from the in-process fake (bench and dev runs) never reach the disk tier
+    get_cache().put(key, value, disk=get_backend().name != "fake")
 
-def ask_llm(prompt: str) -> str:
-    return _run_ollama(prompt)
+def scheduler_stats() -> dict:
+    return scheduler.stats()
 
-def ask_llm_json(system_goal: str, user_task: str, schema_hint: str) -> dict:
-    """Ask model to return STRICT JSON. We wrap with clear instructions and fallback parse."""
-    prompt = textwrap.dedent(f"""
+def deadline(timeout):
+    return time.monotonic() + timeout if timeout else None
+
+def _stream_ollama(prompt, options=None, priority=NORMAL, learner=None, timeout=None, cancel=None,
+                   messages=None):
+    """Token stream for `prompt`, or for a chat when `messages` is given."""
+    t0 = time.perf_counter()
+    with scheduler.slot(priority, learner, deadline(timeout), cancel) as ticket:
+        mark("llm.queue", t0)
+        stats = {}
+        if messages is None:
+            tokens = get_backend().stream(prompt, options)
+        else:
+            tokens = get_backend().chat_stream(messages, options, stats)
+        n = 0
+        try:
+            for tok in tokens:
+                ticket.check(cancel)
+                if not n:
+                    mark("llm.first_token", t0)
+                n += 1
+                yield tok
+        finally:
+            tokens.close()  # stops generation and frees the connection promptly
+            mark("llm.stream", t0, tokens=n)
+            if stats.get("prompt_eval_duration"):
+                mark("llm.prompt_eval", time.perf_counter() - stats["prompt_eval_duration"] / 1e9,
+                     tokens=stats.get("prompt_eval_count"))
+
+@traced("llm.generate")
+def _run_ollama(prompt: str, options=None, priority=NORMAL, learner=None, timeout=None, cancel=None) -> str:
+    if timeout or cancel is not None:
+        # stream so a missed deadline or a cancel stops generation between tokens
+        return "".join(_stream_ollama(prompt, options, priority, learner, timeout, cancel)).strip()
+    t0 = time.perf_counter()
+    with scheduler.slot(priority, learner):
+        mark("llm.queue", t0)
+        return get_backend().generate(prompt, options)
+
+def ask_llm(prompt: str, options=None, cache=True, priority=NORMAL, learner=None,
+            timeout=None, cancel=None) -> str:
+    key, hit = cache_lookup(prompt, options, cache)
+    if hit is not None:
+        return hit
+    out = _run_ollama(prompt, options, priority, learner, timeout, cancel)
+    if key and out:
+        cache_store(key, out)
+    return out
+
+def ask_llm_stream(prompt: str, options=None, cache=True, priority=NORMAL, learner=None,
+                   timeout=None, cancel=None):
+    """Yield the completion token by token as the backend produces it."""
+    key, hit = cache_lookup(prompt, options, cache)
+    if hit is not None:
+        yield hit
+        return
+    parts = []
+    for tok in _stream_ollama(prompt, options, priority, learner, timeout, cancel):
+        parts.append(tok)
+        yield tok
+    # only complete generations are cached; a consumer that stops early never gets here
+    out = "".join(parts).strip()
+    if key and out:
+        cache_store(key, out)
+
+def json_prompt(system_goal, user_task, schema_hint):
+    return textwrap.dedent(f"""
     You are Buddy's reasoning engine.
     Goal: {system_goal}
 
@@ -25,12 +189,221 @@ def ask_llm_json(system_goal: str, user_task: str, schema_hint: str) -> dict:
     User task:
     {user_task}
     """).strip()
-    out = _run_ollama(prompt).strip()
-    # best-effort JSON recovery
+
+def json_fix_prompt(system_goal, user_task, schema, failed, obj):
+    """Re-ask prompt for the `failed` fields of an ask_llm_json reply."""
+    fix_task = (f"{user_task}\n\nYour previous answer was: {json.dumps(obj)}\n"
+                f"Fix ONLY these fields: {', '.join(failed)}.")
+    return json_prompt(system_goal, fix_task, _fields_hint(schema, failed))
+
+def chat_json_message(user_task, schema_hint):
+    """The user turn chat_json sends for `user_task`."""
+    return (f"{user_task}\n\nReturn ONLY a JSON object with double-quoted keys/strings, "
+            f"nothing outside it. JSON schema (informal): {schema_hint}")
+
+def chat_fix_messages(messages, raw, schema, failed):
+    """`messages` plus the bad reply and a turn asking to fix the `failed` fields."""
+    fix = (f"Fix ONLY these fields: {', '.join(failed)}. "
+           f"Return ONLY a JSON object: {_fields_hint(schema, failed)}")
+    return messages + [{"role": "assistant", "content": raw}, {"role": "user", "content": fix}]
+
+def parse_json_reply(scanner, raw):
+    """(parsed object or None, raw text) for the tokens in `raw` fed to `scanner`."""
+    raw = "".join(raw).strip()
+    try:
+        return json.loads(scanner.text if scanner.done else raw), raw
+    except ValueError:
+        return None, raw
+
+def _generate_json(prompt, priority, learner, timeout, cancel, messages=None):
+    """Generate until the first JSON object closes. Returns (parsed or None, raw text)."""
+    scanner = JSONObjectScanner()
+    raw = []
+    tokens = _stream_ollama(prompt, JSON_OPTIONS, priority, learner, timeout, cancel, messages)
+    try:
+        for tok in tokens:
+            raw.append(tok)
+            if scanner.feed(tok):
+                break  # a short tail is drained, a long one closed, which stops the model
+    finally:
+        tokens.close()
+    return parse_json_reply(scanner, raw)
+
+def _validate(schema, obj):
+    """Return (validated dict or None, names of top-level fields that failed)."""
     try:
-        # Trim code fences if any
-        if out.startswith("```"):
-            out = out.split("```")[1]
-        return json.loads(out)
-    except Exception:
-        return {"error": True, "raw": out}
\ No newline at end of file
+        return schema.model_validate(obj).model_dump(), []
+    except ValidationError as e:
+        return None, sorted({str(err["loc"][0]) for err in e.errors() if err["loc"]})
+
+def _fields_hint(schema, fields):
+    props = schema.model_json_schema().get("properties", {})
+    return json.dumps({f: props.get(f, {}).get("type", "string") for f in fields})
+
+@functools.lru_cache(maxsize=None)
+def _schema_id(schema):
+    return json.dumps(schema.model_json_schema(), sort_keys=True) if schema is not None else None
+
+def json_cache_options(schema):
+    """Options for an ask_llm_json cache key: what generation runs with, plus the schema."""
+    return {**JSON_OPTIONS, "schema": _schema_id(schema)}
+
+def json_from_cache(hit, schema):
+    """A cached ask_llm_json reply, or None if it doesn't parse or pass `schema`."""
+    try:
+        obj = json.loads(hit)
+    except ValueError:
+        return None
+    if schema is None:
+        return obj if isinstance(obj, dict) else None
+    return _validate(schema, obj)[0]
+
+@traced("llm.json")
+def ask_llm_json(system_goal: str, user_task: str, schema_hint: str, cache=True, schema=None,
+                 priority=NORMAL, learner=None, timeout=None, cancel=None) -> dict:
+    """Ask model to return STRICT JSON. Generation stops as soon as the object closes.
+
+    With a pydantic `schema`, fields that fail validation are re-asked on their own
+    (up to JSON_RETRIES times). On failure the reply carries "error": True and
+    leaves out the bad fields so callers fall back to their defaults. Cached
+    replies are keyed by the schema too and validated again on a hit.
+    """
+    prompt = json_prompt(system_goal, user_task, schema_hint)
+    key, hit = cache_lookup(prompt, json_cache_options(schema), cache)
+    obj = json_from_cache(hit, schema) if hit is not None else None
+    if obj is not None:
+        return obj
+    obj, raw = _generate_json(prompt, priority, learner, timeout, cancel)
+    def refix(failed, obj):
+        return _generate_json(json_fix_prompt(system_goal, user_task, schema, failed, obj),
+                              priority, learner, timeout, cancel)[0]
+    obj = _checked(obj, raw, schema, refix)
+    # only well-formed replies are cached, so a bad generation isn't replayed
+    if key and "error" not in obj:
+        cache_store(key, json.dumps(obj))
+    return obj
+
+def check_json(obj, raw, schema):
+    """Validate a JSON reply. A generator, so sync and async callers share it:
+    it yields (failed fields, obj) for each re-ask and is sent the re-asked
+    object (or None). Returns the valid dict, or what survived with
+    "error": True and the raw text.
+    """
+    if schema is None:
+        return obj if isinstance(obj, dict) else {"error": True, "raw": raw}
+    obj = obj if isinstance(obj, dict) else {}
+    valid, failed = _validate(schema, obj)
+    for _ in range(JSON_RETRIES):
+        if valid is not None:
+            break
+        fix = yield failed, obj
+        if isinstance(fix, dict):
+            obj.update({k: fix[k] for k in failed if k in fix})
+        valid, failed = _validate(schema, obj)
+    if valid is None:
+        out = {k: v for k, v in obj.items() if k not in failed}
+        out.update({"error": True, "raw": raw})
+        return out
+    return valid
+
+def _checked(obj, raw, schema, refix):
+    """check_json, re-asking failed fields via refix(failed, obj)."""
+    checker = check_json(obj, raw, schema)
+    try:
+        ask = next(checker)
+        while True:
+            ask = checker.send(refix(*ask))
+    except StopIteration as done:
+        return done.value
+
+
+class Conversation:
+    """One session's chat: a fixed system message plus (role, text) turns."""
+
+    def __init__(self, system):
+        self.system = system
+        self.turns = []
+        self.chars = len(system)
+        self.used = time.monotonic()
+
+    def messages(self, user=None):
+        msgs = [{"role": "system", "content": self.system}]
+        msgs += [{"role": role, "content": text} for role, text in self.turns]
+        if user is not None:
+            msgs.append({"role": "user", "content": user})
+        return msgs
+
+    def said(self, text) -> bool:
+        """Whether the last reply contains `text`, i.e. the model already has it in context."""
+        return bool(self.turns) and text.strip() in self.turns[-1][1]
+
+    def add(self, user, reply):
+        with _convos_lock:
+            self.turns += [("user", user), ("assistant", reply)]
+            self.chars += len(user) + len(reply)
+            if self.chars > CONVO_MAX_CHARS:
+                keep = CONVO_MAX_CHARS * CONVO_TRIM_TO
+                while self.turns and self.chars > keep:
+                    self.chars -= len(self.turns[0][1]) + len(self.turns[1][1])
+                    del self.turns[:2]
+
+
+_convos = OrderedDict()   # session id -> Conversation, least recently used first
+_convos_lock = threading.Lock()
+
+def _evict_convos(now):
+    while _convos and now - next(iter(_convos.values())).used > CONVO_TTL:
+        _convos.popitem(last=False)
+    total = sum(c.chars for c in _convos.values())
+    while _convos and (len(_convos) > CONVO_MAX_SESSIONS or total > CONVO_TOTAL_CHARS):
+        total -= _convos.popitem(last=False)[1].chars
+
+def conversation(session_id, system) -> Conversation:
+    """The chat for `session_id`; a new one if it is unknown, expired or its system message changed."""
+    now = time.monotonic()
+    with _convos_lock:
+        c = _convos.get(session_id)
+        if c is None or c.system != system:
+            c = _convos[session_id] = Conversation(system)
+        _convos.move_to_end(session_id)
+        c.used = now
+        _evict_convos(now)
+    return c
+
+def end_conversation(session_id):
+    with _convos_lock:
+        _convos.pop(session_id, None)
+
+def conversation_stats() -> dict:
+    with _convos_lock:
+        return {"sessions": len(_convos), "chars": sum(c.chars for c in _convos.values())}
+
+def chat_stream(session_id, system, user, options=None, priority=NORMAL, learner=None,
+                timeout=None, cancel=None):
+    """Yield the reply to `user` in the session's chat.
+
+    The turn is kept in the history only if the reply runs to the end, so a
+    stream the caller stops (e.g. on a blocked term) leaves no trace.
+    """
+    c = conversation(session_id, system)
+    parts = []
+    for tok in _stream_ollama(None, options, priority, learner, timeout, cancel, c.messages(user)):
+        parts.append(tok)
+        yield tok
+    c.add(user, "".join(parts).strip())
+
+@traced("llm.chat_json")
+def chat_json(session_id, system, user_task: str, schema_hint: str, schema=None,
+              priority=NORMAL, learner=None, timeout=None, cancel=None) -> dict:
+    """ask_llm_json as a turn of the session's chat. Only valid replies join the history."""
+    c = conversation(session_id, system)
+    user = chat_json_message(user_task, schema_hint)
+    messages = c.messages(user)
+    obj, raw = _generate_json(None, priority, learner, timeout, cancel, messages)
+    def refix(failed, obj):
+        return _generate_json(None, priority, learner, timeout, cancel,
+                              chat_fix_messages(messages, raw, schema, failed))[0]
+    obj = _checked(obj, raw, schema, refix)
+    if "error" not in obj:
+        c.add(user, json.dumps(obj, ensure_ascii=False))
+    return obj
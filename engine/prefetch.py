@@ -0,0 +1,100 @@
+import itertools, queue, threading, time
+
+# ---- Question prefetch ----
+# Keeps the next few game questions generated on a worker thread so the
+# student never waits on the model between answers.
+
+class QuestionPrefetcher:
+    """Fill a bounded queue with (skill, question, round) until stopped.
+
+    `pick_skill()` chooses the next skill (normally pick_next_skill) and may
+    return None when there is nothing to practise yet. `make_question(skill, n)`
+    generates the text for round n; it can pass `self.stopped` as `cancel=` so
+    stop() aborts in-flight work. Rounds come from next_round(), which the
+    caller also uses for anything it generates itself, so no two questions
+    of a game share a round (and with it a seed).
+
+    With `idle_timeout` the worker stops itself once get() hasn't been called
+    for that many seconds, so an abandoned session doesn't keep a thread.
+    """
+
+    def __init__(self, pick_skill, make_question, depth=3, retry_delay=1.0, idle_timeout=None):
+        self.pick_skill = pick_skill
+        self.make_question = make_question
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self._thread = None
+        self._rounds = itertools.count(1)
+        self._rounds_lock = threading.Lock()
+        self._used = time.monotonic()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="buddy-prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None and not self.stopped.is_set()
+
+    def next_round(self) -> int:
+        with self._rounds_lock:
+            return next(self._rounds)
+
+    def _idle(self):
+        if self.idle_timeout and time.monotonic() - self._used > self.idle_timeout:
+            self.stop()
+        return self.stopped.is_set()
+
+    def _run(self):
+        while not self._idle():
+            try:
+                skill = self.pick_skill()
+                if skill is None:
+                    self.stopped.wait(self.retry_delay)
+                    continue
+                n = self.next_round()
+                text = self.make_question(skill, n)
+            except Exception as e:
+                self.last_error = e
+                self.stopped.wait(self.retry_delay)
+                continue
+            if not text:
+                continue
+            # block while the queue is full, but wake up promptly on stop()
+            while not self._idle():
+                try:
+                    self._queue.put((skill, text, n), timeout=0.2)
+                    break
+                except queue.Full:
+                    pass
+
+    def get(self, timeout=0.0):
+        """Next ready (skill, question, round), or None if nothing is ready in time."""
+        self._used = time.monotonic()
+        if self.stopped.is_set():
+            return None
+        try:
+            if timeout:
+                return self._queue.get(timeout=timeout)
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def ready(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self, wait=0.0):
+        """Cancel prefetching and drop anything not yet served."""
+        self.stopped.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(wait)
@@ -0,0 +1,220 @@
+import argparse, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from engine import model
+from engine.safety import check_batch
+from engine.scheduler import BACKGROUND
+from engine.schemas import BankQuestion
+from engine.tutor import LEVELS, diag_task, game_question_prompt, lesson_task
+
+# ---- Question bank generation ----
+# Fills the question_bank table ahead of time so learners don't wait on the
+# model. Every subject's skills are walked at every level, and each target
+# (kind, subject, level, skill) is topped up to K questions with reference
+# answers. Kinds:
+#   diag    subject-wide diagnostic questions (skill 0)
+#   lesson  a short teaching text ending in one question, per skill
+#   game    one quick quiz question per skill
+# A re-run resumes. The bank itself is the progress, and question_bank_jobs
+# counts the duplicates per target, so a target that keeps repeating itself
+# is given up after MAX_ATTEMPTS duplicates per wanted question (--reset
+# tries them again). Failed generations (bad JSON, a backend error) only
+# count within a run. Connection errors are shared by all workers: each
+# one backs off, and MAX_CONN_ERRORS in a row stop the run.
+
+KINDS = ("diag", "lesson", "game")
+DEFAULT_K = 10
+MAX_ATTEMPTS = 3
+BACKOFF = 1.0          # seconds after the first connection error, doubling after each further one
+MAX_CONN_ERRORS = 5
+AVOID = 10   # recent questions shown to the model so it doesn't repeat them
+BANK_HINT = '{"question": "string", "answer": "string"}'
+LESSON_HINT = '{"lesson": "string", "question": "string", "answer": "string"}'
+
+
+def targets(db, subjects=None, levels=LEVELS, kinds=KINDS):
+    """(kind, subject, level, skill or None) for everything the bank should cover."""
+    for subject in subjects or db.subjects():
+        skills = db.list_skills(subject)
+        for level in levels:
+            for kind in kinds:
+                if kind == "diag":
+                    yield kind, subject, level, None
+                else:
+                    for skill in skills:
+                        yield kind, subject, level, skill
+
+
+def _prompt(kind, subject, level, lang, skill):
+    if kind == "diag":
+        return ("Create ONE short diagnostic question with its reference answer.",
+                diag_task(subject, level, lang), BANK_HINT)
+    if kind == "lesson":
+        return ("Write a lesson opener and its reference answer.",
+                f"Subject: {subject}. Level: {level}. Language: {lang}. {lesson_task(skill)} "
+                "Put the teaching text in \"lesson\" and the question on its own in \"question\".", LESSON_HINT)
+    return ("Create ONE quiz question with its reference answer.",
+            f"{game_question_prompt(subject, level, skill)} Language: {lang}. "
+            "Put the expected answer in \"answer\".", BANK_HINT)
+
+
+def generate(kind, subject, level, lang, skill=None, avoid=()):
+    """One new (question, answer) for a target, or None if the model's reply was unusable."""
+    goal, task, hint = _prompt(kind, subject, level, lang, skill)
+    if avoid:
+        task += "\nIt must be different from these:\n" + "\n".join(f"- {q}" for q in avoid)
+    j = model.ask_llm_json(goal, task, hint, cache=False, schema=BankQuestion, priority=BACKGROUND)
+    if j.get("error"):
+        return None
+    text = j["question"].strip()
+    if kind == "lesson" and j["lesson"].strip():
+        text = f"{j['lesson'].strip()}\n\n{text}"
+    if not all(ok for ok, _ in check_batch([text, j["answer"]])):
+        return None
+    return text, j["answer"].strip()
+
+
+class _ConnectionErrors:
+    """Consecutive connection errors across all workers of a run."""
+
+    def __init__(self, limit=MAX_CONN_ERRORS, backoff=BACKOFF):
+        self.limit = limit
+        self.backoff = backoff
+        self.count = 0
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def failed(self):
+        with self._lock:
+            self.count += 1
+            n = self.count
+        if n >= self.limit:
+            self.stopped.set()
+        else:
+            self.stopped.wait(self.backoff * 2 ** (n - 1))
+
+    def ok(self):
+        with self._lock:
+            self.count = 0
+
+
+def _fill_target(db, target, k, lang, stored, attempts, conn_errors=None):
+    kind, subject, level, skill = target
+    sid = skill["id"] if skill else 0
+    conn_errors = conn_errors or _ConnectionErrors()
+    added = dupes = failed = 0
+    error = None
+    try:
+        avoid = db.bank_sample(kind, subject, level, lang, sid, AVOID)
+        while (stored < k and attempts < k * MAX_ATTEMPTS and failed < k * MAX_ATTEMPTS
+               and not conn_errors.stopped.is_set()):
+            try:
+                got = generate(kind, subject, level, lang, skill, avoid)
+            except OSError as e:   # refused, reset, timed out: the backend itself is in trouble
+                failed, error = failed + 1, e
+                conn_errors.failed()
+                continue
+            except Exception as e:
+                failed, error = failed + 1, e
+                continue
+            conn_errors.ok()
+            if got is None:
+                failed += 1
+            elif db.bank_add(kind, subject, level, lang, sid, *got):
+                stored += 1
+                added += 1
+                avoid = [got[0]] + avoid[:AVOID - 1]
+            else:
+                attempts += 1
+                dupes += 1
+    except Exception as e:   # the DB, not the model: give up on this target only
+        error = e
+    return {"added": added, "duplicates": dupes, "failed": failed, "complete": stored >= k,
+            "error": f"{type(error).__name__}: {error}" if error else None}
+
+
+def fill(db, k=DEFAULT_K, lang="English", workers=4, subjects=None, levels=LEVELS, kinds=KINDS,
+         on_target=None):
+    """Top every target up to `k` questions with `workers` generations in flight.
+
+    `on_target(target, report)` is called as each target finishes. A target
+    that fails is reported and left incomplete; the run goes on unless the
+    backend keeps refusing connections, in which case "stopped" is True and
+    the remaining targets are left for the next run.
+    """
+    progress = db.bank_progress(lang)
+    todo = []
+    for t in targets(db, subjects, levels, kinds):
+        stored, attempts = progress.get((t[0], t[1], t[2], t[3]["id"] if t[3] else 0), (0, 0))
+        if stored < k and attempts < k * MAX_ATTEMPTS:
+            todo.append((t, stored, attempts))
+    total = {"targets": len(todo), "added": 0, "duplicates": 0, "failed": 0, "incomplete": 0,
+             "errors": 0, "stopped": False}
+    conn_errors = _ConnectionErrors(MAX_CONN_ERRORS, BACKOFF)
+    with ThreadPoolExecutor(max(1, workers), thread_name_prefix="buddy-qbank") as pool:
+        futs = {pool.submit(_fill_target, db, t, k, lang, stored, attempts, conn_errors): t
+                for t, stored, attempts in todo}
+        for fut in as_completed(futs):
+            try:
+                rep = fut.result()
+            except Exception as e:
+                rep = {"added": 0, "duplicates": 0, "failed": 0, "complete": False,
+                       "error": f"{type(e).__name__}: {e}"}
+            for key in ("added", "duplicates", "failed"):
+                total[key] += rep[key]
+            total["incomplete"] += not rep["complete"]
+            total["errors"] += rep["error"] is not None
+            if on_target:
+                on_target(futs[fut], rep)
+    total["stopped"] = conn_errors.stopped.is_set()
+    return total
+
+
+# ---- Generation CLI ----
+# python -m engine.qbank [--db buddy.db] [--k 10] [--workers 4] [--subject Math] [--level Beginner]
+#                        [--kind game] [--lang English] [--reset]
+# python -m engine.qbank --stats [--db buddy.db]
+
+def main(argv=None):
+    from engine.storage import DB
+    ap = argparse.ArgumentParser(prog="python -m engine.qbank")
+    ap.add_argument("--db", default="buddy.db")
+    ap.add_argument("--k", type=int, default=DEFAULT_K, help="questions to keep per target")
+    ap.add_argument("--workers", type=int, default=4, help="generations in flight at once")
+    ap.add_argument("--subject", action="append", help="only this subject (repeatable)")
+    ap.add_argument("--level", action="append", choices=LEVELS, help="only this level (repeatable)")
+    ap.add_argument("--kind", action="append", choices=KINDS, help="only this kind (repeatable)")
+    ap.add_argument("--lang", default="English")
+    ap.add_argument("--stats", action="store_true", help="show what the bank holds and exit")
+    ap.add_argument("--reset", action="store_true",
+                    help="forget duplicate counts so targets that were given up on are tried again")
+    args = ap.parse_args(argv)
+
+    db = DB(args.db)
+    if args.stats:
+        for r in db.bank_stats():
+            print(f"{r['subject']:<12} {r['level']:<13} {r['kind']:<7} {r['lang']:<10} "
+                  f"{r['questions']:>5} question(s), {r['served']} served")
+        db.close()
+        return
+    if args.reset:
+        print(f"Reset {db.bank_reset_jobs(args.lang)} target(s).")
+    # the scheduler caps generations in flight; on a dedicated box let every worker through
+    model.scheduler.max_concurrency = max(model.scheduler.max_concurrency, args.workers)
+    t0 = time.monotonic()
+    def show(target, rep):
+        kind, subject, level, skill = target
+        name = skill["subtopic"] if skill else "-"
+        print(f"{subject} / {level} / {kind} / {name}: +{rep['added']} "
+              f"({rep['duplicates']} dup, {rep['failed']} failed){'' if rep['complete'] else ' [incomplete]'}"
+              f"{' ' + rep['error'] if rep['error'] else ''}", flush=True)
+    total = fill(db, args.k, args.lang, args.workers, args.subject, args.level or LEVELS,
+                 args.kind or KINDS, on_target=show)
+    print(f"{total['targets']} target(s): {total['added']} added, {total['duplicates']} duplicate(s), "
+          f"{total['failed']} failed, {total['incomplete']} incomplete, {time.monotonic() - t0:.0f}s.")
+    if total["stopped"]:
+        print(f"Stopped after {MAX_CONN_ERRORS} connection errors in a row; is the model server running?")
+    db.close()
+
+if __name__ == "__main__":
+    main()
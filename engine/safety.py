@@ -1,8 +1,277 @@
-BLOCKLIST = ["violence", "self-harm", "sex", "drugs", "weapon", "terror", "gambling"]
+import os, re, threading, time, unicodedata
 
+# ---- Safety matcher ----
+# Terms are matched on whole words after normalization (accents stripped,
+# case folded, punctuation treated as a word break), so "self-harm",
+# "Self Harm" and "SELF_HARM" all hit while "Essex" and "terrier" don't.
+# A trailing * makes the last word a prefix ("gambl*" covers "gambler"),
+# which also catches compounds ("drug*" would block "drugstore"), so the
+# built-in list spells out its inflections instead.
+#
+# Terms are stored word-reversed in a trie. Each word of the text is checked
+# once as the possible end of a term, walking back at most as many words as
+# the longest term, so a scan is linear in the text whatever the list size.
+
+BLOCKLIST = ["violence", "violent", "self-harm", "sex", "sexual", "sexy",
+             "drug", "drugs", "drugged", "weapon", "weapons", "weaponry", "weaponise", "weaponize",
+             "terror", "terrorism", "terrorist", "terrorists", "gambling", "gamble"]
+BLOCK_MESSAGE = "I can't help you with that. Let's focus on learning topics."
+
+# extra term files (one term per line, # comments), separated by os.pathsep
+BLOCKLIST_PATHS = [p for p in os.getenv("BUDDY_BLOCKLIST", "").split(os.pathsep) if p]
+RELOAD_CHECK = 5.0  # seconds between mtime checks on the list files
+
+_word = re.compile(r"[^\W_]+")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+
+def words(text: str) -> list:
+    return _word.findall(normalize(text))
+
+
+class _Node:
+    __slots__ = ("children", "term")
+
+    def __init__(self):
+        self.children = {}
+        self.term = None
+
+
+class Matcher:
+    """Compiled blocklist. Immutable once built, so it can be swapped atomically."""
+
+    def __init__(self, terms):
+        self.terms = []
+        self._exact = _Node()   # last word matched exactly
+        self._prefix = {}       # last word matched as a prefix -> node
+        self.depth = 0
+        for term in terms:
+            term = term.strip()
+            wild = term.endswith("*")
+            ws = words(term.rstrip("*"))
+            if not ws:
+                continue
+            self.terms.append(term)
+            self.depth = max(self.depth, len(ws))
+            last, rest = ws[-1], ws[-2::-1]
+            if wild:
+                node = self._prefix.setdefault(last, _Node())
+            else:
+                node = self._exact.children.setdefault(last, _Node())
+            for w in rest:
+                node = node.children.setdefault(w, _Node())
+            node.term = term
+        self._max_prefix = max((len(p) for p in self._prefix), default=0)
+
+    def match_at(self, ws, i):
+        """Terms that end at word i of `ws`."""
+        starts = []
+        node = self._exact.children.get(ws[i])
+        if node is not None:
+            starts.append(node)
+        if self._prefix:
+            w = ws[i]
+            for n in range(1, min(len(w), self._max_prefix) + 1):
+                node = self._prefix.get(w[:n])
+                if node is not None:
+                    starts.append(node)
+        hits = []
+        for node in starts:
+            j = i
+            while True:
+                if node.term is not None:
+                    hits.append(node.term)
+                j -= 1
+                if j < 0:
+                    break
+                node = node.children.get(ws[j])
+                if node is None:
+                    break
+        return hits
+
+    def find_all(self, text: str) -> list:
+        ws = words(text)
+        return [t for i in range(len(ws)) for t in self.match_at(ws, i)]
+
+    def search(self, text: str):
+        """First blocked term in `text`, or None."""
+        ws = words(text)
+        for i in range(len(ws)):
+            hits = self.match_at(ws, i)
+            if hits:
+                return hits[0]
+        return None
+
+
+class StreamScanner:
+    """Screens text that arrives in chunks (e.g. streamed LLM output).
+
+    feed() returns the text that is safe to show: everything up to the last
+    complete word. The trailing partial word is held back until the next
+    chunk shows where it ends, so a blocked word is caught before any of it
+    is released. `hit` is set to the first blocked term found.
+    """
+
+    def __init__(self, matcher=None):
+        self.matcher = matcher or get_matcher()
+        self.hit = None
+        self._raw = ""      # held-back raw text (the unfinished word)
+        self._window = []   # last few complete words, enough for the longest term
+
+    def _push(self, w):
+        if not self.matcher.depth:
+            return
+        self._window.append(w)
+        if len(self._window) > self.matcher.depth:
+            del self._window[0]
+        hits = self.matcher.match_at(self._window, len(self._window) - 1)
+        if hits and self.hit is None:
+            self.hit = hits[0]
+
+    def feed(self, chunk: str) -> str:
+        if self.hit is not None:
+            return ""
+        raw = self._raw + chunk
+        # cut before the trailing run of word characters; it may continue in the next chunk
+        cut = len(raw)
+        while cut and (raw[cut - 1].isalnum() or unicodedata.combining(raw[cut - 1])):
+            cut -= 1
+        ws = words(raw[:cut])
+        for w in ws:
+            self._push(w)
+            if self.hit is not None:
+                return ""
+        self._raw = raw[cut:]
+        return raw[:cut]
+
+    def close(self) -> str:
+        """End of stream: screen and release the held-back tail."""
+        if self.hit is not None:
+            return ""
+        tail, self._raw = self._raw, ""
+        for w in words(tail):
+            self._push(w)
+        return "" if self.hit is not None else tail
+
+
+# ---- Active list + hot reload ----
+_lock = threading.Lock()
+_matcher = None
+_mtimes = {}
+_checked_at = 0.0
+
+
+def load_terms(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [ln.strip() for ln in f if ln.strip() and not ln.lstrip().startswith("#")]
+
+
+def _stat(paths):
+    out = {}
+    for p in paths:
+        try:
+            out[p] = os.stat(p).st_mtime_ns
+        except OSError:
+            out[p] = None
+    return out
+
+
+def reload(terms=None, paths=None):
+    """Rebuild the matcher from BLOCKLIST (or `terms`) plus the list files."""
+    global _matcher, _mtimes, _checked_at
+    paths = BLOCKLIST_PATHS if paths is None else paths
+    mtimes = _stat(paths)
+    all_terms = list(BLOCKLIST if terms is None else terms)
+    for p, mt in mtimes.items():
+        if mt is not None:
+            all_terms += load_terms(p)
+    m = Matcher(all_terms)
+    with _lock:
+        _matcher, _mtimes, _checked_at = m, mtimes, time.monotonic()
+    return m
+
+
+def get_matcher() -> Matcher:
+    """The active matcher; list files are re-read when their mtime changes."""
+    global _checked_at
+    m = _matcher
+    if m is None:
+        return reload()
+    if BLOCKLIST_PATHS and time.monotonic() - _checked_at > RELOAD_CHECK:
+        _checked_at = time.monotonic()
+        if _stat(BLOCKLIST_PATHS) != _mtimes:
+            return reload()
+    return m
+
+
+reload()
+
+
+# ---- Checks ----
 def check_user_input(text: str) -> tuple[bool, str]:
-    t = text.lower()
-    for w in BLOCKLIST:
-        if w in t:
-            return False, "I can't help you with that. Let's focus on learning topics."
+    if get_matcher().search(text):
+        return False, BLOCK_MESSAGE
     return True, ""
+
+
+def check_batch(texts) -> list:
+    """check_user_input for many texts against one matcher snapshot."""
+    m = get_matcher()
+    return [(False, BLOCK_MESSAGE) if m.search(t) else (True, "") for t in texts]
+
+
+def screen_stream(chunks, message=BLOCK_MESSAGE):
+    """Pass a chunk stream through, replacing it with `message` on a blocked term.
+
+    The source generator is closed on a hit, which stops the generation.
+    """
+    sc = StreamScanner()
+    shown = False
+    try:
+        for chunk in chunks:
+            out = sc.feed(chunk)
+            if sc.hit is not None:
+                break
+            if out:
+                shown = True
+                yield out
+        else:
+            out = sc.close()
+            if sc.hit is None:
+                if out:
+                    yield out
+                return
+        yield ("\n\n" if shown else "") + message
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+async def screen_stream_async(chunks, message=BLOCK_MESSAGE):
+    """screen_stream() for an async chunk stream."""
+    sc = StreamScanner()
+    shown = False
+    try:
+        async for chunk in chunks:
+            out = sc.feed(chunk)
+            if sc.hit is not None:
+                break
+            if out:
+                shown = True
+                yield out
+        else:
+            out = sc.close()
+            if sc.hit is None:
+                if out:
+                    yield out
+                return
+        yield ("\n\n" if shown else "") + message
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose:
+            await aclose()
@@ -0,0 +1,183 @@
+import asyncio, threading, time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+# ---- LLM request scheduler ----
+# Every generation takes a slot before it reaches the backend. Waiting
+# requests are served by priority class first, then round-robin across
+# learners inside a class so one busy session can't starve the others.
+# Threads and asyncio tasks (acquire_async) wait in the same queues.
+
+INTERACTIVE, NORMAL, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BACKGROUND: "background"}
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Ticket:
+    __slots__ = ("priority", "learner", "deadline", "enqueued_at", "granted", "event", "wake")
+
+    def __init__(self, priority, learner, deadline):
+        self.priority = priority
+        self.learner = learner
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+        self.wake = None  # set by acquire_async: resolves the waiting task's future
+
+    def check(self, cancel=None):
+        """Raise if the request was cancelled or ran past its deadline."""
+        if cancel is not None and cancel.is_set():
+            raise Cancelled("LLM request cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise DeadlineExceeded("LLM request missed its deadline")
+
+
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[i]
+
+
+class Scheduler:
+    def __init__(self, max_concurrency=2, poll=0.1, history=1000):
+        self.max_concurrency = max_concurrency
+        self.poll = poll
+        self._lock = threading.Lock()
+        self._active = 0
+        # priority -> OrderedDict(learner -> deque[Ticket]); rotating the dict gives round-robin
+        self._queues = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self._waits = {p: deque(maxlen=history) for p in PRIORITY_NAMES}
+        self.counts = {"granted": 0, "expired": 0, "cancelled": 0}
+
+    # -- queueing --
+    def _enqueue(self, t):
+        self._queues[t.priority].setdefault(t.learner, deque()).append(t)
+
+    def _remove(self, t):
+        q = self._queues[t.priority].get(t.learner)
+        if q is not None and t in q:
+            q.remove(t)
+            if not q:
+                del self._queues[t.priority][t.learner]
+
+    def _next(self):
+        for p in sorted(self._queues):
+            learners = self._queues[p]
+            if learners:
+                learner, q = next(iter(learners.items()))
+                t = q.popleft()
+                del learners[learner]
+                if q:
+                    learners[learner] = q  # back of the line for this class
+                return t
+        return None
+
+    def _grant(self, t):
+        self._active += 1
+        t.granted = True
+        self._waits[t.priority].append(time.monotonic() - t.enqueued_at)
+        self.counts["granted"] += 1
+        t.event.set()
+        if t.wake is not None:
+            t.wake()
+
+    def _dispatch(self):
+        while self._active < self.max_concurrency:
+            t = self._next()
+            if t is None:
+                return
+            self._grant(t)
+
+    # -- public API --
+    def acquire(self, priority=NORMAL, learner=None, deadline=None, cancel=None) -> Ticket:
+        """Block until a slot is free. `deadline` is a time.monotonic() value."""
+        t = Ticket(priority, learner, deadline)
+        with self._lock:
+            self._enqueue(t)
+            self._dispatch()
+        while not t.event.wait(self.poll):
+            try:
+                t.check(cancel)
+            except (Cancelled, DeadlineExceeded) as e:
+                with self._lock:
+                    if not t.granted:
+                        self._remove(t)
+                        self.counts["cancelled" if isinstance(e, Cancelled) else "expired"] += 1
+                        raise
+                # granted while we were giving up; keep the slot
+                break
+        return t
+
+    async def acquire_async(self, priority=NORMAL, learner=None, deadline=None) -> Ticket:
+        """acquire() for asyncio: waits on a future instead of blocking a thread.
+
+        Cancelling the awaiting task gives up the place in the queue.
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        t = Ticket(priority, learner, deadline)
+        t.wake = lambda: loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+        with self._lock:
+            self._enqueue(t)
+            self._dispatch()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(granted, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            expired = isinstance(e, asyncio.TimeoutError)
+            with self._lock:
+                if not t.granted:
+                    self._remove(t)
+                    self.counts["expired" if expired else "cancelled"] += 1
+                    if expired:
+                        raise DeadlineExceeded("LLM request missed its deadline") from None
+                    raise
+            # granted while we were giving up: keep it on a timeout, hand it back on a cancel
+            if not expired:
+                self.release(t)
+                raise
+        return t
+
+    def release(self, t):
+        with self._lock:
+            self._active -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority=NORMAL, learner=None, deadline=None, cancel=None):
+        t = self.acquire(priority, learner, deadline, cancel)
+        try:
+            yield t
+        finally:
+            self.release(t)
+
+    @asynccontextmanager
+    async def slot_async(self, priority=NORMAL, learner=None, deadline=None):
+        t = await self.acquire_async(priority, learner, deadline)
+        try:
+            yield t
+        finally:
+            self.release(t)
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = {PRIORITY_NAMES[p]: sum(len(q) for q in learners.values())
+                      for p, learners in self._queues.items()}
+            waits = {p: sorted(w) for p, w in self._waits.items()}
+            out = {"active": self._active, "max_concurrency": self.max_concurrency,
+                   "queued": queued, **self.counts}
+        out["wait_ms"] = {
+            PRIORITY_NAMES[p]: {q: round(_percentile(w, v) * 1000, 1)
+                                for q, v in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+            for p, w in waits.items()
+        }
+        return out
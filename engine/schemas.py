@@ -0,0 +1,20 @@
+from pydantic import BaseModel, Field
+
+# ---- Structured LLM replies ----
+# Passed as `schema=` to ask_llm_json; fields that fail validation are
+# re-asked on their own instead of dropping the whole reply.
+
+class DiagQuestion(BaseModel):
+    question: str = Field(min_length=3)
+
+
+class AnswerEval(BaseModel):
+    correct: bool
+    feedback: str = Field(min_length=1)
+    next_question: str = Field(min_length=3)
+
+
+class BankQuestion(BaseModel):
+    question: str = Field(min_length=3)
+    answer: str = Field(min_length=1)
+    lesson: str = ""   # teaching text before the question, for lesson openers
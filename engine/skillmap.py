@@ -0,0 +1,66 @@
+from engine.cache import LRU
+
+# ---- Skill Memory Map (DOT graph) ----
+# One joined query per build; finished graphs are cached per
+# (learner, subject) and rebuilt only when DB.map_version changes.
+
+_graphs = LRU(max_entries=256)
+
+def skill_color(status):
+    return {
+        "Practicing": "#F6C453",  # amber
+        "Learning":   "#60A5FA",  # blue
+        "Unseen":     "#9CA3AF",  # gray
+    }.get(status, "#22C55E")      # default green for mastered-ish
+
+def _esc(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+def build_skill_graph_dot(db, learner_id, subject):
+    skills = db.skill_statuses(subject, learner_id)  # [{id,topic,subtopic,status}]
+    # group by topic
+    by_topic = {}
+    for s in skills:
+        by_topic.setdefault(s["topic"], []).append(s)
+    # deterministic order
+    for t in by_topic:
+        by_topic[t].sort(key=lambda x: x["subtopic"].lower())
+
+    lines = [
+        'digraph G {',
+        'rankdir=LR;',
+        'node [shape=box, style="rounded,filled", fontname="Verdana", fontsize=10];',
+        'edge [color="#94a3b8"];'
+    ]
+    # clusters per topic
+    first_nodes = []
+    for cluster_idx, (topic, items) in enumerate(sorted(by_topic.items())):
+        lines.append(f'subgraph cluster_{cluster_idx} {{ label="{_esc(topic)}"; color="#e5e7eb"; fontsize=12;')
+        prev = None
+        for s in items:
+            node_id = f'n{s["id"]}'
+            lines.append(f'{node_id} [label="{_esc(s["subtopic"])}", fillcolor="{skill_color(s["status"])}"];')
+            if prev:
+                lines.append(f'{prev} -> {node_id};')
+            prev = node_id
+        if items:
+            first_nodes.append(f'n{items[0]["id"]}')
+        lines.append('}')
+
+    # light cross-links between topics to show a path
+    for i in range(len(first_nodes) - 1):
+        lines.append(f'{first_nodes[i]} -> {first_nodes[i+1]} [style=dashed, color="#cbd5e1"];')
+
+    lines.append('}')
+    return "\n".join(lines)
+
+def skill_graph_dot(db, learner_id, subject):
+    """Cached build_skill_graph_dot."""
+    key = (db.path, learner_id, subject)
+    version = db.map_version(learner_id)
+    hit = _graphs.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    dot = build_skill_graph_dot(db, learner_id, subject)
+    _graphs.put(key, (version, dot))
+    return dot
@@ -1,12 +1,440 @@
-import sqlite3, time
+import argparse, atexit, datetime, hashlib, itertools, json, os, queue, sqlite3, threading, time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from engine.archive import SegmentStore, month_of
+from engine.safety import words
+from engine.trace import trace_methods
 
+# ---- Connections ----
+# One bounded pool per database file, shared by every DB handle and thread
+# in the process. Pooled connections live for the whole process, so each
+# keeps its compiled-statement cache warm across Streamlit reruns.
+
+class ConnectionPool:
+    def __init__(self, path, size=8, timeout=10.0, cached_statements=256):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._open = threading.Event()   # cleared while exclusive() holds the file
+        self._open.set()
+        self._exclusive = threading.Lock()
+
+    def _connect(self):
+        # one thread at a time uses a pooled connection, so cross-thread handoff is safe
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=self.timeout,
+                               cached_statements=self.cached_statements)
+        conn.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.create_function("answer_correct", 1, _answer_correct, deterministic=True)
+        return conn
+
+    def get(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0 or not (self._open.is_set() or self._open.wait(left)):
+                raise RuntimeError(f"No free SQLite connection for {self.path} after {self.timeout}s")
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._open.is_set() and self._created < self.size:
+                    self._created += 1
+                    return self._connect()
+            try:
+                # short waits so a pool reopened by exclusive() is noticed
+                return self._idle.get(timeout=min(left, 0.05))
+            except queue.Empty:
+                pass
+
+    def put(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.get()
+        try:
+            yield conn
+        finally:
+            self.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+    @contextmanager
+    def exclusive(self):
+        """A private connection while every pooled one is closed.
+
+        New get() calls wait until the block ends; connections already handed
+        out are waited for (up to `timeout`) and closed as they come back.
+        For maintenance such as VACUUM that wants the file to itself.
+        """
+        with self._exclusive:
+            with self._lock:
+                self._open.clear()
+            try:
+                deadline = time.monotonic() + self.timeout
+                while True:
+                    with self._lock:
+                        if not self._created:
+                            break
+                    try:
+                        conn = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        raise RuntimeError(f"SQLite connections for {self.path} still in use after {self.timeout}s")
+                    conn.close()
+                    with self._lock:
+                        self._created -= 1
+                conn = self._connect()
+                try:
+                    yield conn
+                finally:
+                    conn.close()
+            finally:
+                self._open.set()
+
+_pools = {}
+_setup_done = set()   # (path, step) pairs already run in this process
+_setup_lock = threading.Lock()
+_archive_locks = {}   # path -> lock serializing archive runs and compaction
+
+def get_pool(path) -> ConnectionPool:
+    with _setup_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+def _archive_lock(path):
+    with _setup_lock:
+        return _archive_locks.setdefault(path, threading.Lock())
+
+# ---- Write-behind ----
+# Mutations are queued to a single writer thread that applies them on its own
+# connection and commits them in groups, so a graded answer costs one shared
+# fsync instead of one per statement.
+
+SYNC_TIMEOUT = 30.0   # longest a read waits for the writes queued before it
+
+class _WriteBehind:
+    def __init__(self, path, batch_size=64, flush_interval=0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.create_function("answer_correct", 1, _answer_correct, deterministic=True)
+        self.submitted = 0
+        self.committed = 0
+        self.error = None   # set if the writer thread died; later writes and reads raise it
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="buddy-db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        """Queue fn(conn); returns (sequence number, Future of fn's result)."""
+        fut = Future()
+        with self._cond:
+            if self.error is not None:
+                raise self.error
+            self.submitted += 1
+            seq = self.submitted
+            self._queue.put((seq, fn, fut))
+        return seq, fut
+
+    def _take_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=left)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # finish this batch, then stop
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                results = self._apply(batch)
+            except Exception as e:
+                # the connection itself failed (BEGIN, or a rollback after SQLite
+                # already gave up on the transaction): stop rather than guess
+                self._broken(batch, e)
+                return
+            for fut, res, err in results:
+                if err is not None:
+                    fut.set_exception(err)
+                else:
+                    fut.set_result(res)
+            with self._cond:
+                self.committed = batch[-1][0]
+                self._cond.notify_all()
+
+    def _apply(self, batch):
+        results = []
+        self.conn.execute("BEGIN")
+        for seq, fn, fut in batch:
+            # a savepoint per mutation so one bad write doesn't sink the group
+            self.conn.execute("SAVEPOINT w")
+            try:
+                results.append((fut, fn(self.conn), None))
+                self.conn.execute("RELEASE w")
+            except Exception as e:
+                self.conn.execute("ROLLBACK TO w")
+                self.conn.execute("RELEASE w")
+                results.append((fut, None, e))
+        try:
+            self.conn.execute("COMMIT")
+        except Exception as e:
+            self.conn.execute("ROLLBACK")
+            results = [(fut, None, e) for fut, _, _ in results]
+        return results
+
+    def _broken(self, batch, cause):
+        err = RuntimeError(f"DB writer stopped: {cause!r}")
+        err.__cause__ = cause
+        with self._cond:
+            self.error = err   # from here on submit() refuses new writes
+            self._cond.notify_all()
+        try:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+        except Exception:
+            pass
+        pending = [fut for _, _, fut in batch]
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                pending.append(item[2])
+        for fut in pending:
+            if not fut.done():
+                fut.set_exception(err)
+
+    def wait_for(self, seq, timeout=None):
+        """True once write `seq` has committed, False on timeout; raises if the writer died."""
+        with self._cond:
+            done = self._cond.wait_for(lambda: self.committed >= seq or self.error is not None, timeout)
+            if self.error is not None:
+                raise self.error
+            return done
+
+    def flush(self, timeout=None):
+        return self.wait_for(self.submitted, timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self.conn.close()
+
+
+# ---- Spaced repetition ----
+# Leitner boxes: a correct answer moves a skill up one box, a wrong one sends
+# it back to box 1. The box sets how long until the skill is due again.
+# Box 0 means never answered.
+LEITNER_INTERVALS = (0, 60, 10 * 60, 60 * 60, 24 * 3600, 3 * 24 * 3600, 7 * 24 * 3600)
+MAX_BOX = len(LEITNER_INTERVALS) - 1
+
+def leitner_next(box, correct, now):
+    """(box, due_at) after an answer."""
+    box = min(box + 1, MAX_BOX) if correct else 1
+    return box, now + LEITNER_INTERVALS[box]
+
+
+# ---- Analytics rollups ----
+# Answer counts per (skill, day) and activity per (learner, day), kept up to
+# date by every event insert so Teacher dashboards never scan raw events.
+# Each row also carries running totals through that day (*_cum), so the
+# totals for any window are two index seeks per skill or learner instead of
+# a sum over every day in it. daily_activity holds class-wide per-day totals.
+# Days are UTC day numbers (unix time // DAY). Running totals assume events
+# arrive in time order; rebuild_rollups() repairs them after a backfill.
+DAY = 86400
+
+def day_of(ts):
+    return int(ts) // DAY
+
+def day_str(day):
+    return datetime.date.fromordinal(datetime.date(1970, 1, 1).toordinal() + day).isoformat()
+
+def parse_day(text):
+    return datetime.date.fromisoformat(text).toordinal() - datetime.date(1970, 1, 1).toordinal()
+
+
+# ---- Retention ----
+# archive_events() moves events older than the horizon out of the hot table
+# into monthly gzip segments (see engine.archive). Rollups and learner_stats
+# already cover those days and are left as they are; iter_events() reads
+# across the archive and the hot table as one time-ordered stream.
+RETENTION_DAYS = 180
+ARCHIVE_BATCH = 50000
+ITER_PAGE = 1000   # hot-table rows per read transaction in iter_events()
+EVENT_COLS = ("id", "learner_id", "skill_id", "kind", "data", "created_at")
+
+# ---- Question bank ----
+# Pre-generated questions (see engine.qbank) keyed by kind, subject, level,
+# language and skill (0 for subject-wide kinds). Texts are deduplicated per
+# target by a hash of their normalized words; the hash also finds the
+# reference answer of any question a learner is shown. A learner is never served the same banked
+# question twice; once a target is used up callers generate live.
+BANK_PICK = os.getenv("BUDDY_BANK_PICK", "lrs")   # "lrs" (least recently served) or "random"
+
+def question_hash(text):
+    return hashlib.sha1(" ".join(words(text)).encode()).hexdigest()
+
+
+def _answer_correct(data):
+    """Whether an answer event's data marks it correct ("correct": true or 1).
+
+    The one test used everywhere: the incremental rollups call it directly and
+    rebuilds call it as the SQL function answer_correct(data), so both agree.
+    """
+    try:
+        return json.loads(data or "{}").get("correct") in (1, True)
+    except (ValueError, AttributeError):
+        return False
+
+
+# Bumped after skills/progress writes commit so callers can cache derived views.
+# Kept per process (keyed by db path) so every DB handle on a file agrees.
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+@trace_methods("db")
 class DB:
-    def __init__(self, path="buddy.db"):
-        self.conn = sqlite3.connect(path, check_same_thread=False)
-        self._init()
+    def __init__(self, path="buddy.db", write_behind=False, batch_size=64, flush_interval=0.05,
+                 archive_dir=None):
+        """`write_behind=True` queues writes for group commit on a writer thread.
+
+        A read waits until every write queued on this handle before it has
+        committed, so a session sees what it just wrote whichever thread runs
+        its next step (Streamlit reruns and asyncio callers hop threads), for
+        at most SYNC_TIMEOUT seconds. Call flush() to wait for everything;
+        close() (also run at exit) drains the queue. If the writer thread dies
+        (a full disk, a broken connection), queued and later writes fail and
+        reads raise instead of waiting forever.
+
+        Connections come from a per-file pool shared across the process and
+        the schema is only set up once per process, so constructing a DB is cheap.
+
+        Archived events go to `archive_dir`, by default "<db name>_archive"
+        next to the database file.
+        """
+        self.path = path
+        self.archive = SegmentStore(archive_dir or os.path.splitext(path)[0] + "_archive")
+        self._pool = get_pool(path)
+        self._writer = None
+        self._once("schema", self._init)
+        if write_behind:
+            self._writer = _WriteBehind(path, batch_size, flush_interval)
+            atexit.register(self.close)
+
+    def _once(self, step, fn):
+        key = (self.path, step)
+        if key in _setup_done:
+            return
+        with _setup_lock:
+            if key in _setup_done:
+                return
+            fn()
+            _setup_done.add(key)
+
+    @contextmanager
+    def _reader(self):
+        self._sync()
+        with self._pool.connection() as conn:
+            yield conn
+
+    # ---- write path ----
+    def _write(self, fn, wait=False, after=None):
+        """Apply fn(conn) now, or queue it for the writer in write-behind mode.
+
+        `after()` runs once the write has committed.
+        """
+        if self._writer is None:
+            with self._pool.connection() as conn:
+                res = fn(conn)
+                conn.commit()
+            if after: after()
+            return res
+        fut = self._writer.submit(fn)[1]
+        if after:
+            fut.add_done_callback(lambda f: f.exception() is None and after())
+        return fut.result() if wait else fut
+
+    def _bump_version(self, key):
+        with _versions_lock:
+            _versions[key] = _versions.get(key, 0) + 1
+
+    def _skills_changed(self):
+        self._bump_version((self.path, "skills"))
+
+    def _progress_changed(self, learner_id):
+        self._bump_version((self.path, "progress", learner_id))
+
+    def map_version(self, learner_id):
+        """Changes whenever the skill list or this learner's progress does."""
+        self._sync()
+        return (_versions.get((self.path, "skills"), 0),
+                _versions.get((self.path, "progress", learner_id), 0))
+
+    def _sync(self):
+        """Read-your-writes: wait until the writes queued on this handle so far are committed."""
+        w = self._writer
+        if w is not None and (w.error is not None or
+                              w.submitted > w.committed and threading.current_thread() is not w._thread):
+            if not w.wait_for(w.submitted, SYNC_TIMEOUT):
+                raise TimeoutError(f"Queued writes to {self.path} not committed after {SYNC_TIMEOUT}s")
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """Drain queued writes. Pooled connections stay open for other handles."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
     
     def _init(self):
-        self.conn.executescript("""
+        with self._pool.connection() as conn:
+            fresh_stats = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='learner_stats'"
+            ).fetchone() is None
+            fresh_rollups = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='skill_daily'"
+            ).fetchone() is None
+            conn.executescript("""
         CREATE TABLE IF NOT EXISTS learners(
                                 id INTEGER PRIMARY KEY,
                                 name TEXT,
@@ -23,9 +451,11 @@ class DB:
                                 status TEXT,
                                 streak_correct INT,
                                 last_seen INT,
+                                box INT DEFAULT 0,
+                                due_at INT DEFAULT 0,
                                 PRIMARY KEY(learner_id, skill_id));
         CREATE TABLE IF NOT EXISTS events(
-                                id INTEGER PRIMATY KEY,
+                                id INTEGER PRIMARY KEY,
                                 learner_id INT, skill_id INT,
                                 kind TEXT,
                                 data TEXT,
@@ -40,156 +470,727 @@ class DB:
                                 badge_code TEXT,
                                 earned_at INTEGER,
                                 PRIMARY KEY(learner_id, badge_code));
+        CREATE TABLE IF NOT EXISTS learner_stats(
+                                learner_id INTEGER PRIMARY KEY,
+                                answered INT DEFAULT 0,
+                                correct INT DEFAULT 0,
+                                mastered INT DEFAULT 0,
+                                streak INT DEFAULT 0,
+                                best_streak INT DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS skill_daily(
+                                skill_id INT,
+                                day INT,
+                                answered INT DEFAULT 0,
+                                correct INT DEFAULT 0,
+                                answered_cum INT DEFAULT 0,
+                                correct_cum INT DEFAULT 0,
+                                PRIMARY KEY(skill_id, day));
+        CREATE TABLE IF NOT EXISTS learner_daily(
+                                learner_id INT,
+                                day INT,
+                                events INT DEFAULT 0,
+                                answered INT DEFAULT 0,
+                                correct INT DEFAULT 0,
+                                answered_cum INT DEFAULT 0,
+                                correct_cum INT DEFAULT 0,
+                                PRIMARY KEY(learner_id, day));
+        CREATE TABLE IF NOT EXISTS daily_activity(
+                                day INTEGER PRIMARY KEY,
+                                active_learners INT DEFAULT 0,
+                                events INT DEFAULT 0,
+                                answered INT DEFAULT 0,
+                                correct INT DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS event_segments(
+                                month TEXT PRIMARY KEY,
+                                events INT DEFAULT 0,
+                                bytes INT DEFAULT 0,
+                                members INT DEFAULT 0,
+                                min_ts INT, max_ts INT);
+        CREATE INDEX IF NOT EXISTS idx_skill_daily_day ON skill_daily(day);
+        CREATE INDEX IF NOT EXISTS idx_learner_daily_day ON learner_daily(day);
+        CREATE INDEX IF NOT EXISTS idx_events_learner_kind ON events(learner_id, kind, id);
+        CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at);
+        CREATE INDEX IF NOT EXISTS idx_progress_learner_status ON progress(learner_id, status);
+        CREATE TABLE IF NOT EXISTS question_bank(
+                                id INTEGER PRIMARY KEY,
+                                kind TEXT, subject TEXT, level TEXT, lang TEXT,
+                                skill_id INT DEFAULT 0,
+                                question TEXT, answer TEXT,
+                                qhash TEXT,
+                                created_at INTEGER,
+                                served INT DEFAULT 0,
+                                last_served INTEGER DEFAULT 0,
+                                UNIQUE(kind, subject, level, lang, skill_id, qhash));
+        CREATE INDEX IF NOT EXISTS idx_question_bank_pick
+                                ON question_bank(kind, subject, level, lang, skill_id, last_served);
+        CREATE INDEX IF NOT EXISTS idx_question_bank_qhash ON question_bank(qhash);
+        CREATE TABLE IF NOT EXISTS question_served(
+                                learner_id INT, question_id INT,
+                                served_at INTEGER,
+                                PRIMARY KEY(learner_id, question_id));
+        CREATE TABLE IF NOT EXISTS question_bank_jobs(
+                                kind TEXT, subject TEXT, level TEXT, lang TEXT,
+                                skill_id INT DEFAULT 0,
+                                attempts INT DEFAULT 0,
+                                PRIMARY KEY(kind, subject, level, lang, skill_id));
                                 """)
-        self.conn.commit()
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name='uq_skills'").fetchone() is None:
+                self._dedupe_skills(conn)
+                conn.execute("DROP INDEX IF EXISTS idx_skills_subject")
+                conn.execute("CREATE UNIQUE INDEX uq_skills ON skills(subject, topic, subtopic)")
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(progress)")}
+            if "box" not in cols:
+                self._migrate_leitner(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_progress_due ON progress(learner_id, due_at)")
+            conn.commit()
+        if fresh_stats:
+            # existing database from before the rollup existed: backfill it once
+            self.rebuild_learner_stats()
+        if fresh_rollups:
+            self.rebuild_rollups()
     
+    @staticmethod
+    def _dedupe_skills(conn):
+        # databases from before the unique index may hold repeated skills:
+        # keep the lowest id and point progress and events at it
+        dupes = conn.execute(
+            """
+            SELECT s.id, k.keep FROM skills s
+            JOIN (SELECT subject, topic, subtopic, MIN(id) AS keep FROM skills
+                  GROUP BY subject, topic, subtopic HAVING COUNT(*) > 1) k
+              ON s.subject=k.subject AND s.topic=k.topic AND s.subtopic=k.subtopic
+            WHERE s.id != k.keep
+            """
+        ).fetchall()
+        for dup, keep in dupes:
+            conn.execute("UPDATE OR IGNORE progress SET skill_id=? WHERE skill_id=?", (keep, dup))
+            conn.execute("DELETE FROM progress WHERE skill_id=?", (dup,))
+            conn.execute("UPDATE events SET skill_id=? WHERE skill_id=?", (keep, dup))
+            conn.execute("DELETE FROM skills WHERE id=?", (dup,))
+
+    @staticmethod
+    def _migrate_leitner(conn):
+        # progress rows from before spaced repetition: place them by their
+        # current streak and schedule from when they were last seen
+        conn.execute("ALTER TABLE progress ADD COLUMN box INT DEFAULT 0")
+        conn.execute("ALTER TABLE progress ADD COLUMN due_at INT DEFAULT 0")
+        conn.execute("UPDATE progress SET box=MIN(MAX(COALESCE(streak_correct, 0), 0) + 1, ?)", (MAX_BOX,))
+        conn.executemany("UPDATE progress SET due_at=COALESCE(last_seen, 0) + ? WHERE box=?",
+                         [(LEITNER_INTERVALS[b], b) for b in range(1, MAX_BOX + 1)])
+
     def ensure_learner(self, name, lang):
-        cur = self.conn.execute(
-            "SELECT id FROM learners WHERE name=? AND lang=?", (name, lang)
-        )
-        row = cur.fetchone()
+        with self._reader() as conn:
+            row = conn.execute(
+                "SELECT id FROM learners WHERE name=? AND lang=?", (name, lang)
+            ).fetchone()
         if row: return row[0]
-        self.conn.execute(
-            "INSERT INTO learners(name, lang, created_at) VALUES(?,?,?)",
-            (name, lang, int(time.time()))
-        )
-        self.conn.commit()
-        return self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        def insert(conn):
+            return conn.execute(
+                "INSERT INTO learners(name, lang, created_at) VALUES(?,?,?)",
+                (name, lang, int(time.time()))
+            ).lastrowid
+        return self._write(insert, wait=True)
     
     def skills_for(self, subject):
-        cur = self.conn.execute(
-            "SELECT id, topic, subtopic FROM skills WHERE subject=?", (subject,)
-        )
-        rows = cur.fetchall()
-        if not rows:
-            seed = [
-                ("Math", "Arithmetic", "Add 1-digit numbers"),
-                ("Science", "Matter", "Solid vs Liquid"),
-                ("Literacy", "Reading", "Short vowel sounds")
-            ]
-            for s in seed:
-                self.conn.execute(
-                    "INSERT INTO skills(subject, topic, subtopic) VALUES(?,?,?)", s
-                )
-            self.conn.commit()
-            return self.skills_for(subject)
+        with self._reader() as conn:
+            rows = conn.execute(
+                "SELECT id, topic, subtopic FROM skills WHERE subject=?", (subject,)
+            ).fetchall()
         return [{"id":r[0], "topic":r[1], "subtopic":r[2]} for r in rows]
     
-    def bump_progress(self, learner_id, skill_id, correct):
-        cur = self.conn.execute(
-            "SELECT status, streak_correct FROM progress WHERE learner_id=? AND skill_id=?",
+    # ---- rollup maintenance (always called inside a write) ----
+    @staticmethod
+    def _bump(conn, learner_id, skill_id, correct):
+        cur = conn.execute(
+            "SELECT status, streak_correct, box FROM progress WHERE learner_id=? AND skill_id=?",
             (learner_id, skill_id)
         )
         row = cur.fetchone()
-        status, streak = (row if row else ("Learning", 0))
+        status, streak, box = (row if row else ("Learning", 0, 0))
+        before = status
         streak = (streak + 1) if correct else 0
         if streak >= 3: status = "Practicing"
-        self.conn.execute(
+        now = int(time.time())
+        box, due_at = leitner_next(box or 0, correct, now)
+        conn.execute(
             """
-            INSERT INTO progress(learner_id, skill_id, status, streak_correct, last_seen)
-            VALUES(?,?,?,?,?)
+            INSERT INTO progress(learner_id, skill_id, status, streak_correct, last_seen, box, due_at)
+            VALUES(?,?,?,?,?,?,?)
             ON CONFLICT(learner_id, skill_id) DO UPDATE SET
                 status=excluded.status,
                 streak_correct=excluded.streak_correct,
-                last_seen=excluded.last_seen
-            """, (learner_id, skill_id, status, streak, int(time.time()))
+                last_seen=excluded.last_seen,
+                box=excluded.box,
+                due_at=excluded.due_at
+            """, (learner_id, skill_id, status, streak, now, box, due_at)
+        )
+        if status == "Practicing" and before != "Practicing":
+            conn.execute(
+                """
+                INSERT INTO learner_stats(learner_id, mastered) VALUES(?, 1)
+                ON CONFLICT(learner_id) DO UPDATE SET mastered=mastered + 1
+                """, (learner_id,)
+            )
+
+    @staticmethod
+    def _insert_event(conn, learner_id, skill_id, kind, data_json, created):
+        conn.execute(
+            "INSERT INTO events(learner_id, skill_id, kind, data, created_at) VALUES(?,?,?,?,?)",
+            (learner_id, skill_id, kind, data_json, created)
         )
-        self.conn.commit()
+        answered = int(kind == "answer")
+        correct = int(answered and _answer_correct(data_json))
+        day = day_of(created)
+        # first event of the day for this learner: open the row from yesterday's running totals
+        new_day = conn.execute(
+            """
+            INSERT OR IGNORE INTO learner_daily(learner_id, day, answered_cum, correct_cum)
+            SELECT ?1, ?2, COALESCE(MAX(answered_cum), 0), COALESCE(MAX(correct_cum), 0) FROM
+                (SELECT answered_cum, correct_cum FROM learner_daily
+                 WHERE learner_id=?1 AND day < ?2 ORDER BY day DESC LIMIT 1)
+            """, (learner_id, day)
+        ).rowcount
+        conn.execute(
+            """
+            UPDATE learner_daily SET events=events + 1, answered=answered + ?1, correct=correct + ?2,
+                answered_cum=answered_cum + ?1, correct_cum=correct_cum + ?2
+            WHERE learner_id=?3 AND day=?4
+            """, (answered, correct, learner_id, day)
+        )
+        conn.execute(
+            """
+            INSERT INTO daily_activity(day, active_learners, events, answered, correct) VALUES(?, ?, 1, ?, ?)
+            ON CONFLICT(day) DO UPDATE SET active_learners=active_learners + excluded.active_learners,
+                events=events + 1, answered=answered + excluded.answered, correct=correct + excluded.correct
+            """, (day, new_day, answered, correct)
+        )
+        if not answered:
+            return
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO skill_daily(skill_id, day, answered_cum, correct_cum)
+            SELECT ?1, ?2, COALESCE(MAX(answered_cum), 0), COALESCE(MAX(correct_cum), 0) FROM
+                (SELECT answered_cum, correct_cum FROM skill_daily
+                 WHERE skill_id=?1 AND day < ?2 ORDER BY day DESC LIMIT 1)
+            """, (skill_id, day)
+        )
+        conn.execute(
+            """
+            UPDATE skill_daily SET answered=answered + 1, correct=correct + ?1,
+                answered_cum=answered_cum + 1, correct_cum=correct_cum + ?1
+            WHERE skill_id=?2 AND day=?3
+            """, (correct, skill_id, day)
+        )
+        conn.execute(
+            """
+            INSERT INTO learner_stats(learner_id, answered, correct, streak, best_streak)
+            VALUES(?, 1, ?, ?, ?)
+            ON CONFLICT(learner_id) DO UPDATE SET
+                answered=answered + 1,
+                correct=correct + excluded.correct,
+                streak=CASE WHEN excluded.correct THEN streak + 1 ELSE 0 END,
+                best_streak=MAX(best_streak, CASE WHEN excluded.correct THEN streak + 1 ELSE 0 END)
+            """, (learner_id, correct, correct, correct)
+        )
+
+    def bump_progress(self, learner_id, skill_id, correct):
+        # read-modify-write runs inside the write so queued bumps can't race
+        self._write(lambda conn: self._bump(conn, learner_id, skill_id, correct),
+                    after=lambda: self._progress_changed(learner_id))
+
+    def record_answer(self, learner_id, skill_id, correct, data=None):
+        """Log an answer event and bump progress in one transaction."""
+        data_json = json.dumps({**(data or {}), "correct": bool(correct)})
+        created = int(time.time())
+        def record(conn):
+            self._insert_event(conn, learner_id, skill_id, "answer", data_json, created)
+            self._bump(conn, learner_id, skill_id, correct)
+        self._write(record, after=lambda: self._progress_changed(learner_id))
     
     def skill_exists(self, subject, topic, subtopic):
-        cur = self.conn.execute(
-            "SELECT 1 FROM skills WHERE subject=? AND topic=? AND subtopic=?",
-            (subject, topic, subtopic)
-        )
-        return cur.fetchone() is not None
+        with self._reader() as conn:
+            return conn.execute(
+                "SELECT 1 FROM skills WHERE subject=? AND topic=? AND subtopic=?",
+                (subject, topic, subtopic)
+            ).fetchone() is not None
     
     def insert_skill(self, subject, topic, subtopic):
-        self.conn.execute(
-            "INSERT INTO skills(subject, topic, subtopic) VALUES(?,?,?)",
+        self._write(lambda conn: conn.execute(
+            "INSERT INTO skills(subject, topic, subtopic) VALUES(?,?,?) ON CONFLICT DO NOTHING",
             (subject, topic, subtopic)
-        )
-        self.conn.commit()
-    
+        ), after=self._skills_changed)
+
+    def insert_skills(self, rows):
+        """Insert (subject, topic, subtopic) rows in one transaction, skipping existing ones.
+
+        `rows` may be a generator; it is consumed here, on the caller's thread,
+        before anything is written, so a parse error part-way through leaves
+        the DB untouched and the writer only runs the executemany. Returns how
+        many rows were new.
+        """
+        rows = list(rows)
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT INTO skills(subject, topic, subtopic) VALUES(?,?,?) ON CONFLICT DO NOTHING", rows
+            )
+            return conn.total_changes - before
+        return self._write(insert, wait=True, after=self._skills_changed)
+
     def log_event(self, learner_id, skill_id, kind, data_json="{}"):
-        import time, json
-        self.conn.execute(
-            "INSERT INTO events(learner_id, skill_id, kind, data, created_at) VALUES(?,?,?,?)",
-            (learner_id, skill_id, kind, data_json, int(time.time()))
-        )
-        self.conn.commit()
+        created = int(time.time())
+        self._write(lambda conn: self._insert_event(conn, learner_id, skill_id, kind, data_json, created))
     
     def ensure_badges_seed(self):
-        rows = self.conn.execute("SELECT COUNT(*) FROM badges").fetchone()[0]
+        self._once("badges", self._seed_badges)
+
+    def _seed_badges(self):
+        with self._reader() as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM badges").fetchone()[0]
         if rows: return
         seed = [
             ("FIRST_5", "First Five", "Answered 5 questions"),
             ("STREAK_3", "On a Roll", "3 correct in a row"),
             ("MASTER_1", "Master I", "Mastered one skill"),
         ]
-        for code, name, desc in seed:
-            self.conn.execute(
-                "INSERT INTO badges(code, name, description) VALUES(?,?,?)",
-                (code, name, desc)
-            )
-        self.conn.commit()
+        self._write(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO badges(code, name, description) VALUES(?,?,?)", seed
+        ), wait=True)
     
     def award_badge(self, learner_id, code):
-        import time
-        cur = self.conn.execute(
-            "SELECT 1 FROM learner_badges WHERE learner_id=? AND badge_code=?",
-            (learner_id, code)
-        ).fetchone()
+        with self._reader() as conn:
+            cur = conn.execute(
+                "SELECT 1 FROM learner_badges WHERE learner_id=? AND badge_code=?",
+                (learner_id, code)
+            ).fetchone()
         if cur: return False
-        self.conn.execute(
-            "INSERT INTO learner_badges(learner_id, badge_code, earned_at) VALUES(?,?,?)",
-            (learner_id, code, int(time.time()))
-        )
-        self.conn.commit()
+        earned = int(time.time())
+        self._write(lambda conn: conn.execute(
+            "INSERT OR IGNORE INTO learner_badges(learner_id, badge_code, earned_at) VALUES(?,?,?)",
+            (learner_id, code, earned)
+        ))
         return True
     
     def learner_stats(self, learner_id):
-        total = self.conn.execute(
-            "SELECT COUNT(*) FROM events WHERE learner_id=? AND kind='answer'",
-            (learner_id,)
-        ).fetchone()[0]
-        correct = self.conn.execute(
-            "SELECT COUNT(*) FROM events WHERE learner_id=? AND kind='answer' AND json_extract(data, '$.correct')=1",
-            (learner_id,)
-        ).fetchone()[0]
-        mastered = self.conn.execute(
-            "SELECT COUNT(*) FROM progress WHERE learner_id=? AND status='Practicing'",
-            (learner_id,)
-        ).fetchone()[0]
-        badges = self.conn.execute(
-            "SELECT b.code, b.name, b.description, lb.earned_at FROM learner_badges lb JOIN badges b ON b.code=lb.badge_code WHERE learner_id=?",
-            (learner_id,)
-        ).fetchall()
-        return {"answered": total, "correct": correct, "mastered": mastered,
+        with self._reader() as conn:
+            row = conn.execute(
+                "SELECT answered, correct, mastered, streak, best_streak FROM learner_stats WHERE learner_id=?",
+                (learner_id,)
+            ).fetchone() or (0, 0, 0, 0, 0)
+            badges = conn.execute(
+                "SELECT b.code, b.name, b.description, lb.earned_at FROM learner_badges lb JOIN badges b ON b.code=lb.badge_code WHERE learner_id=?",
+                (learner_id,)
+            ).fetchall()
+        return {"answered": row[0], "correct": row[1], "mastered": row[2],
+                "streak": row[3], "best_streak": row[4],
                 "badges": [{"code":r[0], "name":r[1], "desc":r[2], "ts":r[3]} for r in badges]}
     
     def streak_correct(self, learner_id):
         # Last contiguous correct answers
-        cur = self.conn.execute("""
-            SELECT json_extract(data, '$.correct') FROM events
-            WHERE learner_id=? AND kind='answer'
-            ORDER BY id DESC LIMIT 20
-            """, (learner_id))
-        streak = 0
-        for (c,) in cur.fetchall():
-            if c == 1: streak += 1
-            else: break
-        return streak
+        with self._reader() as conn:
+            row = conn.execute(
+                "SELECT streak FROM learner_stats WHERE learner_id=?", (learner_id,)
+            ).fetchone()
+        return row[0] if row else 0
+    
+    def rebuild_learner_stats(self, learner_id=None):
+        """Recompute the learner_stats rollup from events and progress."""
+        where, args = ("AND learner_id=?", (learner_id,)) if learner_id is not None else ("", ())
+        def rebuild(conn):
+            stats = {}
+            # archived answers come first: they are all older than the hot table's
+            archived = ((r[1], 1 if _answer_correct(r[4]) else 0)
+                        for r in self._iter_archive(conn) if r[3] == "answer"
+                        and (learner_id is None or r[1] == learner_id))
+            # rowid, not id: databases created before the events.id fix have NULL ids
+            cur = conn.execute(f"""
+                SELECT learner_id, answer_correct(data) FROM events
+                WHERE kind='answer' {where} ORDER BY rowid
+                """, args)
+            for lid, c in itertools.chain(archived, cur):
+                st = stats.setdefault(lid, [0, 0, 0, 0, 0])
+                st[0] += 1
+                if c:
+                    st[1] += 1
+                    st[3] += 1
+                    st[4] = max(st[4], st[3])
+                else:
+                    st[3] = 0
+            cur = conn.execute(f"""
+                SELECT learner_id, COUNT(*) FROM progress
+                WHERE status='Practicing' {where} GROUP BY learner_id
+                """, args)
+            for lid, n in cur:
+                stats.setdefault(lid, [0, 0, 0, 0, 0])[2] = n
+            conn.execute(f"DELETE FROM learner_stats WHERE 1=1 {where}", args)
+            conn.executemany(
+                "INSERT INTO learner_stats(learner_id, answered, correct, mastered, streak, best_streak) VALUES(?,?,?,?,?,?)",
+                [(lid, *st) for lid, st in stats.items()]
+            )
+            return len(stats)
+        return self._write(rebuild, wait=True)
     
+    def rebuild_rollups(self, since_day=None):
+        """Recompute the per-day rollups from raw events.
+
+        With `since_day` only that day and later are rebuilt, continuing the
+        running totals from the day before. That is enough to catch up after
+        events were written by something that bypassed the rollups. Days
+        already archived are never rebuilt: their raw events are gone from
+        the hot table, so their rollup rows are kept as they are.
+        """
+        since = since_day if since_day is not None else -1
+        def rebuild(conn):
+            nonlocal since
+            last = conn.execute("SELECT MAX(max_ts) FROM event_segments").fetchone()[0]
+            if last is not None:
+                since = max(since, day_of(last) + 1)
+            for table in ("skill_daily", "learner_daily", "daily_activity"):
+                conn.execute(f"DELETE FROM {table} WHERE day >= ?", (since,))
+            is_answer = "kind='answer'"
+            is_correct = "kind='answer' AND answer_correct(data)"
+            # running totals restart from the last row kept before `since`
+            base = ("COALESCE((SELECT {col} FROM {table} p WHERE p.{key}=d.{key} AND p.day < {since} "
+                    "ORDER BY p.day DESC LIMIT 1), 0)")
+            for table, key, where in (("learner_daily", "learner_id", ""),
+                                      ("skill_daily", "skill_id", f"AND {is_answer}")):
+                events = "events, " if table == "learner_daily" else ""
+                conn.execute(f"""
+                    INSERT INTO {table}({key}, day, {events}answered, correct, answered_cum, correct_cum)
+                    SELECT {key}, day, {events}answered, correct,
+                           SUM(answered) OVER w + {base.format(col="answered_cum", table=table, key=key, since=since)},
+                           SUM(correct) OVER w + {base.format(col="correct_cum", table=table, key=key, since=since)}
+                    FROM (SELECT {key}, created_at / {DAY} AS day, COUNT(*) AS events,
+                                 SUM({is_answer}) AS answered,
+                                 SUM(CASE WHEN {is_correct} THEN 1 ELSE 0 END) AS correct
+                          FROM events WHERE created_at >= ? {where}
+                          GROUP BY {key}, created_at / {DAY}) d
+                    WINDOW w AS (PARTITION BY {key} ORDER BY day)
+                    """, (max(since, 0) * DAY,))
+            conn.execute("""
+                INSERT INTO daily_activity(day, active_learners, events, answered, correct)
+                SELECT day, COUNT(*), SUM(events), SUM(answered), SUM(correct)
+                FROM learner_daily WHERE day >= ? GROUP BY day
+                """, (since,))
+            return conn.execute("SELECT COUNT(*) FROM learner_daily WHERE day >= ?", (since,)).fetchone()[0]
+        return self._write(rebuild, wait=True)
+
+    # ---- retention ----
+    def _iter_archive(self, conn, since=None, until=None):
+        """Archived rows overlapping [since, until), month by month, as stored."""
+        segs = conn.execute(
+            "SELECT month, bytes FROM event_segments WHERE bytes > 0 "
+            "AND (? IS NULL OR max_ts >= ?) AND (? IS NULL OR min_ts < ?) ORDER BY month",
+            (since, since, until, until)).fetchall()
+        for month, size in segs:
+            yield from self.archive.read(month, size)
+
+    def archive_events(self, older_than_days=RETENTION_DAYS, batch=ARCHIVE_BATCH):
+        """Move events from before the horizon (whole UTC days) into the archive.
+
+        Each batch is read and appended to its month's segment on the calling
+        thread. Only the manifest update and the delete go to the writer, in
+        one transaction that first checks the segment hasn't grown since it
+        was read. Returns (events moved, months touched).
+        """
+        cutoff = (day_of(time.time()) - older_than_days + 1) * DAY
+        moved, months = 0, set()
+        with _archive_lock(self.path):
+            while True:
+                with self._reader() as conn:
+                    rows = conn.execute(
+                        "SELECT rowid, id, learner_id, skill_id, kind, data, created_at FROM events "
+                        "WHERE created_at < ? ORDER BY created_at, rowid LIMIT ?", (cutoff, batch)).fetchall()
+                    segs = dict(conn.execute("SELECT month, bytes FROM event_segments").fetchall())
+                by_month = {}
+                for r in rows:
+                    by_month.setdefault(month_of(r[6]), []).append([r[0] if r[1] is None else r[1], *r[2:]])
+                appended = [(month, part, segs.get(month), self.archive.append(month, part, segs.get(month) or 0))
+                            for month, part in by_month.items()]
+                def commit(conn):
+                    for month, part, old, size in appended:
+                        args = (len(part), size, part[0][5], part[-1][5], month)
+                        if old is None:
+                            conn.execute("INSERT INTO event_segments(events, bytes, members, min_ts, max_ts, month) "
+                                         "VALUES(?,?,1,?,?,?)", args)
+                        elif not conn.execute("""
+                                UPDATE event_segments SET events=events+?, bytes=?, members=members+1,
+                                    min_ts=MIN(min_ts, ?), max_ts=MAX(max_ts, ?)
+                                WHERE month=? AND bytes=?
+                                """, (*args, old)).rowcount:
+                            raise RuntimeError(f"Archive segment {month} changed during the run")
+                    conn.executemany("DELETE FROM events WHERE rowid=?", [(r[0],) for r in rows])
+                if rows:
+                    self._write(commit, wait=True)
+                moved += len(rows)
+                months |= set(by_month)
+                if len(rows) < batch:
+                    return moved, len(months)
+
+    def iter_events(self, learner_id=None, kind=None, skill_id=None, since=None, until=None):
+        """Stream events in time order across the archive and the hot table.
+
+        Yields dicts with the events table's columns; `since`/`until` are unix
+        times (until exclusive). The hot table is read ITER_PAGE rows at a
+        time, each page in its own short read together with the archive
+        manifest, so a long export never pins the WAL. Rows an archive run
+        moves in the meantime are picked up from their segments instead, so
+        nothing is dropped or repeated.
+        """
+        def keep(r):
+            return ((learner_id is None or r[1] == learner_id) and (skill_id is None or r[2] == skill_id)
+                    and (kind is None or r[3] == kind) and (since is None or r[5] >= since)
+                    and (until is None or r[5] < until))
+        conds, args = ["1=1"], []
+        for col, op, val in (("learner_id", "=", learner_id), ("skill_id", "=", skill_id), ("kind", "=", kind),
+                             ("created_at", ">=", since), ("created_at", "<", until)):
+            if val is not None:
+                conds.append(f"{col} {op} ?")
+                args.append(val)
+        with self._reader() as conn:
+            segs = conn.execute(
+                "SELECT month, bytes FROM event_segments WHERE bytes > 0 "
+                "AND (? IS NULL OR max_ts >= ?) AND (? IS NULL OR min_ts < ?) ORDER BY month",
+                (since, since, until, until)).fetchall()
+            seen = dict(conn.execute("SELECT month, bytes FROM event_segments").fetchall())
+        last = None   # (created_at, id) of the last row passed, archived or hot
+        for month, size in segs:
+            for r in self.archive.read(month, size):
+                last = (r[5], r[0])
+                if keep(r):
+                    yield dict(zip(EVENT_COLS, r))
+        cursor = None  # (created_at, rowid) of the last hot row read
+        while True:
+            with self._reader() as conn:
+                conn.execute("BEGIN")  # manifest and page seen at the same point; ends when pooled
+                now = dict(conn.execute("SELECT month, bytes FROM event_segments").fetchall())
+                after = " AND (created_at, rowid) > (?, ?)" if cursor else ""
+                page = conn.execute(
+                    f"SELECT COALESCE(id, rowid), learner_id, skill_id, kind, data, created_at, rowid FROM events "
+                    f"WHERE {' AND '.join(conds)}{after} ORDER BY created_at, rowid LIMIT ?",
+                    (*args, *(cursor or ()), ITER_PAGE)).fetchall()
+            # archived since the last page: older than anything still hot, so they come first
+            for month in sorted(m for m in now if now[m] != seen.get(m)):
+                for r in self.archive.read(month, now[month]):
+                    if (last is None or (r[5], r[0]) > last) and keep(r):
+                        yield dict(zip(EVENT_COLS, r))
+            seen = now
+            for r in page:
+                yield dict(zip(EVENT_COLS, r[:6]))
+            if page:
+                cursor, last = (page[-1][5], page[-1][6]), (page[-1][5], page[-1][0])
+            if len(page) < ITER_PAGE:
+                return
+
+    def compact(self):
+        """Merge each segment's gzip members, then checkpoint and VACUUM the database.
+
+        Segments are rewritten on the calling thread. The VACUUM runs on a
+        private connection once every pooled one is closed (other handles'
+        write-behind queues should be flushed first).
+        """
+        with _archive_lock(self.path):
+            with self._reader() as conn:
+                segs = conn.execute("SELECT month, bytes FROM event_segments WHERE members > 1").fetchall()
+            for month, size in segs:
+                new = self.archive.rewrite(month, size)
+                self._write(lambda conn, month=month, new=new: conn.execute(
+                    "UPDATE event_segments SET bytes=?, members=1 WHERE month=?", (new, month)), wait=True)
+        self.flush()
+        def size():
+            return sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+        with self._pool.exclusive() as conn:
+            before = size()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"segments_merged": len(segs), "db_bytes_before": before, "db_bytes_after": size()}
+
+    def archive_stats(self):
+        with self._reader() as conn:
+            rows = conn.execute(
+                "SELECT month, events, bytes, members FROM event_segments ORDER BY month").fetchall()
+        return [{"month": r[0], "events": r[1], "bytes": r[2], "members": r[3]} for r in rows]
+
+    # ---- analytics queries (rollups only) ----
+    @staticmethod
+    def _window_sql(table, key, since):
+        """SQL for (answered, correct) since day `since` for row x, from running totals."""
+        last = f"(SELECT {{c}} FROM {table} d WHERE d.{key}=x.id ORDER BY d.day DESC LIMIT 1)"
+        before = (f"COALESCE((SELECT {{c}} FROM {table} d WHERE d.{key}=x.id AND d.day < {int(since)} "
+                  f"ORDER BY d.day DESC LIMIT 1), 0)")
+        return ", ".join(f"{last.format(c=c)} - {before.format(c=c)}" for c in ("answered_cum", "correct_cum"))
+
+    def skill_accuracy(self, subject=None, days=30):
+        """Answers and accuracy per skill over the last `days` days, weakest first."""
+        since = day_of(time.time()) - days + 1
+        where, args = ("WHERE x.subject=?", (subject,)) if subject else ("", ())
+        with self._reader() as conn:
+            rows = conn.execute(f"""
+                SELECT x.id, x.subject, x.topic, x.subtopic, {self._window_sql("skill_daily", "skill_id", since)}
+                FROM skills x {where}
+                """, args).fetchall()
+        out = [{"id": r[0], "subject": r[1], "topic": r[2], "subtopic": r[3], "answered": r[4],
+                "correct": r[5], "accuracy": round(r[5] / r[4], 3)} for r in rows if r[4]]
+        return sorted(out, key=lambda r: (r["accuracy"], -r["answered"]))
+
+    def struggling_learners(self, days=14, min_answered=5, limit=20):
+        """Learners with the lowest accuracy over the last `days` days."""
+        since = day_of(time.time()) - days + 1
+        with self._reader() as conn:
+            rows = conn.execute(f"""
+                SELECT x.id, x.name, {self._window_sql("learner_daily", "learner_id", since)},
+                       (SELECT MAX(day) FROM learner_daily d WHERE d.learner_id=x.id)
+                FROM learners x
+                """).fetchall()
+        out = [{"learner_id": r[0], "name": r[1], "answered": r[2], "correct": r[3],
+                "accuracy": round(r[3] / r[2], 3), "last_active": day_str(r[4])}
+               for r in rows if r[2] and r[2] >= min_answered]
+        return sorted(out, key=lambda r: (r["accuracy"], -r["answered"]))[:limit]
+
+    def activity(self, days=30):
+        """Class-wide per-day totals for the last `days` days, oldest first; idle days are zero."""
+        today = day_of(time.time())
+        since = today - days + 1
+        with self._reader() as conn:
+            rows = conn.execute(
+                "SELECT day, active_learners, events, answered, correct FROM daily_activity WHERE day >= ?",
+                (since,)).fetchall()
+        by_day = {r[0]: r for r in rows}
+        out = []
+        for day in range(since, today + 1):
+            _, learners, events, answered, correct = by_day.get(day, (day, 0, 0, 0, 0))
+            out.append({"day": day_str(day), "active_learners": learners, "events": events,
+                        "answered": answered, "correct": correct})
+        return out
+
     def list_skills(self, subject: str):
-        cur = self.conn.execute(
-            "SELECT id, topic, subtopic FROM skills WHERE subject=? ORDER BY topic, subtopic",
-            (subject,)
-        )
-        return [{"id":r[0], "topic":r[1], "subtopic":r[2]} for r in cur.fetchall()]
+        with self._reader() as conn:
+            rows = conn.execute(
+                "SELECT id, topic, subtopic FROM skills WHERE subject=? ORDER BY topic, subtopic",
+                (subject,)
+            ).fetchall()
+        return [{"id":r[0], "topic":r[1], "subtopic":r[2]} for r in rows]
+    
+    def skill_statuses(self, subject: str, learner_id):
+        """All skills of a subject with this learner's status, in one query."""
+        with self._reader() as conn:
+            rows = conn.execute(
+                """
+                SELECT s.id, s.topic, s.subtopic, COALESCE(p.status, 'Unseen')
+                FROM skills s
+                LEFT JOIN progress p ON p.skill_id=s.id AND p.learner_id=?
+                WHERE s.subject=? ORDER BY s.topic, s.subtopic
+                """, (learner_id, subject)
+            ).fetchall()
+        return [{"id":r[0], "topic":r[1], "subtopic":r[2], "status":r[3]} for r in rows]
     
+    def review_state(self, subject: str, learner_id):
+        """(skill, box, due_at) for every skill of a subject, in curriculum order."""
+        with self._reader() as conn:
+            rows = conn.execute(
+                """
+                SELECT s.id, s.topic, s.subtopic, COALESCE(p.box, 0), COALESCE(p.due_at, 0)
+                FROM skills s
+                LEFT JOIN progress p ON p.skill_id=s.id AND p.learner_id=?
+                WHERE s.subject=? ORDER BY s.topic, s.subtopic
+                """, (learner_id, subject)
+            ).fetchall()
+        return [({"id":r[0], "topic":r[1], "subtopic":r[2]}, r[3], r[4]) for r in rows]
+    
+    # ---- question bank ----
+    def subjects(self):
+        with self._reader() as conn:
+            return [r[0] for r in conn.execute("SELECT DISTINCT subject FROM skills ORDER BY subject")]
+
+    def bank_progress(self, lang):
+        """{(kind, subject, level, skill_id): [stored, attempts]} for one language.
+
+        `attempts` counts the generations rejected as duplicates.
+        """
+        out = {}
+        with self._reader() as conn:
+            for *key, n in conn.execute(
+                    "SELECT kind, subject, level, skill_id, COUNT(*) FROM question_bank WHERE lang=? "
+                    "GROUP BY kind, subject, level, skill_id", (lang,)):
+                out.setdefault(tuple(key), [0, 0])[0] = n
+            for *key, n in conn.execute(
+                    "SELECT kind, subject, level, skill_id, attempts FROM question_bank_jobs WHERE lang=?", (lang,)):
+                out.setdefault(tuple(key), [0, 0])[1] = n
+        return out
+
+    def bank_sample(self, kind, subject, level, lang, skill_id=0, limit=10):
+        """Some stored questions of a target, newest first (to steer generation away from them)."""
+        with self._reader() as conn:
+            return [r[0] for r in conn.execute(
+                "SELECT question FROM question_bank WHERE kind=? AND subject=? AND level=? AND lang=? "
+                "AND skill_id=? ORDER BY id DESC LIMIT ?", (kind, subject, level, lang, skill_id, limit))]
+
+    def bank_add(self, kind, subject, level, lang, skill_id, question, answer):
+        """Store a generated question; False if its target already has it.
+
+        A duplicate counts as an attempt for the target (see engine.qbank);
+        failed generations never get here, so they don't use up its budget.
+        """
+        key = (kind, subject, level, lang, skill_id or 0)
+        def add(conn):
+            cur = conn.execute("""
+                INSERT INTO question_bank(kind, subject, level, lang, skill_id, question, answer, qhash, created_at)
+                VALUES(?,?,?,?,?,?,?,?,?) ON CONFLICT(kind, subject, level, lang, skill_id, qhash) DO NOTHING
+                """, (*key, question, answer, question_hash(question), int(time.time())))
+            if cur.rowcount > 0:
+                return True
+            conn.execute("""
+                INSERT INTO question_bank_jobs(kind, subject, level, lang, skill_id, attempts) VALUES(?,?,?,?,?,1)
+                ON CONFLICT(kind, subject, level, lang, skill_id) DO UPDATE SET attempts=attempts+1
+                """, key)
+            return False
+        return self._write(add, wait=True)
+
+    def bank_reset_jobs(self, lang=None):
+        """Forget the duplicate counts, so given-up targets are tried again; returns how many were reset."""
+        where, args = ("WHERE lang=?", (lang,)) if lang else ("", ())
+        return self._write(lambda conn: conn.execute(f"DELETE FROM question_bank_jobs {where}", args).rowcount,
+                           wait=True)
+
+    def bank_take(self, learner_id, kind, subject, level, lang, skill_id=0, pick=None):
+        """Serve a banked question this learner hasn't had yet, or None if there is none left."""
+        order = "random()" if (pick or BANK_PICK) == "random" else "q.last_served, q.id"
+        now = int(time.time())
+        def take(conn):
+            row = conn.execute(f"""
+                SELECT q.id, q.question, q.answer FROM question_bank q
+                WHERE q.kind=? AND q.subject=? AND q.level=? AND q.lang=? AND q.skill_id=?
+                  AND NOT EXISTS (SELECT 1 FROM question_served s WHERE s.learner_id=? AND s.question_id=q.id)
+                ORDER BY {order} LIMIT 1
+                """, (kind, subject, level, lang, skill_id or 0, learner_id)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE question_bank SET served=served+1, last_served=? WHERE id=?", (now, row[0]))
+            conn.execute("INSERT OR IGNORE INTO question_served(learner_id, question_id, served_at) VALUES(?,?,?)",
+                         (learner_id, row[0], now))
+            return {"id": row[0], "question": row[1], "answer": row[2]}
+        return self._write(take, wait=True)
+
+    def bank_answer(self, question):
+        """Reference answer of a banked question (matched on normalized text), or None."""
+        with self._reader() as conn:
+            row = conn.execute("SELECT answer FROM question_bank WHERE qhash=? ORDER BY id LIMIT 1",
+                               (question_hash(question),)).fetchone()
+        return row[0] if row else None
+
+    def bank_stats(self):
+        with self._reader() as conn:
+            rows = conn.execute("""
+                SELECT kind, subject, level, lang, COUNT(*), SUM(served > 0) FROM question_bank
+                GROUP BY kind, subject, level, lang ORDER BY subject, level, kind
+                """).fetchall()
+        return [{"kind": r[0], "subject": r[1], "level": r[2], "lang": r[3], "questions": r[4], "served": r[5]}
+                for r in rows]
+
     def delete_skills(self, skill_id: int):
-        self.conn.execute("DELETE FROM skills WHERE id=?", (skill_id,))
-        self.conn.commit()
+        self._write(lambda conn: conn.execute("DELETE FROM skills WHERE id=?", (skill_id,)),
+                    after=self._skills_changed)
     
     def export_pack(self, subject: str) -> dict:
         skills = self.list_skills(subject)
@@ -197,4 +1198,41 @@ class DB:
             "subject": subject,
             "version": "v1",
             "skills": [{"topic": s["topic"], "subtopic": s["subtopic"]} for s in skills]
-        }
\ No newline at end of file
+        }
+
+
+# ---- Maintenance CLI ----
+# python -m engine.storage rebuild-stats [--db buddy.db]
+# python -m engine.storage rebuild-rollups [--since YYYY-MM-DD] [--db buddy.db]
+# python -m engine.storage archive [--days 180] [--db buddy.db]
+# python -m engine.storage compact [--db buddy.db]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engine.storage")
+    ap.add_argument("--db", default="buddy.db")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild-stats", help="recompute the learner_stats rollup from raw events")
+    rr = sub.add_parser("rebuild-rollups", help="recompute the per-day analytics rollups from raw events")
+    rr.add_argument("--since", help="only rebuild from this day on (YYYY-MM-DD, UTC)")
+    ar = sub.add_parser("archive", help="move old events into the monthly archive segments")
+    ar.add_argument("--days", type=int, default=RETENTION_DAYS, help="keep this many days in the hot table")
+    sub.add_parser("compact", help="merge archive segments and VACUUM the database")
+    args = ap.parse_args(argv)
+
+    db = DB(args.db)
+    if args.cmd == "rebuild-stats":
+        n = db.rebuild_learner_stats()
+        print(f"Rebuilt stats for {n} learner(s).")
+    elif args.cmd == "rebuild-rollups":
+        n = db.rebuild_rollups(parse_day(args.since) if args.since else None)
+        print(f"Rebuilt rollups ({n} learner-day row(s)).")
+    elif args.cmd == "archive":
+        n, months = db.archive_events(args.days)
+        print(f"Archived {n} event(s) into {months} month segment(s).")
+    elif args.cmd == "compact":
+        r = db.compact()
+        print(f"Merged {r['segments_merged']} segment(s); database {r['db_bytes_before']} -> {r['db_bytes_after']} bytes.")
+    db.close()
+
+if __name__ == "__main__":
+    main()
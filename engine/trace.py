@@ -0,0 +1,220 @@
+import atexit, functools, inspect, itertools, json, os, threading, time
+from collections import defaultdict, deque
+
+# ---- Latency tracing ----
+# Spans (stage name, start, duration) go into an in-memory ring buffer that
+# the Teacher tab summarizes; a background thread appends new spans to a
+# JSONL file every FLUSH_INTERVAL seconds. A "turn" is one Streamlit rerun:
+# spans opened on that thread carry its id, so slow reruns can be broken
+# down by stage. With tracing off every hook is a flag check and nothing else.
+# Tracing is opt-in (BUDDY_TRACE=1). Once the file reaches TRACE_MAX_BYTES it
+# is rotated to trace.jsonl.1, so at most two files' worth is kept on disk.
+
+ENABLED = os.getenv("BUDDY_TRACE", "0") == "1"
+TRACE_PATH = os.getenv("BUDDY_TRACE_PATH", os.path.join(".buddy_cache", "trace.jsonl"))
+TRACE_MAX_BYTES = int(os.getenv("BUDDY_TRACE_MAX_BYTES", str(10 << 20)))
+RING_SIZE = 20000
+FLUSH_INTERVAL = 5.0
+
+_ring = deque(maxlen=RING_SIZE)
+_unflushed = deque(maxlen=RING_SIZE)  # drained by the flusher; oldest dropped if it falls behind
+_local = threading.local()
+_turn_ids = itertools.count(1)
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+    if on:
+        _ensure_flusher()
+
+
+def _record(name, start, dur, attrs=None):
+    rec = (name, start, dur, getattr(_local, "turn", None), attrs)
+    _ring.append(rec)
+    _unflushed.append(rec)
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "ts", "t0")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.ts = time.time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.ts, time.perf_counter() - self.t0, self.attrs)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **attrs):
+    """Context manager timing one stage; a shared no-op when tracing is off."""
+    if not ENABLED:
+        return _NO_SPAN
+    _ensure_flusher()
+    return _Span(name, attrs or None)
+
+
+def mark(name, t0, **attrs):
+    """Record a stage that began at perf_counter() value `t0` and ends now."""
+    if not ENABLED:
+        return
+    dur = time.perf_counter() - t0
+    _record(name, time.time() - dur, dur, attrs or None)
+
+
+def traced(name):
+    """Decorator form of span(). For a generator function the span covers
+    the whole iteration, up to exhaustion or close()."""
+    def wrap(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen(*a, **kw):
+                if not ENABLED:
+                    return (yield from fn(*a, **kw))
+                with span(name):
+                    return (yield from fn(*a, **kw))
+            return gen
+        @functools.wraps(fn)
+        def inner(*a, **kw):
+            if not ENABLED:
+                return fn(*a, **kw)
+            with span(name):
+                return fn(*a, **kw)
+        return inner
+    return wrap
+
+
+def trace_methods(prefix):
+    """Class decorator: trace every public method as "<prefix>.<method>"."""
+    def wrap(cls):
+        for attr, fn in list(vars(cls).items()):
+            if attr.startswith("_") or not callable(fn) or isinstance(fn, (staticmethod, classmethod, type)):
+                continue
+            setattr(cls, attr, traced(f"{prefix}.{attr}")(fn))
+        return cls
+    return wrap
+
+
+def begin_turn(name="rerun"):
+    """Mark the start of a turn on this thread. A rerun may end by exception
+    (st.rerun, st.stop), so turns are never explicitly closed: a turn spans
+    from its first to its last recorded span."""
+    if not ENABLED:
+        return None
+    _local.turn = next(_turn_ids)
+    _record("turn." + name, time.time(), 0.0)
+    return _local.turn
+
+
+# ---- Summaries ----
+def _pct(vals, q):
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))] if vals else 0.0
+
+
+def stage_stats() -> list:
+    """p50/p95/p99 per stage over the ring buffer, slowest p95 first."""
+    by_name = defaultdict(list)
+    for name, _, dur, _, _ in list(_ring):
+        if not name.startswith("turn."):
+            by_name[name].append(dur * 1000)
+    out = []
+    for name, ms in by_name.items():
+        ms.sort()
+        out.append({"stage": name, "count": len(ms), "p50_ms": round(_pct(ms, 0.5), 2),
+                    "p95_ms": round(_pct(ms, 0.95), 2), "p99_ms": round(_pct(ms, 0.99), 2),
+                    "max_ms": round(ms[-1], 2)})
+    return sorted(out, key=lambda r: -r["p95_ms"])
+
+
+def slowest_turns(n=10) -> list:
+    """Recent turns by wall time, each with time per stage."""
+    turns = {}
+    for name, start, dur, turn, _ in list(_ring):
+        if turn is None:
+            continue
+        t = turns.setdefault(turn, {"turn": turn, "name": None, "start": start, "end": start,
+                                    "stages": defaultdict(float)})
+        if name.startswith("turn."):
+            t["name"] = name[5:]
+            continue
+        t["start"] = min(t["start"], start)
+        t["end"] = max(t["end"], start + dur)
+        t["stages"][name] += dur * 1000
+    out = []
+    for t in turns.values():
+        out.append({"turn": t["turn"], "name": t["name"], "at": int(t["start"]),
+                    "total_ms": round((t["end"] - t["start"]) * 1000, 1),
+                    "stages": {k: round(v, 1) for k, v in sorted(t["stages"].items(), key=lambda kv: -kv[1])}})
+    return sorted(out, key=lambda r: -r["total_ms"])[:n]
+
+
+def clear():
+    _ring.clear()
+    _unflushed.clear()
+
+
+# ---- Flushing ----
+def flush(path=None):
+    """Append spans recorded since the last flush to the JSONL file."""
+    path = path or TRACE_PATH
+    lines = []
+    while True:
+        try:
+            name, start, dur, turn, attrs = _unflushed.popleft()
+        except IndexError:
+            break
+        rec = {"stage": name, "ts": round(start, 6), "ms": round(dur * 1000, 3), "turn": turn}
+        if attrs:
+            rec["attrs"] = attrs
+        lines.append(json.dumps(rec, default=str))
+    if not lines:
+        return 0
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _rotate(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return len(lines)
+
+
+def _rotate(path):
+    try:
+        if TRACE_MAX_BYTES and os.path.getsize(path) >= TRACE_MAX_BYTES:
+            os.replace(path, path + ".1")
+    except FileNotFoundError:
+        pass
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None or not TRACE_PATH:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="buddy-trace-flush", daemon=True)
+            _flusher.start()
+            atexit.register(lambda: flush())
@@ -0,0 +1,302 @@
+import asyncio, os, time, uuid
+
+from engine import aio, model
+from engine.safety import check_batch, check_user_input, screen_stream_async
+from engine.scheduler import BACKGROUND, INTERACTIVE
+from engine.schemas import AnswerEval, DiagQuestion
+
+# ---- Tutoring flow ----
+# The diagnostic -> lesson -> game loop: prompts and rules shared by the
+# Streamlit app, and TutorSession, which runs the whole flow for one learner
+# on an event loop so a single process can serve many of them. Questions
+# come from the pre-generated bank (engine.qbank) while it has unseen ones
+# for the learner, and from the model after that.
+
+LEVELS = ("Beginner", "Intermediate", "Advanced")
+DIAG_QUESTIONS = 3
+DIAG_HINT = '{"question": "string"}'
+EVAL_HINT = '{"correct": true/false, "feedback": "string", "next_question": "string"}'
+FALLBACK_DIAG = "What is 2 + 3?"
+FALLBACK_FEEDBACK = "Thanks! Here is a short explanation and a hint."
+FALLBACK_NEXT = "Try 4 + 3 = ?"
+FALLBACK_GAME = "What is 6 + 7?"
+GAME_VARIANTS = 8    # distinct cached questions per skill
+# A cached diagnostic question is the same first question for every learner
+# until it expires, so the response cache only serves them when asked to.
+DIAG_CACHE = os.getenv("BUDDY_DIAG_CACHE", "0") == "1"
+GAME_XP = (10, -3)   # per correct / wrong answer
+
+
+def diag_goal():
+    return "Create ONE short diagnostic question."
+
+def diag_task(subject, level, lang):
+    return f"Subject: {subject}. Level: {level}. Language: {lang}. Keep it concise and objective."
+
+def level_for_score(score):
+    return LEVELS[0] if score <= 1 else LEVELS[1] if score == 2 else LEVELS[2]
+
+def eval_goal():
+    return "Judge the student's answer; give step-by-step feedback; return a follow-up question."
+
+def _reference(reference):
+    return f"Reference answer: {reference}\n" if reference else ""
+
+def eval_task(question, answer, level, lang, reference=None):
+    return (f"Question: {question}\n"
+            f"{_reference(reference)}"
+            f"Student answer: {answer}\n"
+            f"Level: {level}\nLanguage: {lang}\n"
+            "Be strict but kind. Keep feedback short.")
+
+def lesson_system(subject, level, lang):
+    """Fixed system message of the lesson chat; the stable prefix the backend reuses."""
+    return (f"You are Buddy, a patient offline tutor for {subject}. "
+            f"Student level: {level}. Language: {lang}. Keep every reply short.")
+
+def lesson_task(skill):
+    return f"Teach {skill['subtopic']} with one short example, then ask ONE question."
+
+def chat_eval_task(answer, question=None, reference=None):
+    """Judge an answer in the lesson chat; `question` only if the chat doesn't hold it yet."""
+    asked = f"Question: {question}\n" if question else ""
+    return (f"{asked}{_reference(reference)}Student answer: {answer}\n"
+            "Judge the answer to the question; give step-by-step feedback and ONE follow-up question. "
+            "Be strict but kind. Keep feedback short.")
+
+def game_question_prompt(subject, level, skill):
+    return (f"You are Buddy, the quizmaster for {subject}. "
+            f"Give ONE {level} level question for subtopic '{skill['subtopic']}'. "
+            f"Keep it short; do not include the answer.")
+
+def game_question_options(n):
+    # a per-round seed keeps a skill from repeating the same cached question,
+    # while learners on the same round still share generations
+    return {"seed": n % GAME_VARIANTS}
+
+def screened(text, fallback):
+    return text if text and check_user_input(text)[0] else fallback
+
+def finish_eval(j):
+    """Fill in what the model left out and screen what it wrote."""
+    # a judgment that didn't parse never counts as correct
+    j.setdefault("correct", False)
+    j.setdefault("feedback", FALLBACK_FEEDBACK)
+    j.setdefault("next_question", FALLBACK_NEXT)
+    # model output goes through the same screen as learner input
+    fb_ok, q_ok = check_batch([j["feedback"], j["next_question"]])
+    if not fb_ok[0]:
+        j["feedback"] = FALLBACK_FEEDBACK
+    if not q_ok[0]:
+        j["next_question"] = FALLBACK_NEXT
+    return j
+
+
+class TutorSession:
+    """One learner's diagnostic -> lesson -> game flow on the event loop.
+
+    start() returns the first diagnostic question. answer() checks a reply
+    in whatever mode the session is in and says what comes next. In lesson
+    mode, lesson() streams the teaching turn for the current skill whenever
+    `question` is None. start_game() runs a timed quiz whose questions are
+    generated ahead in the background. Both raise LookupError while the
+    subject has no skills.
+    """
+
+    def __init__(self, db: aio.AsyncDB, name, subject, level="Beginner", lang="English", prefetch=3):
+        self.db = db
+        self.name = name
+        self.subject = subject
+        self.level = level
+        self.lang = lang
+        self.prefetch = prefetch
+        self.session_id = uuid.uuid4().hex
+        self.learner = None
+        self.mode = None          # "diagnostic", "lesson" or "game"
+        self.question = None      # awaiting an answer
+        self.skill = None
+        self.diag_q = self.diag_score = 0
+        self.game = None
+        self._ahead = None
+        self._filler = None
+
+    @property
+    def system(self):
+        return lesson_system(self.subject, self.level, self.lang)
+
+    async def _banked(self, kind, skill=None):
+        hit = await self.db.bank_take(self.learner, kind, self.subject, self.level, self.lang,
+                                      skill["id"] if skill else 0)
+        return hit["question"] if hit else None
+
+    # -- diagnostic --
+    async def start(self) -> str:
+        self.learner = await self.db.ensure_learner(self.name, self.lang)
+        model.end_conversation(self.session_id)
+        self.mode, self.diag_q, self.diag_score, self.skill = "diagnostic", 0, 0, None
+        self.question = await self._banked("diag")
+        if self.question is None:
+            j = await aio.ask_llm_json(diag_goal(), diag_task(self.subject, self.level, self.lang), DIAG_HINT,
+                                       cache=DIAG_CACHE, schema=DiagQuestion, priority=INTERACTIVE, learner=self.learner)
+            self.question = screened(j.get("question"), FALLBACK_DIAG)
+        return self.question
+
+    async def _eval(self, answer):
+        reference = await self.db.bank_answer(self.question)
+        # judgments depend on the learner's answer; always ask fresh
+        j = await aio.ask_llm_json(eval_goal(), eval_task(self.question, answer, self.level, self.lang, reference),
+                                   EVAL_HINT, cache=False, schema=AnswerEval,
+                                   priority=INTERACTIVE, learner=self.learner)
+        return finish_eval(j)
+
+    async def answer(self, text) -> dict:
+        """Check an answer to `question`. Blocked input comes back with "blocked": True."""
+        ok, msg = check_user_input(text)
+        if not ok:
+            return {"blocked": True, "feedback": msg}
+        if self.question is None:
+            raise RuntimeError(f"No question to answer in {self.mode!r} mode")
+        if self.mode == "diagnostic":
+            return await self._answer_diag(text)
+        if self.mode == "lesson":
+            return await self._answer_lesson(text)
+        return await self._answer_game(text)
+
+    async def _answer_diag(self, text):
+        res = await self._eval(text)
+        self.diag_score += int(bool(res["correct"]))
+        self.diag_q += 1
+        out = {"correct": bool(res["correct"]), "feedback": res["feedback"], "mode": "diagnostic"}
+        if self.diag_q >= DIAG_QUESTIONS:
+            self.level = level_for_score(self.diag_score)
+            self.mode, self.question = "lesson", None
+            out.update(done=True, level=self.level)
+        else:
+            self.question = await self._banked("diag") or res["next_question"]
+        out["next_question"] = self.question
+        return out
+
+    # -- lesson --
+    async def lesson(self):
+        """Stream the teaching turn for the current skill; it ends with the question to answer."""
+        if self.skill is None:
+            self.skill = await self.db.pick_next_skill(self.learner, self.subject)
+        if self.skill is None:
+            raise LookupError(f"No skills for {self.subject}")
+        banked = await self._banked("lesson", self.skill)
+        if banked:
+            # recorded in the chat as if the model had just said it
+            model.conversation(self.session_id, self.system).add(lesson_task(self.skill), banked)
+            self.question = banked
+            yield banked
+            return
+        parts = []
+        async for chunk in screen_stream_async(aio.chat_stream(self.session_id, self.system, lesson_task(self.skill),
+                                                               priority=INTERACTIVE, learner=self.learner)):
+            parts.append(chunk)
+            yield chunk
+        self.question = "".join(parts).strip()
+
+    async def _answer_lesson(self, text):
+        c = model.conversation(self.session_id, self.system)
+        task = chat_eval_task(text, None if c.said(self.question) else self.question,
+                              await self.db.bank_answer(self.question))
+        res = finish_eval(await aio.chat_json(self.session_id, self.system, task, EVAL_HINT, schema=AnswerEval,
+                                              priority=INTERACTIVE, learner=self.learner))
+        correct = bool(res["correct"])
+        await self.db.update_progress(self.learner, self.skill, correct)
+        skill = self.skill
+        self.skill = await self.db.pick_next_skill(self.learner, self.subject)
+        same = self.skill is not None and self.skill["id"] == skill["id"]
+        self.question = res["next_question"] if same else None  # new skill: teach it first
+        return {"correct": correct, "feedback": res["feedback"], "mode": "lesson",
+                "next_question": self.question, "new_skill": not same}
+
+    # -- game --
+    async def _game_question(self, skill, n, priority):
+        banked = await self._banked("game", skill)
+        if banked:
+            return banked
+        q = await aio.ask_llm(game_question_prompt(self.subject, self.level, skill),
+                              options=game_question_options(n), priority=priority, learner=self.learner)
+        return screened(q.strip(), FALLBACK_GAME)
+
+    def _next_round(self):
+        # prefetched and live questions draw rounds (and with them seeds) from one counter
+        self.game["seeds"] += 1
+        return self.game["seeds"]
+
+    async def _fill(self):
+        while True:
+            try:
+                skill = await self.db.pick_next_skill(self.learner, self.subject)
+                if skill is None:
+                    await asyncio.sleep(1.0)  # no skills yet; the teacher may still add some
+                    continue
+                await self._ahead.put((skill, await self._game_question(skill, self._next_round(), BACKGROUND)))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(1.0)
+
+    async def start_game(self, duration=60) -> str:
+        await self.stop_game()
+        self.mode = "game"
+        self.game = {"started": time.monotonic(), "duration": duration, "score": 0, "xp": 0, "round": 0,
+                     "seeds": 0}
+        self._ahead = asyncio.Queue(maxsize=self.prefetch)
+        self._filler = asyncio.get_running_loop().create_task(self._fill())
+        try:
+            return await self.next_game_question()
+        except LookupError:
+            await self.stop_game()
+            raise
+
+    def time_left(self) -> float:
+        if not self.game:
+            return 0.0
+        return max(0.0, self.game["duration"] - (time.monotonic() - self.game["started"]))
+
+    async def next_game_question(self) -> str:
+        try:
+            self.skill, self.question = self._ahead.get_nowait()
+        except asyncio.QueueEmpty:
+            # nothing prefetched yet: generate this one at interactive priority
+            skill = await self.db.pick_next_skill(self.learner, self.subject)
+            if skill is None:
+                raise LookupError(f"No skills for {self.subject}")
+            self.skill = skill
+            self.question = await self._game_question(skill, self._next_round(), INTERACTIVE)
+        self.game["round"] += 1
+        return self.question
+
+    async def _answer_game(self, text):
+        res = await self._eval(text)
+        correct = bool(res["correct"])
+        g = self.game
+        g["score"] += correct
+        g["xp"] = max(0, g["xp"] + GAME_XP[0 if correct else 1])
+        if self.skill:
+            await self.db.update_progress(self.learner, self.skill, correct)
+        out = {"correct": correct, "feedback": res["feedback"], "mode": "game",
+               "score": g["score"], "xp": g["xp"]}
+        if self.time_left() > 0:
+            out["next_question"] = await self.next_game_question()
+        else:
+            await self.stop_game()
+            out.update(done=True, next_question=None)
+        return out
+
+    async def stop_game(self):
+        """End the quiz (if any) and go back to the lesson; returns its score and XP."""
+        if self._filler is not None:
+            self._filler.cancel()
+            await asyncio.gather(self._filler, return_exceptions=True)
+            self._filler = None
+        if self.mode == "game":
+            self.mode, self.skill, self.question = "lesson", None, None
+        return {k: self.game[k] for k in ("score", "xp")} if self.game else None
+
+    async def close(self):
+        await self.stop_game()
+        model.end_conversation(self.session_id)
@@ -0,0 +1,117 @@
+import json, os, re, socket, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# keep test runs from writing caches or traces into the working directory
+os.environ.setdefault("BUDDY_LLM_CACHE", "")
+os.environ.setdefault("BUDDY_TRACE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from engine import model
+
+
+# ---- Stand-in for `ollama serve` ----
+# Speaks /api/generate and /api/chat: NDJSON over chunked transfer encoding
+# when streaming, one JSON body otherwise. Records every request with the
+# client port it came from, so tests can tell a reused connection from a new one.
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.socks.append(self.connection)
+
+    def _send(self, status, body, ctype="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        srv = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        srv.requests.append((self.path, payload, self.client_address[1]))
+        if srv.delay:
+            time.sleep(srv.delay)
+        if srv.status != 200:
+            return self._send(srv.status, b'{"error": "boom"}')
+        chat = self.path == "/api/chat"
+        reply = srv.reply(payload) if callable(srv.reply) else srv.reply
+        if not payload.get("stream", True):
+            return self._send(200, json.dumps({"response": reply, "done": True}).encode())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for tok in re.findall(r"\s*\S+", reply):
+            self._chunk({"message": {"role": "assistant", "content": tok}} if chat else {"response": tok})
+            if srv.token_delay:
+                time.sleep(srv.token_delay)
+        self._chunk({"done": True, "prompt_eval_count": 12, "prompt_eval_duration": 3_000_000})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _chunk(self, msg):
+        data = json.dumps(msg).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.requests = []
+        self.socks = []
+        self.reply = "Hello there friend"
+        self.status = 200
+        self.delay = 0.0
+        self.token_delay = 0.0
+
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up mid-reply is part of the tests
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def connections(self) -> int:
+        """Distinct client connections that sent a request."""
+        return len({port for _, _, port in self.requests})
+
+    def drop_connections(self):
+        """Close every open connection from the server side, as an idle timeout would."""
+        for s in self.socks:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+@pytest.fixture
+def ollama():
+    srv = StandIn()
+    threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.drop_connections()
+    srv.server_close()
+
+
+@pytest.fixture
+def backend():
+    """Restores the process-wide LLM backend after the test."""
+    saved = model._backend
+    yield model
+    with model._backend_lock:
+        current, model._backend = model._backend, saved
+    if current is not None and current is not saved:
+        current.close()
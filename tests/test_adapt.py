@@ -0,0 +1,75 @@
+from engine.adapt import PICK_SNOOZE, ReviewIndex, pick_next_skill, update_progress
+from engine.storage import DB, LEITNER_INTERVALS, MAX_BOX, leitner_next
+
+
+def _skill(i):
+    return {"id": i, "topic": "T", "subtopic": f"S{i}"}
+
+
+def test_leitner_boxes():
+    assert leitner_next(0, True, 1000) == (1, 1000 + LEITNER_INTERVALS[1])
+    assert leitner_next(3, True, 0) == (4, LEITNER_INTERVALS[4])
+    assert leitner_next(MAX_BOX, True, 0)[0] == MAX_BOX
+    assert leitner_next(5, False, 0) == (1, LEITNER_INTERVALS[1])
+
+
+def test_overdue_first_weaker_box_breaks_ties():
+    now = 10_000
+    idx = ReviewIndex([(_skill(1), 3, now - 50), (_skill(2), 1, now - 50), (_skill(3), 0, 0),
+                       (_skill(4), 2, now - 500)], version=0)
+    assert [idx.pick(now)["id"] for _ in range(3)] == [4, 2, 1]
+
+
+def test_new_skills_in_curriculum_order_before_future_reviews():
+    now = 10_000
+    idx = ReviewIndex([(_skill(1), 2, now + PICK_SNOOZE + 100), (_skill(2), 0, 0), (_skill(3), 0, 0)], version=0)
+    assert [idx.pick(now)["id"] for _ in range(2)] == [2, 3]
+    # nothing new or overdue left: whatever comes due first (the snoozed pick)
+    assert idx.pick(now)["id"] == 2
+
+
+def test_picked_skill_steps_aside():
+    now = 10_000
+    idx = ReviewIndex([(_skill(1), 1, now - 10), (_skill(2), 1, now - 5)], version=0)
+    assert idx.pick(now)["id"] == 1
+    assert idx.pick(now)["id"] == 2
+    # both snoozed: the one that comes due first
+    assert idx.pick(now)["id"] == 1
+    assert idx.state[1][0] == now + PICK_SNOOZE
+
+
+def test_update_moves_skill_through_boxes():
+    idx = ReviewIndex([(_skill(1), 0, 0)], version=0)
+    idx.update(1, True, now=100)
+    assert idx.state[1] == (100 + LEITNER_INTERVALS[1], 1)
+    idx.update(1, True, now=200)
+    assert idx.state[1] == (200 + LEITNER_INTERVALS[2], 2)
+    idx.update(1, False, now=300)
+    assert idx.state[1] == (300 + LEITNER_INTERVALS[1], 1)
+
+
+def test_pick_next_skill_none_without_skills(tmp_path):
+    db = DB(str(tmp_path / "buddy.db"))
+    learner = db.ensure_learner("Ada", "English")
+    assert pick_next_skill(db, learner, "History") is None
+
+
+def test_answers_persist_and_reschedule(tmp_path):
+    db = DB(str(tmp_path / "buddy.db"))
+    learner = db.ensure_learner("Ada", "English")
+    db.insert_skills([("Math", "Arithmetic", "Addition"), ("Math", "Arithmetic", "Subtraction")])
+    first = pick_next_skill(db, learner, "Math")
+    assert first["subtopic"] == "Addition" and first["subject"] == "Math"
+    update_progress(db, learner, first, True)
+    # the answered skill is due later; the unseen one comes next
+    assert pick_next_skill(db, learner, "Math")["subtopic"] == "Subtraction"
+    box = {s["id"]: b for s, b, _ in db.review_state("Math", learner)}
+    assert box[first["id"]] == 1
+
+
+def test_new_skill_rebuilds_index(tmp_path):
+    db = DB(str(tmp_path / "buddy.db"))
+    learner = db.ensure_learner("Ada", "English")
+    assert pick_next_skill(db, learner, "Math") is None
+    db.insert_skill("Math", "Arithmetic", "Addition")
+    assert pick_next_skill(db, learner, "Math")["subtopic"] == "Addition"
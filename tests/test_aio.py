@@ -0,0 +1,131 @@
+import asyncio, gc, threading, time
+
+import pytest
+from pydantic import BaseModel
+
+from engine import aio
+from engine.backends import FakeBackend, HTTPBackend
+from engine.tutor import DIAG_QUESTIONS, TutorSession
+
+
+class Pair(BaseModel):
+    a: int
+    b: str
+
+
+@pytest.fixture
+def adb(tmp_path):
+    db = aio.AsyncDB(str(tmp_path / "buddy.db"))
+    db.db.insert_skills([("Math", "Arithmetic", "Addition"), ("Math", "Arithmetic", "Subtraction")])
+    yield db
+    db.db.close()
+
+
+def test_full_session_on_fake_backend(backend, adb):
+    backend.set_backend(FakeBackend())
+    async def main():
+        s = TutorSession(adb, "Ada", "Math", prefetch=2)
+        assert await s.start() == "What is 2 + 3?"
+        for _ in range(DIAG_QUESTIONS):
+            res = await s.answer("5")
+        assert res["done"] and s.mode == "lesson" and res["level"]
+        assert "".join([c async for c in s.lesson()]) and s.question
+        res = await s.answer("5")
+        assert res["correct"] and res["mode"] == "lesson"
+        q = await s.start_game(duration=60)
+        assert q and s.mode == "game"
+        res = await s.answer("7")
+        assert (res["score"], res["next_question"] is not None) == (1, True)
+        assert await s.stop_game() == {"score": 1, "xp": res["xp"]}
+        assert s.mode == "lesson"
+        await s.close()
+        await adb.close()
+    asyncio.run(main())
+
+
+def test_subject_without_skills_raises_lookup_error(backend, adb):
+    backend.set_backend(FakeBackend())
+    async def main():
+        s = TutorSession(adb, "Ada", "History")
+        await s.start()
+        s.mode = "lesson"
+        with pytest.raises(LookupError):
+            [c async for c in s.lesson()]
+        with pytest.raises(LookupError):
+            await s.start_game()
+        assert s.mode == "lesson" and s._filler is None
+        await s.close()
+        await adb.close()
+    asyncio.run(main())
+
+
+def test_async_client_reuses_connections(backend, ollama):
+    backend.set_backend(HTTPBackend(ollama.url, "llama3.1"))
+    async def main():
+        return [await aio.ask_llm(f"q{i}", cache=False) for i in range(3)]
+    assert asyncio.run(main()) == ["Hello there friend"] * 3
+    assert ollama.connections == 1
+
+
+def test_one_client_per_loop(backend, ollama):
+    b = HTTPBackend(ollama.url, "llama3.1")
+    async def pair():
+        return aio._client_for(b), aio._client_for(b)
+    first, again = asyncio.run(pair())
+    assert first is again
+    other, _ = asyncio.run(pair())
+    assert other is not first
+    gc.collect()
+    assert not any(c in (first, other) for _, c in aio._clients.values())
+    async def switch():
+        a = aio._client_for(b)
+        return a, aio._client_for(HTTPBackend(ollama.url, "llama3.1"))
+    a, c = asyncio.run(switch())
+    assert a is not c
+
+
+def test_relay_stops_producer_when_consumer_leaves():
+    produced, closed = [], threading.Event()
+    def tokens():
+        try:
+            for i in range(100_000):
+                produced.append(i)
+                yield f"t{i} "
+        finally:
+            closed.set()
+    async def main():
+        got = []
+        async for tok in aio._relay(tokens):
+            got.append(tok)
+            if len(got) == 3:
+                break
+        await asyncio.sleep(0)
+        return got
+    assert asyncio.run(main()) == ["t0 ", "t1 ", "t2 "]
+    assert closed.wait(2)
+    assert len(produced) <= aio.RELAY_QUEUE + 10   # held back by the bounded queue
+
+
+def test_relay_passes_errors_through():
+    def tokens():
+        yield "a"
+        raise RuntimeError("backend down")
+    async def main():
+        return [tok async for tok in aio._relay(tokens)]
+    with pytest.raises(RuntimeError, match="backend down"):
+        asyncio.run(main())
+
+
+def test_json_refix_prompts_match_sync_path(backend):
+    replies = ['{"a": "not a number", "b": "x"}', '{"a": 7}']
+    sync = backend.set_backend(FakeBackend(replies))
+    assert backend.ask_llm_json("goal", "task", "{}", cache=False, schema=Pair) == {"a": 7, "b": "x"}
+    assert backend.chat_json("s1", "sys", "task", "{}", schema=Pair) == {"a": 7, "b": "x"}
+    backend.end_conversation("s1")
+    fake = backend.set_backend(FakeBackend(replies))
+    async def main():
+        return (await aio.ask_llm_json("goal", "task", "{}", cache=False, schema=Pair),
+                await aio.chat_json("s1", "sys", "task", "{}", schema=Pair))
+    assert asyncio.run(main()) == ({"a": 7, "b": "x"}, {"a": 7, "b": "x"})
+    backend.end_conversation("s1")
+    assert fake.calls == sync.calls and len(fake.calls) == 4
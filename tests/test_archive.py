@@ -0,0 +1,106 @@
+import gzip, threading, time
+
+import pytest
+
+from engine import storage
+from engine.storage import DAY, DB, day_of
+
+
+@pytest.fixture
+def db(tmp_path):
+    d = DB(str(tmp_path / "buddy.db"))
+    yield d
+    d.close()
+
+
+def _add_events(db, days_ago, per_day=3, learner=1):
+    today = day_of(time.time()) * DAY
+    for d in days_ago:
+        for i in range(per_day):
+            ts = today - d * DAY + i
+            db._write(lambda conn, ts=ts: DB._insert_event(conn, learner, 1, "answer", '{"correct": 1}', ts))
+
+
+def _stamps(events):
+    return [e["created_at"] for e in events]
+
+
+def test_archive_then_read_across_both(db):
+    _add_events(db, [400, 370, 200, 10, 1])
+    everything = list(db.iter_events())
+    assert db.archive_events(older_than_days=180, batch=4) == (9, 3)
+    assert [s["month"] for s in db.archive_stats()] == sorted(s["month"] for s in db.archive_stats())
+    with db._reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 6
+    assert list(db.iter_events()) == everything
+    since = everything[5]["created_at"]
+    assert _stamps(db.iter_events(since=since)) == _stamps(everything[5:])
+    assert db.archive_events(older_than_days=180) == (0, 0)
+
+
+def test_archive_during_iteration_neither_drops_nor_repeats(db, monkeypatch):
+    monkeypatch.setattr(storage, "ITER_PAGE", 2)
+    _add_events(db, [300, 250, 200, 5])
+    expected = _stamps(db.iter_events())
+    it = db.iter_events()
+    got = [next(it)["created_at"] for _ in range(3)]
+    db.archive_events(older_than_days=100)           # moves rows the iterator hasn't reached yet
+    got += _stamps(it)
+    assert got == expected
+
+
+def test_uncommitted_tail_is_cut_before_next_append(db):
+    _add_events(db, [300])
+    db.archive_events(older_than_days=180)
+    (seg,) = db.archive_stats()
+    with open(db.archive.path(seg["month"]), "ab") as f:
+        f.write(gzip.compress(b'[999,1,1,"answer","{}",1]\n'))  # a run that never committed
+    assert len(list(db.iter_events())) == 3
+    _add_events(db, [299], per_day=1)
+    db.archive_events(older_than_days=180)
+    assert len(list(db.iter_events())) == 4
+
+
+def test_segment_changed_underneath_rolls_back(db, monkeypatch):
+    _add_events(db, [300])
+    db.archive_events(older_than_days=180)
+    _add_events(db, [300], per_day=1)
+    real = db.archive.append
+    def racing_append(month, rows, committed=0):
+        size = real(month, rows, committed)
+        db._write(lambda conn: conn.execute("UPDATE event_segments SET bytes=bytes+1"), wait=True)
+        return size
+    monkeypatch.setattr(db.archive, "append", racing_append)
+    with pytest.raises(RuntimeError, match="changed"):
+        db.archive_events(older_than_days=180)
+    with db._reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 1
+
+
+def test_compact_merges_segments_and_vacuums_with_pool_busy(db):
+    _add_events(db, [300, 299, 298])
+    for days in (300, 299, 298):   # one day per run
+        db.archive_events(older_than_days=days)
+    multi = [s["month"] for s in db.archive_stats() if s["members"] > 1]
+    assert sum(s["members"] for s in db.archive_stats()) == 3 and multi   # may straddle a month end
+    before = list(db.iter_events())
+    held = db._pool.get()
+    threading.Timer(0.2, db._pool.put, args=(held,)).start()   # handed back while compact waits
+    rep = db.compact()
+    assert rep["segments_merged"] == len(multi)
+    assert all(s["members"] == 1 for s in db.archive_stats())
+    assert list(db.iter_events()) == before
+
+
+def test_exclusive_holds_back_new_connections(db):
+    pool = db._pool
+    got = []
+    with pool.exclusive() as conn:
+        th = threading.Thread(target=lambda: got.append(pool.get()))
+        th.start()
+        time.sleep(0.1)
+        assert not got
+        conn.execute("SELECT 1")
+    th.join(2)
+    assert got
+    pool.put(got[0])
@@ -0,0 +1,287 @@
+import io, json, sys, threading, types, wave
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from engine import audio
+
+
+def _wav(frames, rate=audio.STT_RATE, channels=1):
+    """int16 samples as WAV bytes."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(np.asarray(frames, dtype="<i2").tobytes())
+    return buf.getvalue()
+
+
+# ---- STT ----
+# Vosk isn't needed: a stand-in recognizer finishes an utterance every
+# UTTER_CHUNKS waveform chunks and reports the same partial in between.
+UTTER_CHUNKS = 3
+
+
+class FakeRecognizer:
+    def __init__(self, model, rate):
+        assert rate == audio.STT_RATE
+        self.chunks = []
+        self.pending = 0
+        self.utterances = 0
+
+    def SetWords(self, on):
+        pass
+
+    def AcceptWaveform(self, data):
+        self.chunks.append(len(data))
+        self.pending += 1
+        if self.pending == UTTER_CHUNKS:
+            self.pending = 0
+            self.utterances += 1
+            return True
+        return False
+
+    def Result(self):
+        return json.dumps({"text": f"utterance {self.utterances}"})
+
+    def PartialResult(self):
+        return json.dumps({"partial": "hello" if self.pending else ""})
+
+    def FinalResult(self):
+        return json.dumps({"text": "tail" if self.pending else ""})
+
+
+@pytest.fixture
+def vosk(monkeypatch, tmp_path):
+    """A stand-in vosk module; returns the model directory to pass around."""
+    fake = types.ModuleType("vosk")
+    fake.Model = lambda path: ("model", path)
+    fake.KaldiRecognizer = FakeRecognizer
+    monkeypatch.setitem(sys.modules, "vosk", fake)
+    monkeypatch.setattr(audio, "_models_cache", {})
+    return str(tmp_path)
+
+
+class ThreadPool(ThreadPoolExecutor):
+    """ProcessPoolExecutor stand-in: workers are threads, so they see the fake vosk."""
+
+    def __init__(self, workers, mp_context=None, initializer=None, initargs=()):
+        super().__init__(workers, initializer=initializer, initargs=initargs)
+
+
+class BrokenPool:
+    """A pool whose workers have died."""
+
+    def __init__(self, at_submit=True):
+        self.at_submit = at_submit
+        self.shut = False
+
+    def submit(self, fn, *args):
+        if self.at_submit:
+            raise BrokenProcessPool("a worker died")
+        fut = Future()
+        fut.set_exception(BrokenProcessPool("a worker died"))
+        return fut
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut = True
+
+
+@pytest.fixture
+def service(vosk, monkeypatch):
+    monkeypatch.setattr(audio, "ProcessPoolExecutor", ThreadPool)
+    svc = audio.TranscriptionService(vosk, workers=2, timeout=5)
+    yield svc
+    svc.shutdown()
+
+
+def test_pcm16_wav_passes_through_in_blocks(monkeypatch):
+    monkeypatch.setattr(audio, "DECODE_FRAMES", 1000)
+    samples = (np.arange(2500) % 200 - 100).astype("int16")
+    blocks = list(audio._pcm_blocks(_wav(samples)))
+    assert [len(b) for b in blocks] == [2000, 2000, 1000]
+    assert b"".join(blocks) == samples.astype("<i2").tobytes()
+
+
+def test_array_is_resampled_block_by_block(monkeypatch):
+    monkeypatch.setattr(audio, "DECODE_FRAMES", 4410)
+    stereo = np.full((4410 * 3, 2), 0.5, dtype="float32")
+    blocks = list(audio._pcm_blocks(stereo, 44100))
+    assert [len(b) for b in blocks] == [1600 * 2] * 3   # 16k mono int16
+    middle = np.frombuffer(blocks[1], dtype="<i2")[400:1200]
+    assert np.abs(middle - 16383).max() < 200
+
+
+def test_int_array_is_scaled_and_needs_a_rate():
+    pcm = b"".join(audio._pcm_blocks(np.array([0, 16384, -32767], dtype="int16"), audio.STT_RATE))
+    assert np.frombuffer(pcm, dtype="<i2").tolist() == [0, 16384, -32767]
+    with pytest.raises(ValueError):
+        list(audio._pcm_blocks(np.zeros(10, dtype="int16")))
+
+
+def test_other_rates_are_decoded_and_resampled():
+    pcm = b"".join(audio._pcm_blocks(_wav(np.zeros(8000), rate=8000)))
+    assert len(pcm) == 16000 * 2
+
+
+def test_stt_stream_partials_and_finals(vosk):
+    clip = _wav(np.zeros(audio.FEED_FRAMES * 7))
+    assert list(audio.stt_stream(clip, vosk)) == [
+        ("hello", False), ("utterance 1", True),   # the repeated partial is sent once
+        ("hello", False), ("utterance 2", True),
+        ("hello", False), ("tail", True)]
+    assert audio.stt_transcribe(clip, vosk) == "utterance 1 utterance 2 tail"
+
+
+def test_stt_stream_feeds_fixed_chunks(vosk, monkeypatch):
+    seen = []
+    class Recorder(FakeRecognizer):
+        def __init__(self, model, rate):
+            super().__init__(model, rate)
+            seen.append(self)
+    monkeypatch.setattr(sys.modules["vosk"], "KaldiRecognizer", Recorder)
+    list(audio.stt_stream(np.zeros(audio.FEED_FRAMES * 2 + 10, dtype="float32"), vosk, audio.STT_RATE))
+    assert seen[0].chunks == [audio.FEED_FRAMES * 2, audio.FEED_FRAMES * 2, 20]
+
+
+def test_missing_model_dir_is_reported(vosk, tmp_path):
+    with pytest.raises(RuntimeError, match="Vosk model not found"):
+        list(audio.stt_stream(_wav(np.zeros(10)), str(tmp_path / "missing")))
+
+
+def test_service_transcribes_and_times(service):
+    clip = _wav(np.zeros(audio.FEED_FRAMES * 4))
+    assert service.transcribe(clip) == "utterance 1 tail"
+    assert service.submit(np.zeros(10, dtype="int16"), audio.STT_RATE).result(5) == "tail"
+    assert service.stats()["requests"] == 2
+    assert set(service.timings[0]) == {"pid", "queue_ms", "decode_ms", "total_ms"}
+
+
+def test_service_replaces_a_broken_pool_on_submit(service):
+    service._pool = broken = BrokenPool()
+    assert service.transcribe(_wav(np.zeros(10))) == "tail"
+    assert broken.shut and service.restarts == 1
+
+
+def test_worker_death_fails_the_request_and_restarts(service):
+    service._pool = broken = BrokenPool(at_submit=False)
+    with pytest.raises(BrokenProcessPool):
+        service.transcribe(_wav(np.zeros(10)))
+    assert broken.shut and service.restarts == 1
+    assert service.transcribe(_wav(np.zeros(10))) == "tail"
+
+
+def test_health_replaces_a_broken_pool(service):
+    assert service.health() == {"ok": True, "workers": 2, "pids": [audio.os.getpid()], "restarts": 0}
+    service._pool = broken = BrokenPool()
+    h = service.health()
+    assert (h["ok"], h["restarts"]) == (False, 1) and "a worker died" in h["error"]
+    assert broken.shut and isinstance(service._pool, ThreadPool)
+    assert service.health()["ok"]
+
+
+def test_warm_up_and_state(service):
+    assert service.state() == "cold"
+    service.warm_up()
+    assert service.state() == "ready"
+    service._warm = [service._pool.submit(audio._get_vosk_model, "/no/such/model")]
+    service._warm[0].exception()
+    assert service.state().startswith("error: Vosk model not found")
+
+
+def test_service_stream_relays_partials(service):
+    clip = _wav(np.zeros(audio.FEED_FRAMES * 4))
+    assert list(service.stream(clip)) == [("hello", False), ("utterance 1", True), ("hello", False), ("tail", True)]
+
+
+# ---- TTS ----
+@pytest.fixture
+def tts_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(audio, "TTS_CACHE_DIR", str(tmp_path / "tts"))
+    monkeypatch.setattr(audio, "_tts_memory", audio.LRU(max_entries=2))
+    return tmp_path / "tts"
+
+
+def test_tts_key_covers_text_voice_and_rate():
+    base = audio.tts_key("Hello", None, 180)
+    assert audio.tts_key("Hello", None, 180) == base
+    assert len({base, audio.tts_key("Hello!", None, 180), audio.tts_key("Hello", "en-gb", 180),
+                audio.tts_key("Hello", None, 150)}) == 4
+
+
+def test_tts_cache_memory_then_disk(tts_cache):
+    assert audio.tts_cached("Hello") is None
+    key = audio.tts_key("Hello")
+    audio._tts_store(key, b"RIFF-hello")
+    assert (tts_cache / key[:2] / f"{key}.wav").read_bytes() == b"RIFF-hello"
+    assert audio.tts_cached("Hello") == b"RIFF-hello"
+    for text in ("one", "two"):   # pushes Hello out of the two-entry memory tier
+        audio._tts_store(audio.tts_key(text), text.encode())
+    assert audio._tts_memory.get(key) is None
+    assert audio.tts_cached("Hello") == b"RIFF-hello"   # from disk, and back in memory
+    assert audio._tts_memory.get(key) == b"RIFF-hello"
+    assert audio.tts_cached("Hello", voice="en-gb") is None
+
+
+def test_disk_prune_drops_least_recently_used(tts_cache, monkeypatch):
+    monkeypatch.setattr(audio, "TTS_DISK_MAX_BYTES", 25)
+    keys = [audio.tts_key(t) for t in ("a", "b", "c")]
+    for i, key in enumerate(keys):
+        audio._disk_put(key, b"x" * 10)
+        audio.os.utime(audio._disk_path(key), (1000 + i, 1000 + i))
+    assert audio._disk_get(keys[0]) is not None   # reading refreshes its mtime
+    audio._disk_prune()
+    assert [audio._disk_get(k) is not None for k in keys] == [True, False, True]
+
+
+@pytest.fixture
+def synth(tts_cache, monkeypatch):
+    """Stand-in engine: records each synthesis; the first one waits for `gate`."""
+    calls, gate = [], threading.Event()
+    def synthesize(text, voice=None, rate=audio.TTS_RATE):
+        if not calls:
+            gate.wait(5)
+        calls.append(text)
+        if text == "boom":
+            raise RuntimeError("no voice")
+        return f"wav:{text}".encode()
+    monkeypatch.setattr(audio, "_synthesize", synthesize)
+    monkeypatch.setattr(audio, "_tts", lambda: "engine")
+    return calls, gate
+
+
+def test_tts_worker_speak_jumps_ahead_of_presynthesis(synth):
+    calls, gate = synth
+    w = audio._TTSWorker()
+    first = w.submit("first")
+    later = w.submit("later", priority=audio.TTS_PRESYNTH)
+    soon = w.submit("soon", priority=audio.TTS_PRESYNTH)
+    # someone now waits on "soon": the same future, queued again ahead of "later"
+    assert w.submit("soon") is soon
+    gate.set()
+    assert (first.result(5), later.result(5), soon.result(5)) == (b"wav:first", b"wav:later", b"wav:soon")
+    assert calls == ["first", "soon", "later"]   # the stale entry for "soon" was skipped
+    assert w.submit("soon").result(0) == b"wav:soon" and len(calls) == 3   # cache hit
+    assert audio.tts_cached("later") == b"wav:later"
+
+
+def test_tts_worker_failure_is_not_sticky(synth):
+    calls, gate = synth
+    gate.set()
+    w = audio._TTSWorker()
+    with pytest.raises(RuntimeError, match="no voice"):
+        w.submit("boom").result(5)
+    assert not w._pending
+    with pytest.raises(RuntimeError):
+        w.submit("boom").result(5)
+    assert calls == ["boom", "boom"]
+
+
+def test_tts_worker_warm_loads_engine(synth, monkeypatch):
+    w = audio._TTSWorker()
+    assert w.warm().result(5) is None
+    monkeypatch.setattr(audio, "_tts", lambda: 1 / 0)
+    assert isinstance(w.warm().exception(5), ZeroDivisionError)
@@ -0,0 +1,130 @@
+import os, stat
+
+import pytest
+
+from engine.backends import FakeBackend, HTTPBackend, SubprocessBackend, flatten_messages
+
+
+def test_generate_reuses_pooled_connection(ollama):
+    b = HTTPBackend(ollama.url, "llama3.1")
+    assert b.generate("hi") == "Hello there friend"
+    assert b.generate("again") == "Hello there friend"
+    assert len(ollama.requests) == 2
+    assert ollama.connections == 1
+
+
+def test_stream_reuses_connection_after_full_read(ollama):
+    b = HTTPBackend(ollama.url, "llama3.1")
+    assert "".join(b.stream("hi")) == "Hello there friend"
+    assert "".join(b.stream("hi")) == "Hello there friend"
+    assert ollama.connections == 1
+
+
+def test_stream_stopped_early_is_not_pooled(ollama):
+    ollama.reply = " ".join(["word"] * 2000)
+    b = HTTPBackend(ollama.url, "llama3.1")
+    tokens = b.stream("hi")
+    next(tokens)
+    tokens.close()
+    assert b._pool.empty()
+
+
+def test_chat_stream_reports_prompt_eval(ollama):
+    b = HTTPBackend(ollama.url, "llama3.1")
+    stats = {}
+    msgs = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hi"}]
+    assert "".join(b.chat_stream(msgs, stats=stats)) == "Hello there friend"
+    path, payload, _ = ollama.requests[-1]
+    assert path == "/api/chat"
+    assert payload["messages"] == msgs
+    assert stats == {"prompt_eval_count": 12, "prompt_eval_duration": 3_000_000}
+
+
+def test_payload_carries_keep_alive_and_options(ollama):
+    b = HTTPBackend(ollama.url, "llama3.1", keep_alive="45m")
+    b.generate("hi", {"seed": 3})
+    "".join(b.stream("hi"))
+    (_, plain, _), (_, streamed, _) = ollama.requests
+    assert plain["keep_alive"] == streamed["keep_alive"] == "45m"
+    assert plain["stream"] is False and streamed["stream"] is True
+    assert plain["options"] == {"seed": 3}
+    assert plain["model"] == "llama3.1"
+
+
+def test_stale_pooled_socket_is_retried(ollama):
+    b = HTTPBackend(ollama.url, "llama3.1")
+    b.generate("hi")
+    ollama.drop_connections()
+    assert b.generate("hi") == "Hello there friend"
+    assert ollama.connections == 2
+
+
+def test_read_timeout(ollama):
+    ollama.delay = 1.0
+    b = HTTPBackend(ollama.url, "llama3.1", read_timeout=0.2)
+    with pytest.raises(TimeoutError):
+        b.generate("hi")
+    with pytest.raises(TimeoutError):
+        "".join(b.stream("hi"))
+    assert b._pool.empty()
+
+
+def test_error_status_raises(ollama):
+    ollama.status = 500
+    b = HTTPBackend(ollama.url, "llama3.1")
+    with pytest.raises(RuntimeError, match="500"):
+        b.generate("hi")
+
+
+def test_connection_refused():
+    b = HTTPBackend("http://127.0.0.1:9", "llama3.1", connect_timeout=0.5)
+    with pytest.raises(OSError):
+        b.generate("hi")
+
+
+def test_fake_backend_replies():
+    b = FakeBackend(["one two", "three"])
+    assert b.generate("a") == "one two"
+    assert list(b.stream("b")) == ["three"]
+    assert b.calls == ["a", "b"]
+    assert FakeBackend(lambda p: p.upper()).generate("x y") == "X Y"
+
+
+def test_flatten_messages():
+    text = flatten_messages([{"role": "system", "content": "S"}, {"role": "user", "content": "U"}])
+    assert text == "System: S\n\nUser: U\n\nAssistant:"
+
+
+@pytest.fixture
+def echo_exe(tmp_path):
+    if os.name == "nt":
+        pytest.skip("needs a POSIX shell")
+    exe = tmp_path / "ollama"
+    exe.write_text("#!/bin/sh\ncat\n")
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    return str(exe)
+
+
+def test_subprocess_backend(echo_exe):
+    b = SubprocessBackend(echo_exe, "llama3.1", timeout=10)
+    assert b.generate("echo me") == "echo me"
+    assert "".join(b.stream("stream me")) == "stream me"
+
+
+def test_set_backend_switches(backend, ollama, echo_exe):
+    fake = backend.set_backend("fake")
+    assert isinstance(fake, FakeBackend)
+    assert "2 + 3" in backend.ask_llm("hi", cache=False)
+
+    http = backend.set_backend(HTTPBackend(ollama.url, "llama3.1"))
+    assert backend.get_backend() is http
+    assert backend.ask_llm("hi", cache=False) == "Hello there friend"
+    assert "".join(backend.ask_llm_stream("hi", cache=False)) == "Hello there friend"
+
+    backend.set_backend(SubprocessBackend(echo_exe, "llama3.1"))
+    assert backend.ask_llm("over a pipe", cache=False) == "over a pipe"
+    assert http._pool.empty()  # the replaced backend was closed
+
+    assert isinstance(backend.make_backend("subprocess"), SubprocessBackend)
+    with pytest.raises(ValueError):
+        backend.set_backend("carrier-pigeon")
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+import pytest
+
+from engine import model
+from engine.backends import FakeBackend
+
+
+class ChatFake(FakeBackend):
+    """FakeBackend that also keeps the message lists it was sent."""
+
+    def __init__(self, responder=None):
+        super().__init__(responder)
+        self.sent = []
+
+    def chat_stream(self, messages, options=None, stats=None):
+        self.sent.append([dict(m) for m in messages])
+        return super().chat_stream(messages, options, stats)
+
+
+@pytest.fixture(autouse=True)
+def convos(monkeypatch):
+    monkeypatch.setattr(model, "_convos", OrderedDict())
+    return model._convos
+
+
+def _say(session, user, system="sys"):
+    return "".join(model.chat_stream(session, system, user)).strip()
+
+
+def test_later_turns_resend_the_history(backend):
+    fake = backend.set_backend(ChatFake(["Hi Ada", "Four"]))
+    assert _say("s", "Hello") == "Hi Ada"
+    assert _say("s", "2 + 2?") == "Four"
+    assert fake.sent[1] == [{"role": "system", "content": "sys"},
+                            {"role": "user", "content": "Hello"},
+                            {"role": "assistant", "content": "Hi Ada"},
+                            {"role": "user", "content": "2 + 2?"}]
+    # the first turn's messages are an unchanged prefix of the second's
+    assert fake.sent[1][:2] == fake.sent[0]
+
+
+def test_stopped_stream_leaves_no_turn(backend):
+    backend.set_backend(ChatFake("one two three"))
+    tokens = model.chat_stream("s", "sys", "Hello")
+    next(tokens)
+    tokens.close()
+    assert model.conversation("s", "sys").turns == []
+
+
+def test_failed_turn_is_not_recorded(backend):
+    def boom(prompt):
+        raise RuntimeError("backend down")
+    backend.set_backend(ChatFake(boom))
+    with pytest.raises(RuntimeError):
+        _say("s", "Hello")
+    assert model.conversation("s", "sys").turns == []
+
+
+def test_chat_json_keeps_only_valid_replies(backend):
+    fake = backend.set_backend(ChatFake(["no json at all", '{"a": 1}', "Good"]))
+    assert model.chat_json("s", "sys", "task", "{}")["error"] is True
+    assert model.conversation("s", "sys").turns == []
+    assert model.chat_json("s", "sys", "task", "{}") == {"a": 1}
+    assert _say("s", "Thanks") == "Good"
+    assert fake.sent[2][1:] == [{"role": "user", "content": model.chat_json_message("task", "{}")},
+                                {"role": "assistant", "content": '{"a": 1}'},
+                                {"role": "user", "content": "Thanks"}]
+
+
+def test_new_system_message_starts_over(backend):
+    backend.set_backend(ChatFake("ok"))
+    _say("s", "Hello")
+    assert model.conversation("s", "other").turns == []
+
+
+def test_history_is_trimmed_in_whole_turns(monkeypatch):
+    monkeypatch.setattr(model, "CONVO_MAX_CHARS", 100)
+    c = model.Conversation("s" * 10)
+    for i in range(5):
+        c.add(f"u{i}" + "x" * 8, f"a{i}" + "y" * 8)   # 20 chars a turn
+        if i == 3:
+            assert len(c.turns) == 8 and c.chars == 90
+    # the fifth turn made it 110 > 100: the oldest went, down to 50
+    assert [t[1][:2] for t in c.turns] == ["u3", "a3", "u4", "a4"]
+    assert c.chars == 10 + 2 * 20 == len(c.system) + sum(len(t[1]) for t in c.turns)
+
+
+def test_evict_idle_and_least_recent(convos, monkeypatch):
+    for sid in ("a", "b", "c"):
+        model.conversation(sid, "sys")
+    convos["a"].used -= model.CONVO_TTL + 1
+    model._evict_convos(convos["c"].used)
+    assert list(convos) == ["b", "c"]
+    monkeypatch.setattr(model, "CONVO_MAX_SESSIONS", 2)
+    model.conversation("b", "sys")   # b becomes the most recent
+    model.conversation("d", "sys")
+    assert list(convos) == ["b", "d"]
+    monkeypatch.setattr(model, "CONVO_TOTAL_CHARS", 2 * len("sys") + 5)
+    convos["d"].add("hello", "world")
+    model.conversation("b", "sys")
+    assert list(convos) == ["b"]
+    assert model.conversation_stats() == {"sessions": 1, "chars": 3}
@@ -0,0 +1,67 @@
+import io, json
+
+import pytest
+
+from engine.curriculum import BUNDLED_DIR, import_dir, import_pack, iter_pack, merge_pack_into_db
+from engine.storage import DB
+
+
+@pytest.fixture
+def db(tmp_path):
+    d = DB(str(tmp_path / "buddy.db"))
+    yield d
+    d.close()
+
+
+def _pack(subject, skills, **extra):
+    return io.BytesIO(json.dumps(dict(extra, subject=subject, skills=skills)).encode())
+
+
+def _count(db):
+    with db._reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM skills").fetchone()[0]
+
+
+def test_small_chunks_and_subject_after_skills():
+    data = b'\xef\xbb\xbf{"skills": [{"topic": "T\xc3\xa9", "subtopic": "A"}, 12345678], "subject": "Math"}'
+    header = {}
+    pairs = list(iter_pack(io.BytesIO(data), chunk_size=3, header=header))
+    assert pairs == [("Math", {"topic": "Té", "subtopic": "A"}), ("Math", 12345678)]
+    assert header == {"subject": "Math"}
+
+
+def test_import_report_and_idempotence(db):
+    skills = [{"topic": "T", "subtopic": "A"}, {"topic": "T", "subtopic": "A"},
+              {"topic": "T", "subtopic": "B"}, {"topic": ""}, "junk"]
+    assert import_pack(db, _pack("Math", skills)) == {"subject": "Math", "inserted": 2, "skipped": 1, "invalid": 2}
+    assert import_pack(db, _pack("Math", skills))["inserted"] == 0
+    assert _count(db) == 2
+
+
+def test_empty_pack_reports_declared_subject(db):
+    assert import_pack(db, _pack("Science", [])) == {"subject": "Science", "inserted": 0, "skipped": 0, "invalid": 0}
+    assert merge_pack_into_db(db, {"subject": "Science", "skills": []})["subject"] == "Science"
+
+
+def test_broken_pack_writes_nothing(db):
+    data = b'{"subject": "Math", "skills": [{"topic": "T", "subtopic": "A"}, {"topic": '
+    with pytest.raises(ValueError):
+        import_pack(db, io.BytesIO(data))
+    with pytest.raises(ValueError, match="missing subject"):
+        import_pack(db, io.BytesIO(b'{"skills": [{"topic": "T", "subtopic": "A"}]}'))
+    assert _count(db) == 0
+
+
+def test_pack_is_one_write(db, monkeypatch):
+    writes = []
+    real = db._write
+    monkeypatch.setattr(db, "_write", lambda fn, **kw: writes.append(fn) or real(fn, **kw))
+    skills = [{"topic": "T", "subtopic": f"S{i}"} for i in range(5000)]
+    assert import_pack(db, _pack("Math", skills), chunk_size=1024)["inserted"] == 5000
+    assert len(writes) == 1 and _count(db) == 5000
+
+
+def test_bundled_packs_import(db):
+    rep = import_dir(db, BUNDLED_DIR)
+    assert rep["packs"] == 3 and not rep["errors"] and rep["inserted"] > 0
+    assert import_dir(db, BUNDLED_DIR)["inserted"] == 0
@@ -0,0 +1,53 @@
+from pydantic import BaseModel
+
+from engine.backends import FakeBackend, HTTPBackend
+from engine.schemas import AnswerEval
+from engine.tutor import finish_eval
+
+
+class Pair(BaseModel):
+    a: int
+    b: str
+
+
+def test_json_stops_at_first_object(backend):
+    fake = backend.set_backend(FakeBackend('Sure! {"a": 1, "b": "x"} and some rambling after it'))
+    assert backend.ask_llm_json("goal", "task", "{}", cache=False, schema=Pair) == {"a": 1, "b": "x"}
+    assert len(fake.calls) == 1
+
+
+def test_json_refixes_only_failed_fields(backend):
+    fake = backend.set_backend(FakeBackend(['{"a": "not a number", "b": "x"}', '{"a": 7}']))
+    assert backend.ask_llm_json("goal", "task", "{}", cache=False, schema=Pair) == {"a": 7, "b": "x"}
+    assert "Fix ONLY these fields: a" in fake.calls[1]
+
+
+def test_json_failure_is_flagged(backend):
+    backend.set_backend(FakeBackend("no json here, sorry"))
+    j = backend.ask_llm_json("goal", "task", "{}", cache=False, schema=Pair)
+    assert j["error"] is True and j["raw"] == "no json here, sorry"
+
+
+def test_unparsed_judgment_is_never_correct(backend):
+    backend.set_backend(FakeBackend("That answer is incorrect, the correct one is 5"))
+    j = finish_eval(backend.ask_llm_json("goal", "task", "{}", cache=False, schema=AnswerEval))
+    assert j["correct"] is False
+    assert j["feedback"] and j["next_question"]
+
+
+def test_json_early_stop_keeps_connection_pooled(backend, ollama):
+    ollama.reply = '{"a": 1, "b": "x"}\n\n'
+    http = backend.set_backend(HTTPBackend(ollama.url, "llama3.1"))
+    for _ in range(3):
+        assert backend.ask_llm_json("goal", "task", "{}", cache=False, schema=Pair) == {"a": 1, "b": "x"}
+    assert ollama.connections == 1
+    assert ollama.requests[0][1]["format"] == "json"
+    assert "options" not in ollama.requests[0][1]
+
+
+def test_long_tail_after_json_closes_connection(backend, ollama):
+    ollama.reply = '{"a": 1, "b": "x"} ' + " ".join(["more"] * 200)
+    ollama.token_delay = 0.01
+    http = backend.set_backend(HTTPBackend(ollama.url, "llama3.1", drain_timeout=0.05))
+    assert backend.ask_llm_json("goal", "task", "{}", cache=False, schema=Pair) == {"a": 1, "b": "x"}
+    assert http._pool.empty()
@@ -0,0 +1,87 @@
+import threading, time
+
+from engine.prefetch import QuestionPrefetcher
+
+
+def _wait(cond, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not cond() and time.monotonic() < end:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_prefetches_in_round_order():
+    pf = QuestionPrefetcher(lambda: {"id": 1}, lambda skill, n: f"q{n}", depth=3).start()
+    try:
+        assert _wait(lambda: pf.ready() == 3)
+        assert [pf.get()[1:] for _ in range(3)] == [("q1", 1), ("q2", 2), ("q3", 3)]
+    finally:
+        pf.stop(wait=1.0)
+
+
+def test_live_rounds_never_repeat_prefetched_ones():
+    pf = QuestionPrefetcher(lambda: {"id": 1}, lambda skill, n: f"q{n}", depth=2).start()
+    try:
+        assert _wait(lambda: pf.ready() == 2)
+        live = pf.next_round()              # what the page uses when nothing is ready
+        served = [pf.get()[2] for _ in range(2)]
+        assert _wait(lambda: pf.ready() == 2)
+        served += [pf.get()[2] for _ in range(2)]
+        assert live not in served
+        assert len(set(served)) == 4
+    finally:
+        pf.stop(wait=1.0)
+
+
+def test_stop_drops_queue_and_ends_thread():
+    pf = QuestionPrefetcher(lambda: {"id": 1}, lambda skill, n: "q", depth=2).start()
+    assert _wait(lambda: pf.ready() == 2)
+    pf.stop(wait=2.0)
+    assert pf.get() is None
+    assert not pf._thread.is_alive()
+
+
+def test_idle_timeout_stops_abandoned_prefetcher():
+    pf = QuestionPrefetcher(lambda: {"id": 1}, lambda skill, n: "q", depth=1, idle_timeout=0.2).start()
+    assert _wait(lambda: not pf._thread.is_alive())
+    assert pf.stopped.is_set()
+
+
+def test_no_skill_waits_instead_of_spinning():
+    calls = []
+    def pick():
+        calls.append(1)
+        return None
+    pf = QuestionPrefetcher(pick, lambda skill, n: "q", retry_delay=0.1).start()
+    time.sleep(0.35)
+    pf.stop(wait=1.0)
+    assert len(calls) <= 5
+    assert pf.ready() == 0
+
+
+def test_errors_are_kept_and_retried():
+    attempts = []
+    def make(skill, n):
+        attempts.append(n)
+        if len(attempts) == 1:
+            raise RuntimeError("model down")
+        return "q"
+    pf = QuestionPrefetcher(lambda: {"id": 1}, make, depth=1, retry_delay=0.05).start()
+    try:
+        assert _wait(lambda: pf.ready() == 1)
+        assert isinstance(pf.last_error, RuntimeError)
+    finally:
+        pf.stop(wait=1.0)
+
+
+def test_stop_cancels_in_flight_generation():
+    started = threading.Event()
+    def make(skill, n):
+        started.set()
+        pf.stopped.wait(5)
+        return "late"
+    pf = QuestionPrefetcher(lambda: {"id": 1}, make).start()
+    assert started.wait(1)
+    pf.stop(wait=1.0)
+    assert not pf._thread.is_alive()
+    assert pf.get() is None
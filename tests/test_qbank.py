@@ -0,0 +1,92 @@
+import itertools, json
+
+import pytest
+
+from engine import qbank
+from engine.backends import FakeBackend
+from engine.storage import DB
+
+ONE = dict(levels=["Beginner"], kinds=["game"])
+
+
+@pytest.fixture
+def db(tmp_path):
+    d = DB(str(tmp_path / "buddy.db"))
+    d.insert_skills([("Math", "Arithmetic", "Addition"), ("Math", "Arithmetic", "Subtraction")])
+    yield d
+    d.close()
+
+
+def _numbered():
+    n = itertools.count(1)
+    return lambda prompt: json.dumps({"question": f"What is {next(n)} + 1?", "answer": "x"})
+
+
+def test_fill_tops_up_and_resumes(backend, db):
+    backend.set_backend(FakeBackend(_numbered()))
+    total = qbank.fill(db, k=3, workers=2, **ONE)
+    assert (total["targets"], total["added"], total["incomplete"], total["stopped"]) == (2, 6, 0, False)
+    assert qbank.fill(db, k=3, **ONE)["targets"] == 0
+    assert qbank.fill(db, k=4, **ONE)["added"] == 2
+
+
+def test_duplicates_use_up_budget_until_reset(backend, db):
+    backend.set_backend(FakeBackend('{"question": "What is 1 + 1?", "answer": "2"}'))
+    total = qbank.fill(db, k=2, **ONE)
+    assert total["added"] == 2                         # the same text is fine in two targets
+    assert total["duplicates"] == 2 * (2 * qbank.MAX_ATTEMPTS)
+    assert total["incomplete"] == 2
+    assert qbank.fill(db, k=2, **ONE)["targets"] == 0  # given up
+    assert db.bank_reset_jobs("English") == 2
+    assert qbank.fill(db, k=2, **ONE)["targets"] == 2
+
+
+def test_failed_generations_do_not_burn_budget(backend, db):
+    backend.set_backend(FakeBackend("not json at all"))
+    total = qbank.fill(db, k=2, **ONE)
+    assert total["failed"] > 0 and total["added"] == 0
+    assert all(attempts == 0 for _, attempts in db.bank_progress("English").values())
+    backend.set_backend(FakeBackend(_numbered()))
+    assert qbank.fill(db, k=2, **ONE)["added"] == 4
+
+
+def test_backend_error_is_reported_per_target(backend, db):
+    def reply(prompt):
+        if "Subtraction" in prompt:
+            raise RuntimeError("model crashed")
+        return _numbered()(prompt)
+    backend.set_backend(FakeBackend(reply))
+    reports = {}
+    total = qbank.fill(db, k=1, on_target=lambda t, rep: reports.__setitem__(t[3]["subtopic"], rep), **ONE)
+    assert reports["Addition"]["complete"] and reports["Addition"]["error"] is None
+    assert not reports["Subtraction"]["complete"] and "model crashed" in reports["Subtraction"]["error"]
+    assert (total["errors"], total["stopped"]) == (1, False)
+
+
+def test_repeated_connection_errors_stop_the_run(db, monkeypatch):
+    calls = []
+    def down(*a, **kw):
+        calls.append(1)
+        raise ConnectionRefusedError("refused")
+    monkeypatch.setattr(qbank, "generate", down)
+    monkeypatch.setattr(qbank, "BACKOFF", 0.01)
+    total = qbank.fill(db, k=5, workers=1, **ONE)
+    assert total["stopped"] and total["added"] == 0
+    assert len(calls) == qbank.MAX_CONN_ERRORS
+
+
+def test_take_never_repeats_and_answers_are_found(db):
+    assert db.bank_add("game", "Math", "Beginner", "English", 1, "What is 2 + 2?", "4")
+    assert db.bank_add("game", "Math", "Beginner", "English", 1, "What is 3 + 3?", "6")
+    assert not db.bank_add("game", "Math", "Beginner", "English", 1, "what is 2+2", "4")
+    learner = db.ensure_learner("Ada", "English")
+    got = {db.bank_take(learner, "game", "Math", "Beginner", "English", 1)["question"] for _ in range(2)}
+    assert got == {"What is 2 + 2?", "What is 3 + 3?"}
+    assert db.bank_take(learner, "game", "Math", "Beginner", "English", 1) is None
+    assert db.bank_answer("WHAT is 3 + 3 ?") == "6"
+
+
+def test_same_text_in_two_targets(db):
+    assert db.bank_add("game", "Math", "Beginner", "English", 2, "What is 2 + 2?", "4")
+    assert db.bank_add("game", "Math", "Advanced", "English", 2, "What is 2 + 2?", "four")
+    assert db.bank_answer("What is 2 + 2?") == "4"   # the first one stored
@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+from engine import storage
+from engine.storage import DAY, DB, day_of, day_str
+
+TODAY = day_of(time.time())
+TABLES = {"skill_daily": "skill_id, day", "learner_daily": "learner_id, day", "daily_activity": "day"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Settable stand-in for time.time() as storage sees it."""
+    now = [TODAY * DAY + 3600]
+    monkeypatch.setattr(storage.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def db(tmp_path, clock):
+    db = DB(str(tmp_path / "buddy.db"))
+    db.insert_skills([("Math", "Arithmetic", "Addition"), ("Math", "Arithmetic", "Subtraction")])
+    yield db
+    db.close()
+
+
+def _rollups(db, before=TODAY + 1):
+    with db._reader() as conn:
+        return {t: conn.execute(f"SELECT * FROM {t} WHERE day < ? ORDER BY {order}", (before,)).fetchall()
+                for t, order in TABLES.items()}
+
+
+def _history(db, clock):
+    """Five days of answers and notes from two learners, the last day being today."""
+    ada, bob = db.ensure_learner("Ada", "English"), db.ensure_learner("Bob", "English")
+    add, sub = (s["id"] for s in db.list_skills("Math"))
+    for back in range(4, -1, -1):
+        clock[0] = (TODAY - back) * DAY + 3600
+        for i in range(3):
+            db.record_answer(ada, add, i != back % 3)
+        db.record_answer(bob, sub, back % 2 == 0)
+        db.log_event(ada, add, "note")
+        if back == 2:
+            continue   # Bob skips a day
+        db.record_answer(bob, add, False)
+    # odd "correct" values written by other tools: only true and 1 count
+    db.log_event(bob, sub, "answer", '{"correct": 1}')
+    db.log_event(bob, sub, "answer", '{"correct": "yes"}')
+    db.log_event(bob, sub, "answer", "not json")
+    return ada, bob, add, sub
+
+
+def test_incremental_rollups_match_rebuild(db, clock):
+    _history(db, clock)
+    incremental = _rollups(db)
+    assert db.rebuild_rollups() == 2 * 5
+    assert _rollups(db) == incremental
+
+
+def test_running_totals_add_up(db, clock):
+    ada, *_ = _history(db, clock)
+    with db._reader() as conn:
+        rows = conn.execute("SELECT answered, correct, answered_cum, correct_cum FROM learner_daily "
+                            "WHERE learner_id=? ORDER BY day", (ada,)).fetchall()
+    assert [r[2] for r in rows] == [3, 6, 9, 12, 15]
+    assert rows[-1][3] == sum(r[1] for r in rows) == 10
+
+
+def test_rebuild_since_catches_up_bypassed_events(db, clock):
+    ada, bob, add, sub = _history(db, clock)
+    # a backfill that skipped the rollups, two days ago and today
+    db._write(lambda conn: conn.executemany(
+        "INSERT INTO events(learner_id, skill_id, kind, data, created_at) VALUES(?,?,?,?,?)",
+        [(ada, sub, "answer", '{"correct": true}', (TODAY - 2) * DAY + 60),
+         (ada, sub, "answer", '{"correct": false}', TODAY * DAY + 60)]))
+    kept = _rollups(db, before=TODAY - 2)
+    db.rebuild_rollups(since_day=TODAY - 2)
+    # days before the cutoff are left alone, later ones pick up the backfill
+    assert _rollups(db, before=TODAY - 2) == kept
+    caught_up = _rollups(db)
+    db.rebuild_rollups()
+    assert _rollups(db) == caught_up
+    sub_3d = {r["id"]: r for r in db.skill_accuracy("Math", days=3)}[sub]
+    assert (sub_3d["answered"], sub_3d["correct"]) == (3 + 3 + 2, 2 + 1 + 1)
+
+
+def test_skill_accuracy_window(db, clock):
+    _, _, add, sub = _history(db, clock)
+    today = {r["id"]: r for r in db.skill_accuracy("Math", days=1)}
+    assert (today[add]["answered"], today[add]["correct"]) == (4, 2)
+    assert (today[sub]["answered"], today[sub]["correct"]) == (4, 2)
+    week = {r["id"]: r for r in db.skill_accuracy("Math", days=7)}
+    assert (week[add]["answered"], week[add]["correct"]) == (19, 10)
+    assert (week[sub]["answered"], week[sub]["correct"]) == (8, 4)
+    assert db.skill_accuracy("History") == []
+
+
+def test_struggling_learners_window(db, clock):
+    ada, bob, *_ = _history(db, clock)
+    rows = db.struggling_learners(days=2, min_answered=1)
+    assert [r["learner_id"] for r in rows] == [bob, ada]
+    assert (rows[0]["answered"], rows[0]["correct"]) == (7, 2)
+    assert rows[0]["last_active"] == day_str(TODAY)
+    assert db.struggling_learners(days=2, min_answered=7) == rows[:1]
+    assert db.struggling_learners(days=2, min_answered=1, limit=1) == rows[:1]
+
+
+def test_activity_fills_idle_days(db, clock):
+    _history(db, clock)
+    days = db.activity(days=7)
+    assert [d["day"] for d in days] == [day_str(d) for d in range(TODAY - 6, TODAY + 1)]
+    assert [d["active_learners"] for d in days] == [0, 0, 2, 2, 2, 2, 2]
+    assert days[-1] == {"day": day_str(TODAY), "active_learners": 2, "events": 9, "answered": 8, "correct": 4}
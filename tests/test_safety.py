@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from engine import safety
+from engine.safety import BLOCK_MESSAGE, Matcher, StreamScanner, check_user_input, screen_stream
+
+
+@pytest.fixture
+def matcher():
+    return Matcher(safety.BLOCKLIST)
+
+
+@pytest.mark.parametrize("text", ["how do I self-harm", "SELF_HARM", "Self Harm", "Drugs are bad",
+                                  "a weapon", "terrorists", "sexy", "Gambling odds"])
+def test_blocked(matcher, text):
+    assert matcher.search(text)
+
+
+@pytest.mark.parametrize("text", ["My terrier lives in Essex", "We bought it at the drugstore",
+                                  "the sextant and sextet", "a terrific weaponsmith-free story",
+                                  "Plants need water and sunlight"])
+def test_no_false_positives(matcher, text):
+    assert matcher.search(text) is None
+
+
+def test_accents_and_multiword_terms():
+    m = Matcher(["crème brûlée", "bad*"])
+    assert m.search("I like CREME brulee a lot") == "crème brûlée"
+    assert m.search("crème and brûlée") is None
+    assert m.find_all("badly badger bad") == ["bad*", "bad*", "bad*"]
+
+
+def test_stream_scanner_holds_back_split_word(matcher):
+    sc = StreamScanner(matcher)
+    assert sc.feed("Plants need dr") == "Plants need "
+    assert sc.feed("ugs to") == ""
+    assert sc.hit == "drugs"
+
+
+def test_stream_scanner_releases_clean_text(matcher):
+    sc = StreamScanner(matcher)
+    out = "".join(sc.feed(c) for c in ["The drug", "store sells self", "-help books"]) + sc.close()
+    assert out == "The drugstore sells self-help books"
+    assert sc.hit is None
+
+
+def test_screen_stream_replaces_and_closes_source():
+    closed = []
+    def source():
+        try:
+            yield "Let's talk about "
+            yield "weap"
+            yield "ons and more"
+        finally:
+            closed.append(True)
+    assert "".join(screen_stream(source())) == "Let's talk about \n\n" + BLOCK_MESSAGE
+    assert closed == [True]
+    assert "".join(screen_stream(iter(["two ", "plus ", "two"]))) == "two plus two"
+
+
+def test_reload_from_list_file(tmp_path, monkeypatch):
+    path = tmp_path / "extra.txt"
+    path.write_text("# local additions\nspoilers\n", encoding="utf-8")
+    monkeypatch.setattr(safety, "BLOCKLIST_PATHS", [str(path)])
+    monkeypatch.setattr(safety, "RELOAD_CHECK", 0)
+    try:
+        safety.reload()
+        assert check_user_input("no spoilers please")[0] is False
+        path.write_text("cliffhanger\n", encoding="utf-8")
+        os.utime(path, ns=(0, 1))   # force a visible mtime change
+        assert check_user_input("no spoilers please")[0] is True
+        assert check_user_input("what a cliffhanger")[0] is False
+    finally:
+        monkeypatch.undo()
+        safety.reload()
@@ -0,0 +1,126 @@
+import asyncio, threading, time
+
+import pytest
+
+from engine.scheduler import (BACKGROUND, INTERACTIVE, NORMAL, Cancelled, DeadlineExceeded, Scheduler)
+
+
+def _queue_behind(s, blocker, requests):
+    """Start one thread per (priority, learner, name) while `blocker` holds the only slot;
+    returns the order in which they were granted."""
+    order, threads = [], []
+    def run(priority, learner, name):
+        with s.slot(priority, learner):
+            order.append(name)
+    for req in requests:
+        th = threading.Thread(target=run, args=req)
+        th.start()
+        threads.append(th)
+        time.sleep(0.02)  # fixed arrival order
+    s.release(blocker)
+    for th in threads:
+        th.join(2)
+    return order
+
+
+def test_bounded_concurrency():
+    s = Scheduler(max_concurrency=2)
+    active, peak, lock = [0], [0], threading.Lock()
+    def work():
+        with s.slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join(2)
+    assert peak[0] == 2
+    assert s.stats()["granted"] == 8 and s.stats()["active"] == 0
+
+
+def test_priority_classes_first():
+    s = Scheduler(max_concurrency=1)
+    blocker = s.acquire()
+    order = _queue_behind(s, blocker, [(BACKGROUND, "a", "bg"), (NORMAL, "a", "normal"),
+                                       (INTERACTIVE, "b", "interactive")])
+    assert order == ["interactive", "normal", "bg"]
+
+
+def test_round_robin_across_learners():
+    s = Scheduler(max_concurrency=1)
+    blocker = s.acquire()
+    order = _queue_behind(s, blocker, [(NORMAL, "a", "a1"), (NORMAL, "a", "a2"), (NORMAL, "a", "a3"),
+                                       (NORMAL, "b", "b1"), (NORMAL, "b", "b2")])
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_deadline_expires_while_queued():
+    s = Scheduler(max_concurrency=1, poll=0.01)
+    blocker = s.acquire()
+    with pytest.raises(DeadlineExceeded):
+        s.acquire(deadline=time.monotonic() + 0.05)
+    assert s.stats()["expired"] == 1
+    s.release(blocker)
+    assert s.stats()["queued"]["normal"] == 0
+
+
+def test_cancel_while_queued():
+    s = Scheduler(max_concurrency=1, poll=0.01)
+    blocker = s.acquire()
+    cancel = threading.Event()
+    threading.Timer(0.05, cancel.set).start()
+    with pytest.raises(Cancelled):
+        s.acquire(cancel=cancel)
+    assert s.stats()["cancelled"] == 1
+    s.release(blocker)
+
+
+def test_ticket_check_after_grant():
+    t = Scheduler().acquire(deadline=time.monotonic() - 1)
+    with pytest.raises(DeadlineExceeded):
+        t.check()
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(Cancelled):
+        Scheduler().acquire().check(cancel)
+
+
+def test_async_and_threads_share_slots():
+    s = Scheduler(max_concurrency=1)
+    async def main():
+        blocker = s.acquire()
+        order = []
+        async def task(priority, name):
+            async with s.slot_async(priority, name):
+                order.append(name)
+        tasks = [asyncio.create_task(task(BACKGROUND, "bg")), asyncio.create_task(task(INTERACTIVE, "fg"))]
+        await asyncio.sleep(0.02)
+        assert s.stats()["queued"] == {"interactive": 1, "normal": 0, "background": 1}
+        s.release(blocker)
+        await asyncio.gather(*tasks)
+        return order
+    assert asyncio.run(main()) == ["fg", "bg"]
+    assert s.stats()["active"] == 0
+
+
+def test_async_deadline_and_cancel_leave_queue():
+    s = Scheduler(max_concurrency=1)
+    async def main():
+        blocker = s.acquire()
+        with pytest.raises(DeadlineExceeded):
+            await s.acquire_async(deadline=time.monotonic() + 0.05)
+        waiter = asyncio.create_task(s.acquire_async())
+        await asyncio.sleep(0.02)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        s.release(blocker)
+    asyncio.run(main())
+    st = s.stats()
+    assert (st["expired"], st["cancelled"], st["active"]) == (1, 1, 0)
+    assert sum(st["queued"].values()) == 0
@@ -0,0 +1,58 @@
+import pytest
+
+from engine import skillmap
+from engine.cache import LRU
+from engine.storage import DB
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Fresh graph cache; records the (learner, subject) of every real build."""
+    monkeypatch.setattr(skillmap, "_graphs", LRU(max_entries=256))
+    calls = []
+    build = skillmap.build_skill_graph_dot
+    def counting(db, learner_id, subject):
+        calls.append((learner_id, subject))
+        return build(db, learner_id, subject)
+    monkeypatch.setattr(skillmap, "build_skill_graph_dot", counting)
+    return calls
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_graph_rebuilt_only_after_changes(tmp_path, builds, write_behind):
+    db = DB(str(tmp_path / "buddy.db"), write_behind=write_behind)
+    ada, bob = db.ensure_learner("Ada", "English"), db.ensure_learner("Bob", "English")
+    db.insert_skills([("Math", "Arithmetic", "Addition")])
+    dot = skillmap.skill_graph_dot(db, ada, "Math")
+    skillmap.skill_graph_dot(db, bob, "Math")
+    assert skillmap.skill_graph_dot(db, ada, "Math") == dot
+    assert len(builds) == 2
+
+    db.insert_skills([("Math", "Arithmetic", "Subtraction")])
+    assert "Subtraction" in skillmap.skill_graph_dot(db, ada, "Math")
+    assert "Subtraction" in skillmap.skill_graph_dot(db, bob, "Math")
+    assert len(builds) == 4
+
+    # an answer changes the answering learner's map only
+    add = db.list_skills("Math")[0]["id"]
+    db.record_answer(ada, add, True)
+    assert skillmap.skill_color("Learning") in skillmap.skill_graph_dot(db, ada, "Math")
+    skillmap.skill_graph_dot(db, bob, "Math")
+    assert builds[4:] == [(ada, "Math")]
+
+    db.delete_skills(add)
+    assert "Addition" not in skillmap.skill_graph_dot(db, ada, "Math")
+    assert "Addition" not in skillmap.skill_graph_dot(db, bob, "Math")
+    assert len(builds) == 7
+    db.close()
+
+
+def test_cache_is_per_database(tmp_path, builds):
+    one, two = DB(str(tmp_path / "one.db")), DB(str(tmp_path / "two.db"))
+    for db in (one, two):
+        db.insert_skills([("Math", "Arithmetic", "Addition")])
+    learner = one.ensure_learner("Ada", "English")
+    assert two.ensure_learner("Ada", "English") == learner
+    skillmap.skill_graph_dot(one, learner, "Math")
+    skillmap.skill_graph_dot(two, learner, "Math")
+    assert len(builds) == 2
@@ -0,0 +1,224 @@
+import random, sqlite3, threading, time
+
+import pytest
+
+from engine import storage
+from engine.storage import DB
+
+
+@pytest.fixture
+def wdb(tmp_path):
+    db = DB(str(tmp_path / "buddy.db"), write_behind=True, flush_interval=0.2)
+    yield db
+    db.close()
+
+
+def test_read_sees_write_queued_on_another_thread(wdb):
+    # a Streamlit rerun can run on a different thread than the one that queued the write
+    learner = wdb.ensure_learner("Ada", "English")
+    wdb.insert_skill("Math", "Arithmetic", "Addition")
+    skill_id = wdb.list_skills("Math")[0]["id"]
+    th = threading.Thread(target=wdb.record_answer, args=(learner, skill_id, True))
+    th.start()
+    th.join()
+    assert wdb._writer.committed < wdb._writer.submitted   # still queued
+    assert wdb.learner_stats(learner)["answered"] == 1
+
+
+def test_queued_writes_commit_in_order(wdb):
+    learner = wdb.ensure_learner("Ada", "English")
+    for i in range(20):
+        wdb.log_event(learner, i, "note", "{}")
+    wdb.flush()
+    assert wdb._writer.committed == wdb._writer.submitted
+    assert [e["skill_id"] for e in wdb.iter_events(learner)] == list(range(20))
+    assert sum(1 for e in wdb.iter_events(learner, kind="note")) == 20
+
+
+def test_failed_write_does_not_sink_the_batch(wdb):
+    learner = wdb.ensure_learner("Ada", "English")
+    def bad(conn):
+        conn.execute("INSERT INTO no_such_table VALUES(1)")
+    ok = wdb._write(lambda conn: conn.execute(
+        "INSERT INTO events(learner_id, skill_id, kind, data, created_at) VALUES(?,0,'a','{}',0)", (learner,)))
+    broken = wdb._write(bad)
+    wdb.flush()
+    assert ok.exception() is None
+    assert broken.exception() is not None
+    assert sum(1 for _ in wdb.iter_events(learner, kind="a")) == 1
+
+
+def test_after_runs_once_committed(wdb):
+    learner = wdb.ensure_learner("Ada", "English")
+    before = wdb.map_version(learner)
+    wdb.bump_progress(learner, 1, True)
+    assert wdb.map_version(learner) != before
+
+
+def test_close_drains_queue(tmp_path):
+    path = str(tmp_path / "buddy.db")
+    db = DB(path, write_behind=True, flush_interval=1.0)
+    learner = db.ensure_learner("Ada", "English")
+    for _ in range(5):
+        db.log_event(learner, 0, "note")
+    db.close()
+    assert sum(1 for _ in DB(path).iter_events(learner)) == 5
+
+
+def test_direct_mode_commits_immediately(tmp_path):
+    db = DB(str(tmp_path / "buddy.db"))
+    learner = db.ensure_learner("Ada", "English")
+    assert db.ensure_learner("Ada", "English") == learner
+    db.record_answer(learner, 1, False)
+    assert db.learner_stats(learner)["answered"] == 1
+
+
+class _DyingConn:
+    """Stands in for the writer's connection and fails the way a full disk does."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if sql == "BEGIN":
+            raise sqlite3.OperationalError("database or disk is full")
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_dead_writer_fails_fast_instead_of_hanging(wdb):
+    learner = wdb.ensure_learner("Ada", "English")
+    wdb._writer.conn = _DyingConn(wdb._writer.conn)
+    fut = wdb._write(lambda conn: conn.execute("DELETE FROM events"))
+    with pytest.raises(RuntimeError, match="writer stopped"):
+        fut.result(timeout=2)
+    wdb._writer._thread.join(2)
+    assert not wdb._writer._thread.is_alive()
+    with pytest.raises(RuntimeError, match="writer stopped"):
+        wdb.log_event(learner, 0, "note")
+    with pytest.raises(RuntimeError, match="writer stopped"):
+        wdb.learner_stats(learner)   # a read must not wait forever on the dead queue
+
+
+def test_read_wait_is_bounded(wdb, monkeypatch):
+    monkeypatch.setattr(storage, "SYNC_TIMEOUT", 0.1)
+    release = threading.Event()
+    wdb._write(lambda conn: release.wait(2))
+    try:
+        with pytest.raises(TimeoutError):
+            wdb.subjects()
+    finally:
+        release.set()
+
+
+def _stats_rows(db):
+    with db._reader() as conn:
+        return conn.execute("SELECT * FROM learner_stats ORDER BY learner_id").fetchall()
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_incremental_learner_stats_match_rebuild(tmp_path, write_behind):
+    db = DB(str(tmp_path / "buddy.db"), write_behind=write_behind)
+    rng = random.Random(7)
+    learners = [db.ensure_learner(name, "English") for name in ("Ada", "Bob", "Cy")]
+    for _ in range(300):
+        db.record_answer(rng.choice(learners), rng.randint(1, 4), rng.random() < 0.7)
+    db.log_event(learners[0], 1, "note")
+    incremental = _stats_rows(db)
+    assert sum(r[1] for r in incremental) == 300
+    assert db.rebuild_learner_stats() == 3
+    assert _stats_rows(db) == incremental
+    assert db.rebuild_learner_stats(learners[1]) == 1
+    assert _stats_rows(db) == incremental
+    db.close()
+
+
+def test_mastery_and_streak_transitions(tmp_path):
+    db = DB(str(tmp_path / "buddy.db"))
+    learner = db.ensure_learner("Ada", "English")
+    for correct in (True, True, False, True, True, True, True, True):
+        db.record_answer(learner, 1, correct)
+    st = db.learner_stats(learner)
+    # Practicing after three in a row; staying there doesn't count again
+    assert (st["answered"], st["correct"], st["mastered"]) == (8, 7, 1)
+    assert (st["streak"], st["best_streak"]) == (5, 5)
+    db.record_answer(learner, 1, False)
+    db.record_answer(learner, 2, True)
+    st = db.learner_stats(learner)
+    assert (st["mastered"], st["streak"], st["best_streak"]) == (1, 1, 5)
+    assert db.streak_correct(learner) == 1
+    db.rebuild_learner_stats(learner)
+    assert db.learner_stats(learner) == st
+
+
+def test_pool_get_times_out_when_exhausted(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / "p.db"), size=1, timeout=0.2)
+    conn = pool.get()
+    t0 = time.monotonic()
+    with pytest.raises(RuntimeError, match="No free SQLite connection"):
+        pool.get()
+    assert time.monotonic() - t0 >= 0.2
+    pool.put(conn)
+    assert pool.get() is conn
+    pool.put(conn)
+    pool.close()
+
+
+def test_pool_rolls_back_on_return(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / "p.db"), size=1)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t(x)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES(1)")
+        assert conn.in_transaction
+    with pool.connection() as again:
+        assert again is conn and not again.in_transaction
+        assert again.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close()
+
+
+def test_pool_exclusive_waits_for_checked_out_connections(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / "p.db"), size=2, timeout=2)
+    busy, idle = pool.get(), pool.get()
+    pool.put(idle)
+    entered, release, got = threading.Event(), threading.Event(), []
+    def maintain():
+        with pool.exclusive() as conn:
+            conn.execute("VACUUM")
+            entered.set()
+            release.wait(2)
+    def use():
+        with pool.connection() as conn:
+            got.append(conn)
+    th = threading.Thread(target=maintain)
+    th.start()
+    assert not entered.wait(0.2)   # still waiting for `busy` to come back
+    user = threading.Thread(target=use)
+    user.start()
+    time.sleep(0.1)
+    assert not got   # no new connections while exclusive() drains the pool
+    pool.put(busy)
+    assert entered.wait(2)
+    assert pool._created == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        busy.execute("SELECT 1")   # closed when it came back
+    assert not got
+    release.set()
+    th.join(2)
+    user.join(2)
+    assert got and got[0] not in (busy, idle)
+    pool.close()
+
+
+def test_pool_exclusive_gives_up_and_reopens(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / "p.db"), size=2, timeout=0.2)
+    busy = pool.get()
+    with pytest.raises(RuntimeError, match="still in use"):
+        with pool.exclusive():
+            pass
+    with pool.connection() as conn:
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+    pool.put(busy)
+    pool.close()
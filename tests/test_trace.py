@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from engine import trace
+
+
+@pytest.fixture
+def tracing(monkeypatch, tmp_path):
+    monkeypatch.setattr(trace, "TRACE_PATH", "")   # no flusher thread
+    trace.clear()
+    trace.enable(True)
+    yield tmp_path
+    trace.enable(False)
+    trace.clear()
+
+
+def _stages():
+    return [name for name, *_ in trace._ring]
+
+
+def test_off_records_nothing():
+    trace.clear()
+    assert not trace.ENABLED
+    with trace.span("x"):
+        pass
+    assert trace.traced("y")(lambda: 1)() == 1
+    assert _stages() == []
+
+
+def test_spans_and_turns(tracing):
+    turn = trace.begin_turn("rerun")
+    with trace.span("db.read"):
+        pass
+    trace.traced("llm.generate")(lambda: None)()
+    assert _stages() == ["turn.rerun", "db.read", "llm.generate"]
+    stats = {r["stage"]: r for r in trace.stage_stats()}
+    assert stats["db.read"]["count"] == 1
+    assert trace.slowest_turns(1)[0]["turn"] == turn
+
+
+def test_generator_span_covers_iteration(tracing):
+    @trace.traced("db.iter")
+    def rows():
+        with trace.span("db.page"):
+            yield 1
+        yield 2
+    it = rows()
+    assert _stages() == []          # nothing runs until iteration starts
+    assert list(it) == [1, 2]
+    assert _stages() == ["db.page", "db.iter"]
+    it = rows()
+    next(it)
+    it.close()                      # abandoned early: the span still ends
+    assert _stages()[-1] == "db.iter"
+
+
+def test_trace_methods_skips_private_and_keeps_generators(tracing):
+    @trace.trace_methods("obj")
+    class Obj:
+        def run(self):
+            return 1
+        def items(self):
+            yield from range(3)
+        def _hidden(self):
+            return 2
+    o = Obj()
+    assert (o.run(), list(o.items()), o._hidden()) == (1, [0, 1, 2], 2)
+    assert _stages() == ["obj.run", "obj.items"]
+
+
+def test_flush_appends_and_rotates(tracing, monkeypatch):
+    path = str(tracing / "trace.jsonl")
+    monkeypatch.setattr(trace, "TRACE_MAX_BYTES", 100)   # one line is ~80 bytes
+    for i in range(3):
+        with trace.span("stage", i=i):
+            pass
+        assert trace.flush(path) == 1
+    with open(path + ".1", encoding="utf-8") as f:
+        rotated = [json.loads(ln) for ln in f]
+    with open(path, encoding="utf-8") as f:
+        current = [json.loads(ln) for ln in f]
+    assert [r["attrs"]["i"] for r in rotated] == [0, 1]
+    assert [r["attrs"]["i"] for r in current] == [2]